@@ -4,7 +4,10 @@
 import pandas as pd
 import numpy as np
 import os
-import re
+import sys
+import io
+import hashlib
+import json
 #plots:
 import matplotlib as mpl
 import matplotlib.pyplot as plt
@@ -32,8 +35,24 @@ from netCDF4 import Dataset
 from datetime import datetime
 #IO
 import openpyxl
+import h5py
 #speedup
-from numba import jit
+from numba import jit, njit, prange
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED, ALL_COMPLETED
+import threading
+from collections import deque
+from time import perf_counter, process_time
+from functools import wraps
+from contextlib import contextmanager
+#instrumentation, psutil (I/O counters and RSS sampling) and resource (peak RSS, not on Windows) are optional
+try:
+    import psutil
+except ImportError:
+    psutil = None
+try:
+    import resource
+except ImportError:
+    resource = None
 #animations
 from celluloid import Camera # getting the camera
 from IPython.display import HTML # to show the animation in Jupyter
@@ -48,30 +67,1040 @@ import statsmodels.api as sm
 # get parent working dir
 parent_directory = os.path.abspath(os.path.join(os.path.dirname(os.path.realpath(__file__)), os.pardir))
 
+# number of time steps per MERRA2 netCDF4 file for the processed frequencies
+merra_steps_per_file = {'hourly': 24, 'three_hourly': 8, 'monthly': 1}
+
+# months of the wet (jun-sep) and dry (nov-apr) season
+junsep_months = [6, 7, 8, 9]
+novapr_months = [11, 12, 1, 2, 3, 4]
+
+# int8 codes of the seasons in a MerraTimeIndex, time steps outside both seasons (or without a file) are coded 0
+merra_season_codes = {'junsep': 1, 'novapr': 2}
+
+# season definitions as 'months' (list of months) or 'days' (first and last day of the year, a range can wrap the year end),
+# any other definition can be passed as dict of the same form
+merra_seasons = {'junsep': {'months': junsep_months},
+                 'novapr': {'months': novapr_months},
+                 'djf': {'months': [12, 1, 2]},
+                 'mam': {'months': [3, 4, 5]},
+                 'jja': {'months': [6, 7, 8]},
+                 'son': {'months': [9, 10, 11]},
+                 'harmattan_peak': {'days': [350, 45]}}
+
+# the netCDF4/HDF5 C libraries are not thread-safe, so threads of a process take turns in decoding files and writing HDF5 stores
+hdf5_lock = threading.Lock()
+
+# reductions of the time steps of a MERRA2 netCDF4 file to a single time step
+merra_aggregates = {'mean': np.mean, 'min': np.min, 'max': np.max}
+
+# target size in bytes of a chunk of the compressed HDF5 stores of processed arrays
+chunk_bytes = 1 << 20
+
+# columns of the manifest of ingested MERRA2 files that is stored next to the processed arrays
+merra_manifest_columns = ['filename', 'size', 'mtime', 'checksum', 'time_offset']
+
+# regions of return_region_pixel_array() whose pixels are the dust sources of the advection diffusion simulation
+source_region_names = ['upper_left', 'upper_right', 'upper_right_corner', 'bodele']
+
+# columns of the run log of the instrumented stages, CPU time and bytes are counted for the whole process (all threads) and its worker processes,
+# peak_rss is the largest resident set size of the process and its worker processes together while the stage ran. stall_time is the time a read-ahead pipeline
+# waited for decoded files, see record_stage_value()
+stage_log_columns = ['stage', 'depth', 'start', 'wall_time', 'cpu_time', 'read_bytes', 'write_bytes', 'start_rss', 'peak_rss', 'end_rss', 'stall_time']
+
+# seconds between two samples of the resident set size of a running stage
+stage_sample_interval = 0.05
+
 
 ######################################################################
 # Functions
 ######################################################################
 
 
+"--------------------------------------------------------------------"
+'Instrumentation Functions'
+"--------------------------------------------------------------------"
+
+# records of the finished stages of this run and the run log file they are written to, see start_stage_log()
+stage_records = []
+stage_log = {'file': '', 'stack': [], 'records': []}
+
+
+def process_io_bytes():
+    # bytes read from and written to storage by this process so far, None without psutil (or on systems without I/O counters)
+    if psutil is None:
+        return None, None
+    try:
+        io_counters = psutil.Process().io_counters()
+    except (AttributeError, psutil.Error):
+        return None, None
+    return io_counters.read_bytes, io_counters.write_bytes
+
+
+def process_rss(children = None):
+    # current resident set size of this process and its child processes (e.g. the workers of a process pool) in bytes, None without psutil.
+    # the CPU time and I/O counters of every running child are kept in the dict children, if given
+    if psutil is None:
+        return None
+    process = psutil.Process()
+    rss = process.memory_info().rss
+    for child in process.children(recursive=True):
+        try:
+            rss += child.memory_info().rss
+            if children is not None:
+                cpu_times = child.cpu_times()
+                io_counters = child.io_counters()
+                children[child.pid] = (cpu_times.user + cpu_times.system, io_counters.read_bytes, io_counters.write_bytes)
+        except (AttributeError, psutil.Error):
+            continue
+    return rss
+
+
+def child_usage(children = None):
+    # CPU time and bytes read and written of the child processes: exact for the children that have finished (process pools are joined
+    # when they are shut down) from resource, on Windows the last values of the children sampled by process_rss(). None if neither is available
+    if resource is not None:
+        usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+        return usage.ru_utime + usage.ru_stime, usage.ru_inblock*512, usage.ru_oublock*512
+    if children is None:
+        return None, None, None
+    return tuple(sum(values) for values in zip((0, 0, 0), *children.values()))
+
+
+def process_peak_rss():
+    # largest resident set size of this process since its start in bytes (ru_maxrss is in kilobytes on Linux and in bytes on macOS),
+    # None if neither resource nor the peak working set of psutil on Windows are available
+    if resource is not None:
+        peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak_rss if sys.platform == 'darwin' else peak_rss*1024
+    if psutil is not None:
+        return getattr(psutil.Process().memory_info(), 'peak_wset', None)
+    return None
+
+
+def sample_peak_rss(peak, stop_event, interval, children = None):
+    # polls the resident set size of the process and its children until stop_event is set and keeps the largest value in peak[0]
+    while not stop_event.wait(interval):
+        peak[0] = max(peak[0], process_rss(children))
+
+
+def counter_difference(end, start):
+    # difference of two counters that might be unavailable (None)
+    if end is None or start is None:
+        return None
+    return end - start
+
+
+def counter_total(*values):
+    # sum of the counters that are available, None if none is
+    values = [value for value in values if value is not None]
+    if not values:
+        return None
+    return sum(values)
+
+
+def start_stage_log(log_file, clear = True):
+    """
+    start_stage_log() sets the run log of the instrumented stages. After every finished stage the records of the run are
+    rewritten to the log, so the log of a crashed or interrupted run still holds all stages finished before.
+
+    Parameters:
+        log_file(string):           a string of a .csv or .json file path relative to the parent directory. '' only keeps the records in stage_records.
+        clear(bool):                a bool whether the records of stages finished before are dropped. This is set to True by default.
+    """
+    if clear:
+        del stage_records[:]
+    stage_log['file'] = log_file
+    if log_file:
+        os.makedirs(os.path.dirname(parent_directory + log_file), exist_ok=True)
+
+
+def write_stage_log(log_file = '', records = None):
+    # writes the records of the instrumented stages to a .csv (one row per stage) or .json (list of records) file relative to the parent directory
+    log_file = log_file or stage_log['file']
+    records = stage_records if records is None else records
+    if log_file.endswith('.json'):
+        with open(parent_directory + log_file, 'w') as json_file:
+            json.dump(records, json_file, indent=1)
+    else:
+        pd.DataFrame(records, columns=stage_log_columns).to_csv(parent_directory + log_file, index=False)
+
+
+@contextmanager
+def instrumented_stage(name, interval = stage_sample_interval):
+    """
+    instrumented_stage() measures the wall time, CPU time, bytes read and written and peak resident set size of the code in its
+    with block and appends them to stage_records (and the run log of start_stage_log()). Stages can be nested, the name of a nested
+    stage is prefixed by the names of the stages around it, e.g. 'processing_data/process_merra_data'.
+    The CPU time, I/O and memory include all threads of the process and the worker processes it starts (e.g. of a process pool),
+    the I/O and memory values need psutil and are None without it.
+
+    Parameters:
+        name(string):               a string for the name of the stage.
+        interval(float):            a float for the seconds between two samples of the resident set size. This is set to stage_sample_interval by default.
+
+    Returns:
+        record(dict):               a dict of the stage_log_columns, which is filled when the with block is left.
+    """
+    stage_log['stack'].append(name)
+    record = {'stage': '/'.join(stage_log['stack']), 'depth': len(stage_log['stack']) - 1,
+              'start': datetime.now().isoformat(timespec='seconds')}
+    stage_log['records'].append(record)
+
+    # counters of the children running before the stage are sampled as well, so that only their usage during the stage is counted
+    children = {}
+    read_bytes, write_bytes = process_io_bytes()
+    start_rss = process_rss(children)
+    start_peak_rss = process_peak_rss()
+    child_cpu_time, child_read_bytes, child_write_bytes = child_usage(children)
+    peak = [start_rss or 0]
+    stop_event = threading.Event()
+    if start_rss is not None:
+        sampler = threading.Thread(target=sample_peak_rss, args=(peak, stop_event, interval, children), daemon=True)
+        sampler.start()
+    wall_start = perf_counter()
+    cpu_start = process_time()
+    try:
+        yield record
+    finally:
+        wall_time = perf_counter() - wall_start
+        cpu_time = process_time() - cpu_start
+        stop_event.set()
+        if start_rss is not None:
+            sampler.join()
+        end_read_bytes, end_write_bytes = process_io_bytes()
+        end_rss = process_rss(children)
+        end_peak_rss = process_peak_rss()
+        end_child_cpu_time, end_child_read_bytes, end_child_write_bytes = child_usage(children)
+
+        # the process peak is exact, but it only belongs to this stage if it grew while the stage ran, otherwise the samples
+        # (which include the worker processes) are used
+        peak_rss = max(peak[0], end_rss or 0) if start_rss is not None else None
+        if end_peak_rss is not None and start_peak_rss is not None and end_peak_rss > start_peak_rss:
+            peak_rss = max(peak_rss or 0, end_peak_rss)
+
+        record.update({'wall_time': wall_time, 'cpu_time': counter_total(cpu_time, counter_difference(end_child_cpu_time, child_cpu_time)),
+                       'read_bytes': counter_total(counter_difference(end_read_bytes, read_bytes), counter_difference(end_child_read_bytes, child_read_bytes)),
+                       'write_bytes': counter_total(counter_difference(end_write_bytes, write_bytes), counter_difference(end_child_write_bytes, child_write_bytes)),
+                       'start_rss': start_rss, 'peak_rss': peak_rss, 'end_rss': end_rss})
+        stage_records.append(record)
+        stage_log['stack'].pop()
+        stage_log['records'].pop()
+        if stage_log['file']:
+            write_stage_log()
+
+
+def record_stage_value(key, value):
+    # adds a value measured inside a function (e.g. the stall time of a read-ahead pipeline) to the record of the innermost running stage,
+    # values of the same key are summed. Returns the record, or None if no stage is running
+    if not stage_log['records']:
+        return None
+    record = stage_log['records'][-1]
+    record[key] = (record.get(key) or 0) + value
+    return record
+
+
+def instrumented(name = ''):
+    # decorator that runs every call of a function as instrumented_stage() named after the function (or the given name),
+    # a string as first argument (the data directory or file of most entry points) is added to the name, e.g. 'save_chunked_array(\\processed_data\\x.h5)'
+    def decorator(function):
+        @wraps(function)
+        def instrumented_function(*args, **kwargs):
+            stage_name = name or function.__name__
+            if args and isinstance(args[0], str):
+                stage_name += '(' + args[0] + ')'
+            with instrumented_stage(stage_name):
+                return function(*args, **kwargs)
+        return instrumented_function
+    return decorator
+
+
 "--------------------------------------------------------------------"
 'Data Processing Functions'
 "--------------------------------------------------------------------"
 
 
 
-def process_merra_data(data_directory, seasonal_indices = True, variables = [], two_vars = True, timing='', time_steps = 0, y_steps = 91, x_steps = 0, datatype = 'float32'):
+def merra_file_date(filename, timing):
+    # MERRA2 file names carry the date at a fixed position, e.g. MERRA2_100.tavg1_2d_slv_Nx.19800101.nc4
+    # since aod files have another naming convention, we control for that
+    if timing == 'monthly':
+        return datetime.strptime(filename[27:33], '%Y%m')
+    else:
+        return datetime.strptime(filename[27:35], '%Y%m%d')
+
+
+def merra_time_offset(file_date, start_date, timing):
+    # index of the first time step of a file on the 0 axis of the processed numpy array
+    if timing == 'monthly':
+        return (file_date.year - start_date.year)*12 + (file_date.month - start_date.month)
+    else:
+        return (file_date - start_date).days * merra_steps_per_file[timing]
+
+
+def merra_bounding_box_slices(longitudes, latitudes, bounding_box):
+    # index slices of the latitudes and longitudes inside a [lat_min, lat_max, lon_min, lon_max] bounding box
+    lat_indices = np.where((latitudes >= bounding_box[0]) & (latitudes <= bounding_box[1]))[0]
+    lon_indices = np.where((longitudes >= bounding_box[2]) & (longitudes <= bounding_box[3]))[0]
+    if (lat_indices.size == 0) or (lon_indices.size == 0):
+        raise ValueError(f'bounding box {bounding_box} does not contain any grid point')
+    return slice(lat_indices[0], lat_indices[-1]+1), slice(lon_indices[0], lon_indices[-1]+1)
+
+
+def read_merra_file(file_path, variables, lat_slice = slice(None), lon_slice = slice(None), aggregate = '', prefetch = False):
+    # decode the given variables of a single MERRA2 netCDF4 file, only reading the hyperslab inside the slices.
+    # with an aggregate ('mean', 'min' or 'max') the time steps of the file are reduced to a single one.
+    # with prefetch the file is read into memory first, so slow I/O of several files overlaps outside of the lock
+    memory = None
+    if prefetch:
+        with open(file_path, 'rb') as merra_file:
+            memory = merra_file.read()
+    with hdf5_lock:
+        data = Dataset(file_path, mode='r', memory=memory)
+        try:
+            values = [data.variables[var][:,lat_slice,lon_slice] for var in variables]
+        finally:
+            data.close()
+    if aggregate:
+        values = [merra_aggregates[aggregate](np.ma.getdata(value), axis=0, keepdims=True) for value in values]
+    return values
+
+
+def store_merra_values(data_arrays, offsets, steps, values):
+    # write the decoded variables of a file to their time slices, the values of variable i go to every array j with j % len(values) == i.
+    # an offset of None skips an array
+    for idx, (data_array, offset) in enumerate(zip(data_arrays, offsets)):
+        if offset is None:
+            continue
+        if isinstance(data_array, h5py.Dataset):
+            with hdf5_lock:
+                data_array[offset:offset+steps,:,:] = values[idx % len(values)]
+        else:
+            data_array[offset:offset+steps,:,:] = values[idx % len(values)]
+
+
+def write_merra_file(file_path, variables, data_arrays, offsets, steps, lat_slice = slice(None), lon_slice = slice(None), aggregate = ''):
+    # decode a single MERRA2 netCDF4 file and write it straight into its time slices
+    store_merra_values(data_arrays, offsets, steps, read_merra_file(file_path, variables, lat_slice, lon_slice, aggregate))
+
+
+def write_merra_file_to_disk(file_path, variables, output_files, offsets, steps, lat_slice = slice(None), lon_slice = slice(None), aggregate = ''):
+    # same as write_merra_file, but for workers in another process that open the disk-backed .npy output files themselves
+    # only the output files the file is written to are opened
+    data_arrays = [np.load(parent_directory + output_file, mmap_mode='r+') if offset is not None else None
+                   for output_file, offset in zip(output_files, offsets)]
+    write_merra_file(file_path, variables, data_arrays, offsets, steps, lat_slice, lon_slice, aggregate)
+    for data_array in data_arrays:
+        if data_array is not None:
+            data_array.flush()
+
+
+def time_step_indices(selection, time_steps):
+    # sorted int64 indices of a boolean mask or an index list/array of the 0 axis of an array with time_steps time steps
+    selection = np.asarray(selection)
+    if selection.dtype == bool:
+        if selection.shape[0] != time_steps:
+            raise ValueError(f'mask of {selection.shape[0]} time steps for an array of {time_steps} time steps')
+        return np.flatnonzero(selection)
+    indices = selection.astype('int64')
+    if indices.shape[0] > 1 and np.any(indices[1:] <= indices[:-1]):
+        indices = np.unique(indices)
+    return indices
+
+
+def time_step_runs(indices):
+    # start and stop of the runs of consecutive indices, e.g. every wet season of a year is a single run
+    if indices.shape[0] == 0:
+        return np.zeros(0, dtype='int64'), np.zeros(0, dtype='int64')
+    breaks = np.flatnonzero(np.diff(indices) != 1) + 1
+    return indices[np.concatenate([[0], breaks])], indices[np.concatenate([breaks - 1, [indices.shape[0] - 1]])] + 1
+
+
+def read_time_block(data, first, last):
+    # time steps first to last-1 of a numpy array, numpy memmap or HDF5 dataset as numpy array
+    if isinstance(data, h5py.Dataset):
+        with hdf5_lock:
+            return data[first:last]
+    return np.asarray(data[first:last])
+
+
+def take_time_step_block(target_array, data_array, indices, first, last):
+    # copies the time steps indices[first:last] of data_array to target_array[first:last]
+    if isinstance(data_array, h5py.Dataset):
+        # HDF5 stores are read run by run, fancy indexing of a dataset is slow
+        starts, stops = time_step_runs(indices[first:last])
+        with hdf5_lock:
+            values = np.concatenate([data_array[start:stop] for start, stop in zip(starts, stops)])
+    else:
+        values = np.take(data_array, indices[first:last], axis=0)
+    if isinstance(target_array, h5py.Dataset):
+        with hdf5_lock:
+            target_array[first:last] = values
+    else:
+        target_array[first:last] = values
+
+
+def take_time_steps(target_array, data_array, indices, block = 8760, workers = 1):
+    # copies the time steps of data_array at the sorted indices to target_array in order, in blocks of time steps
+    # that can be gathered by parallel threads (numpy releases the GIL while copying)
+    blocks = range(0, indices.shape[0], block)
+    if workers > 1:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(take_time_step_block, target_array, data_array, indices, first, first+block) for first in blocks]
+            for future in futures:
+                future.result()
+    else:
+        for first in blocks:
+            take_time_step_block(target_array, data_array, indices, first, first+block)
+
+
+def copy_masked_time_steps(target_array, data_array, mask, block = 8760):
+    # copies the time steps of data_array where mask is True to target_array in order, in blocks of time steps
+    take_time_steps(target_array, data_array, np.flatnonzero(mask), block)
+
+
+def chunked_array_chunks(shape, chunk_layout = 'time', datatype = 'float32'):
+    # chunk shape of about chunk_bytes for a (time, y, x) array:
+    # 'time' chunks hold a few complete maps (fast map plots), 'pixel' chunks hold long time series of small tiles (fast per pixel regressions)
+    itemsize = np.dtype(datatype).itemsize
+    if chunk_layout == 'time':
+        return (int(max(1, min(shape[0], chunk_bytes // (itemsize*shape[1]*shape[2])))), shape[1], shape[2])
+    elif chunk_layout == 'pixel':
+        tile = (min(shape[1], 4), min(shape[2], 4))
+        return (int(max(1, min(shape[0], chunk_bytes // (itemsize*tile[0]*tile[1])))),) + tile
+    else:
+        raise ValueError(f'unknown chunk layout {chunk_layout}, use \'time\' or \'pixel\'')
+
+
+def create_chunked_array(output_file, shape, datatype = 'float32', chunk_layout = 'time', compression_level = 4):
+    # creates a compressed, chunked HDF5 store (relative to the parent directory) whose 0 axis can grow and returns its dataset.
+    # byte shuffling before gzip compresses the mostly-zero dust fields to a fraction of the .npy size
+    h5_file = h5py.File(parent_directory + output_file, 'w')
+    data_array = h5_file.create_dataset('data', shape=shape, maxshape=(None,) + tuple(shape[1:]), dtype=datatype,
+                                        chunks=chunked_array_chunks(shape, chunk_layout, datatype),
+                                        compression='gzip', compression_opts=compression_level, shuffle=True, fillvalue=0)
+    data_array.attrs['chunk_layout'] = chunk_layout
+    return data_array
+
+
+@instrumented()
+def save_chunked_array(output_file, data, chunk_layout = 'time', compression_level = 4):
+    """
+    save_chunked_array() saves a (time, y, x) array to a compressed, chunked HDF5 store.
+    The array is copied in blocks of entire chunks (complete maps for 'time', bands of tiles for 'pixel'),
+    so every chunk is compressed once and numpy memmaps are never loaded at once.
+
+    Parameters:
+        output_file(string):        a string of the .h5 file path relative to the parent directory.
+        data(ndarray):              a numpy array (or numpy memmap) of the values to be saved.
+        chunk_layout(string):       a string for the chunk layout, either 'time' (chunks of complete maps) or 'pixel' (chunks of long time series
+                                    of small tiles). This is set to 'time' by default.
+        compression_level(int):     an int for the gzip compression level between 0 and 9. This is set to 4 by default.
+    """
+    data_array = create_chunked_array(output_file, data.shape, data.dtype, chunk_layout, compression_level)
+    chunks = data_array.chunks
+    block = chunks[0] * max(1, 8760 // chunks[0])
+    for first in range(0, data.shape[0], block):
+        for y in range(0, data.shape[1], chunks[1]):
+            data_array[first:first+block, y:y+chunks[1]] = data[first:first+block, y:y+chunks[1]]
+    data_array.file.close()
+
+
+def chunked_array_cache(data_array):
+    # chunk cache size in bytes of a (time, y, x) HDF5 dataset that holds a row of chunks along the x axis, so reading the pixels row by row
+    # (e.g. the time series of every pixel of a pixel-chunked store) decompresses every chunk once
+    if data_array.chunks is None or data_array.ndim != 3:
+        return chunk_bytes
+    row_chunks = -(-data_array.shape[2] // data_array.chunks[2])
+    return (row_chunks + 1) * int(np.prod(data_array.chunks)) * data_array.dtype.itemsize
+
+
+def load_chunked_array(input_file, mode = 'r'):
+    # returns the dataset of a chunked HDF5 store (relative to the parent directory). The caller owns the open file and closes it
+    # with data_array.file.close() once done. The dataset is read lazily, slicing it only decompresses the chunks that are touched,
+    # e.g. data[:] reads the entire array. The chunk cache holds a row of chunks (see chunked_array_cache())
+    h5_file = h5py.File(parent_directory + input_file, mode)
+    access = h5py.h5p.create(h5py.h5p.DATASET_ACCESS)
+    access.set_chunk_cache(10007, chunked_array_cache(h5_file['data']), 0.75)
+    return h5py.Dataset(h5py.h5d.open(h5_file.id, b'data', access))
+
+
+def read_chunked_array(input_file):
+    # reads an entire chunked HDF5 store (relative to the parent directory) into a numpy array and closes it
+    with h5py.File(parent_directory + input_file, 'r') as h5_file:
+        return h5_file['data'][:]
+
+
+def read_chunked_selection(data_array, key):
+    # numpy style selection data_array[key] of a (time, y, x) HDF5 dataset, e.g. data_array[:, region[:,0], region[:,1]].
+    # HDF5 datasets only support simple selections, so the time key and the bounding rectangle of every pixel index array are read
+    # and the pixels are selected in memory, only the chunks of the bounding rectangle are decompressed
+    if not isinstance(key, tuple):
+        key = (key,)
+    bounds = []
+    pixel_key = []
+    for axis, axis_key in enumerate(key[1:], 1):
+        if isinstance(axis_key, slice):
+            bounds.append(axis_key)
+            pixel_key.append(slice(None))
+        elif isinstance(axis_key, (int, np.integer)):
+            index = int(axis_key) % data_array.shape[axis]
+            bounds.append(slice(index, index+1))
+            pixel_key.append(0)
+        else:
+            indices = np.asarray(axis_key)
+            if indices.dtype == bool:
+                indices = np.flatnonzero(indices)
+            indices = indices.astype('int64') % data_array.shape[axis]
+            first = int(indices.min()) if indices.size else 0
+            last = int(indices.max()) + 1 if indices.size else 0
+            bounds.append(slice(first, last))
+            pixel_key.append(indices - first)
+    with hdf5_lock:
+        values = data_array[(key[0],) + tuple(bounds)]
+    return values[(slice(None),)*(values.ndim - len(bounds)) + tuple(pixel_key)]
+
+
+def staged_output(output_file, chunk_layout = 'time'):
+    # pixel chunks hold long time series of a tile, so writing the time steps in order would recompress every chunk for every block.
+    # the time steps of a pixel-chunked HDF5 store are written to a .npy staging file instead and copied into the store once complete
+    return output_file.endswith('.h5') and chunk_layout == 'pixel'
+
+
+def chunked_array_staging_file(output_file):
+    # the .npy staging file of a pixel-chunked HDF5 store, e.g. \\processed_data\\dust_daily_data_staging.npy
+    return os.path.splitext(output_file)[0] + '_staging.npy'
+
+
+def finish_staged_array(output_file):
+    # copies the staging file of a pixel-chunked HDF5 store into the store, removes it and returns the store opened for reading
+    # (see load_chunked_array()). The caller has to drop its memmap of the staging file first, an open memmap cannot be removed on Windows
+    staging_file = chunked_array_staging_file(output_file)
+    staging_array = np.load(parent_directory + staging_file, mmap_mode='r')
+    save_chunked_array(output_file, staging_array, chunk_layout = 'pixel')
+    del staging_array
+    os.remove(parent_directory + staging_file)
+    return load_chunked_array(output_file)
+
+
+def create_output_array(shape, datatype = 'float32', output_file = '', chunk_layout = 'time'):
+    # returns a numpy array of zeros, or a disk-backed .npy file (relative to the parent directory) opened as numpy memmap
+    # so that only the pages currently written have to be held in memory. A .h5 file is created as chunked HDF5 store,
+    # for the 'pixel' chunk layout the staging file of the store is returned (see staged_output())
+    if staged_output(output_file, chunk_layout):
+        return np.lib.format.open_memmap(parent_directory + chunked_array_staging_file(output_file), mode='w+', dtype=datatype, shape=shape)
+    elif output_file.endswith('.h5'):
+        return create_chunked_array(output_file, shape, datatype)
+    elif output_file:
+        return np.lib.format.open_memmap(parent_directory + output_file, mode='w+', dtype=datatype, shape=shape)
+    else:
+        return np.zeros(shape, dtype=datatype)
+
+
+def flush_output_array(data_array):
+    # writes the pending values of a numpy memmap or a HDF5 dataset to disk
+    if isinstance(data_array, h5py.Dataset):
+        with hdf5_lock:
+            data_array.file.flush()
+    else:
+        data_array.flush()
+
+
+def grow_npy_file(file_path, time_steps):
+    # grows the 0 axis of a .npy file to time_steps by appending zeros, the existing values are not rewritten.
+    # only the header is patched, if the new header does not fit the space of the old one the file is copied instead
+    with open(file_path, 'rb') as npy_file:
+        version = np.lib.format.read_magic(npy_file)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(npy_file)
+        else:
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(npy_file)
+        header_length = npy_file.tell()
+    if shape[0] >= time_steps:
+        return
+    new_shape = (time_steps,) + tuple(shape[1:])
+    header = io.BytesIO()
+    np.lib.format.write_array_header_1_0(header, {'descr': np.lib.format.dtype_to_descr(dtype), 'fortran_order': fortran_order, 'shape': new_shape})
+    if (version == (1, 0)) and (len(header.getvalue()) == header_length):
+        with open(file_path, 'r+b') as npy_file:
+            npy_file.truncate(header_length + int(np.prod(new_shape))*dtype.itemsize)
+            npy_file.seek(0)
+            npy_file.write(header.getvalue())
+    else:
+        old_array = np.load(file_path, mmap_mode='r')
+        new_array = np.lib.format.open_memmap(file_path + '.tmp', mode='w+', dtype=dtype, shape=new_shape)
+        for idx in range(0, shape[0], 8760):
+            new_array[idx:idx+8760] = old_array[idx:idx+8760]
+        new_array.flush()
+        del old_array, new_array
+        os.replace(file_path + '.tmp', file_path)
+
+
+def open_output_array(shape, datatype = 'float32', output_file = '', chunk_layout = 'time'):
+    # returns the disk-backed .npy file of an earlier run as numpy memmap, grown to the given time steps,
+    # or None if the file does not exist or does not match the given grid and datatype
+    file_path = parent_directory + output_file
+    if staged_output(output_file, chunk_layout):
+        # the staging file left by an interrupted run holds the latest time steps, otherwise the store is copied back to a staging file
+        staging_file = chunked_array_staging_file(output_file)
+        if not os.path.exists(parent_directory + staging_file):
+            if not os.path.exists(file_path):
+                return None
+            data_array = load_chunked_array(output_file)
+            if (data_array.shape[1:] != tuple(shape[1:])) or (data_array.dtype != np.dtype(datatype)):
+                data_array.file.close()
+                return None
+            staging_array = np.lib.format.open_memmap(parent_directory + staging_file, mode='w+', dtype=datatype, shape=data_array.shape)
+            for y in range(0, data_array.shape[1], data_array.chunks[1]):
+                staging_array[:, y:y+data_array.chunks[1]] = data_array[:, y:y+data_array.chunks[1]]
+            data_array.file.close()
+            staging_array.flush()
+            del staging_array
+        return open_output_array(shape, datatype, staging_file)
+    if not os.path.exists(file_path):
+        return None
+    if output_file.endswith('.h5'):
+        data_array = load_chunked_array(output_file, 'r+')
+        if (data_array.shape[1:] != tuple(shape[1:])) or (data_array.dtype != np.dtype(datatype)):
+            data_array.file.close()
+            return None
+        if data_array.shape[0] < shape[0]:
+            data_array.resize(shape[0], axis=0)
+        return data_array
+    data_array = np.load(file_path, mmap_mode='r')
+    if (data_array.shape[1:] != tuple(shape[1:])) or (data_array.dtype != np.dtype(datatype)):
+        return None
+    del data_array
+    grow_npy_file(file_path, shape[0])
+    return np.load(file_path, mmap_mode='r+')
+
+
+def merra_manifest_path(output_file):
+    # the manifest of ingested files is stored next to the first processed array, e.g. \\processed_data\\dust_hourly_data_manifest.csv
+    return parent_directory + os.path.splitext(output_file)[0] + '_manifest.csv'
+
+
+def merra_file_checksum(file_path):
+    # md5 checksum of a MERRA2 netCDF4 file, read in blocks of 1 MB
+    checksum = hashlib.md5()
+    with open(file_path, 'rb') as merra_file:
+        for block in iter(lambda: merra_file.read(1 << 20), b''):
+            checksum.update(block)
+    return checksum.hexdigest()
+
+
+def update_merra_manifest(file_list, file_paths, offsets, manifest):
+    """
+    update_merra_manifest() compares the MERRA2 netCDF4 files list with the manifest of an earlier run and returns the files that have to be decoded.
+    A file is unchanged if its name, size and modification time match the manifest. If only the size or modification time changed,
+    the checksum decides whether the file has to be decoded again.
+
+    Parameters:
+        file_list(list):            a list containing the file names of the MERRA2 netCDF4 files list.
+        file_paths(list):           a list containing the paths of the MERRA2 netCDF4 files list.
+        offsets(list):              a list containing the time offset of every file on the 0 axis of the processed numpy arrays.
+        manifest(DataFrame):        a pandas dataframe of the manifest of an earlier run with the columns in merra_manifest_columns.
+
+    Returns:
+        new_manifest(DataFrame):    a pandas dataframe of the manifest for the given files.
+        decode(list):               a list of booleans indicating which of the given files have to be decoded.
+        removed_offsets(list):      a list containing the time offsets of the files in the manifest that do not exist anymore.
+    """
+    previous = manifest.set_index('filename')
+    rows = []
+    decode = []
+    for filename, file_path, offset in zip(file_list, file_paths, offsets):
+        stat = os.stat(file_path)
+        if filename in previous.index:
+            entry = previous.loc[filename]
+            if (entry['size'] == stat.st_size) and (entry['mtime'] == stat.st_mtime_ns):
+                checksum = entry['checksum']
+                changed = False
+            else:
+                checksum = merra_file_checksum(file_path)
+                changed = (checksum != entry['checksum'])
+        else:
+            checksum = merra_file_checksum(file_path)
+            changed = True
+        rows.append([filename, stat.st_size, stat.st_mtime_ns, checksum, offset])
+        decode.append(changed)
+    removed_offsets = previous.loc[~previous.index.isin(file_list), 'time_offset'].tolist()
+    return [pd.DataFrame(rows, columns=merra_manifest_columns), decode, removed_offsets]
+
+
+def season_definitions(seasons):
+    # dict of season names and definitions from True (wet and dry season), a list of names of merra_seasons or a dict of names and definitions
+    if seasons is True:
+        return {season: season for season in merra_season_codes}
+    elif not seasons:
+        return {}
+    elif isinstance(seasons, dict):
+        return dict(seasons)
+    else:
+        return {season: season for season in seasons}
+
+
+class MerraTimeIndex:
+    """
+    MerraTimeIndex is a compact index of the 0 axis of the processed MERRA2 arrays.
+    It holds a DatetimeIndex of the days (or months for monthly files) between the first and the last file together with
+    int8 season codes and year/day of year arrays, and generates boolean masks and indices for any season and frequency on demand.
+    It replaces the pickled lists of seasonal indices, which hold hundreds of thousands of python ints.
+
+    Parameters:
+        file_dates(list):           a list containing the date of every MERRA2 netCDF4 file.
+        timing(string):             a string for the frequency of the MERRA2 netCDF4 files, either 'hourly', 'three_hourly' or 'monthly'.
+                                    This is set to 'hourly' by default.
+    """
+
+    def __init__(self, file_dates, timing = 'hourly'):
+        file_dates = pd.DatetimeIndex(file_dates)
+        if timing == 'monthly':
+            dates = pd.date_range(start=file_dates.min(), end=file_dates.max(), freq='MS')
+        else:
+            dates = pd.date_range(start=file_dates.min(), end=file_dates.max(), freq='D')
+        self.set_dates(dates, timing)
+
+        # days without a file do not belong to any season, as in the lists built per file
+        self.available = dates.isin(file_dates)
+        self.season = np.zeros(len(dates), dtype='int8')
+        self.season[np.isin(self.month, junsep_months)] = merra_season_codes['junsep']
+        self.season[np.isin(self.month, novapr_months)] = merra_season_codes['novapr']
+        self.season[~self.available] = 0
+
+    def set_dates(self, dates, timing):
+        self.dates = dates
+        self.timing = timing
+        self.year = dates.year.values.astype('int16')
+        self.month = dates.month.values.astype('int8')
+        self.day_of_year = dates.dayofyear.values.astype('int16')
+
+    @classmethod
+    def from_directory(cls, data_directory, timing = 'hourly'):
+        # builds the time index from the file names in a folder (relative to the parent directory) without opening any file
+        return cls([merra_file_date(filename, timing) for filename in os.listdir(parent_directory + data_directory)], timing)
+
+    def steps(self, frequency):
+        # number of time steps per entry of the index for the given frequency
+        if frequency in ['daily', 'monthly']:
+            return 1
+        else:
+            return merra_steps_per_file[frequency]
+
+    def season_mask(self, season):
+        # boolean mask of the entries of the index in a season, either a name of merra_seasons or a dict {'months': [...]} / {'days': [first, last]}
+        if isinstance(season, str) and season in merra_season_codes:
+            return self.season == merra_season_codes[season]
+        if isinstance(season, str):
+            if season not in merra_seasons:
+                raise ValueError(f'unknown season {season}, use one of {list(merra_seasons)} or a season definition')
+            season = merra_seasons[season]
+        if 'months' in season:
+            in_season = np.isin(self.month, season['months'])
+        else:
+            first_day, last_day = season['days']
+            if first_day <= last_day:
+                in_season = (self.day_of_year >= first_day) & (self.day_of_year <= last_day)
+            else:
+                in_season = (self.day_of_year >= first_day) | (self.day_of_year <= last_day)
+        return in_season & self.available
+
+    def mask(self, season, frequency = 'daily'):
+        # boolean mask of the time steps of a season (e.g. 'junsep', 'novapr', 'djf' or a season definition) on the 0 axis of an array with the given frequency
+        return np.repeat(self.season_mask(season), self.steps(frequency))
+
+    def indices(self, season, frequency = 'daily'):
+        # sorted indices of the time steps of a season on the 0 axis of an array with the given frequency
+        return np.flatnonzero(self.mask(season, frequency))
+
+    def calendar_day(self, frequency = 'daily'):
+        # day of the year from 1 to 366 of the time steps of an array with the given frequency, where Feb 29 is always day 60,
+        # so the same calendar day of leap and other years shares a day (Mar 1 is always day 61)
+        leap_year = (self.year % 4 == 0) & ((self.year % 100 != 0) | (self.year % 400 == 0))
+        calendar_day = self.day_of_year + (~leap_year & (self.day_of_year >= 60))
+        return np.repeat(calendar_day, self.steps(frequency))
+
+    def season_year(self, in_season):
+        # year every entry of the index is counted for in a season given by its boolean mask: a season across the year end
+        # (e.g. nov-apr or djf) counts its first months (e.g. Nov and Dec) for the following year, in which the season ends
+        months = np.unique(self.month[in_season])
+        season_year = self.year.astype('int32')
+        if (12 in months) and (1 in months) and (len(months) < 12):
+            start_month = 12
+            while start_month - 1 in months:
+                start_month -= 1
+            season_year = season_year + (self.month >= start_month)
+        return season_year
+
+    def period_offsets(self, period = 'monthly', frequency = 'daily'):
+        # first time step of every calendar month ('monthly') or year ('yearly') on the 0 axis of an array with the given frequency,
+        # e.g. the offsets for resample_time_axis()
+        if period == 'yearly':
+            keys = self.year.astype('int32')
+        else:
+            keys = self.year.astype('int32')*12 + self.month
+        starts = np.flatnonzero(np.concatenate([[True], keys[1:] != keys[:-1]]))
+        return starts * self.steps(frequency)
+
+    def save(self, output_file):
+        # saves the time index to a .npz file relative to the parent directory
+        np.savez(parent_directory + output_file, dates=self.dates.values, season=self.season, available=self.available, timing=self.timing)
+
+    @classmethod
+    def load(cls, input_file):
+        # loads a time index saved with save() from a .npz file relative to the parent directory
+        stored = np.load(parent_directory + input_file)
+        time_index = cls.__new__(cls)
+        time_index.set_dates(pd.DatetimeIndex(stored['dates']), str(stored['timing']))
+        time_index.season = stored['season']
+        if 'available' in stored.files:
+            time_index.available = stored['available']
+        else:
+            time_index.available = np.ones(len(time_index.dates), dtype=bool)
+        return time_index
+
+
+@instrumented()
+def process_merra_variables(data_directory, variables = [], timing = '', time_steps = 0, y_steps = 91, x_steps = 105, datatype = 'float32',
+                            workers = 1, pool = 'process', bounding_box = [], output_files = [], incremental = False, aggregate = '', seasonal_split = False,
+                            queue_depth = 4, chunk_layout = 'time'):
+    """
+    process_merra_variables() returns the numpy arrays of any number of variables of the MERRA2 netCDF4 files list for a given frequency.
+    All variables are extracted from a file in a single open, so every file is only decompressed once.
+    Every file is written to the time slice given by the date in its file name.
+    Optionally every file is reduced to its daily mean, min or max as it is read and split by season on the fly,
+    so the full hourly arrays never exist.
+
+    Parameters:
+        data_directory(string):     a string of a directory relative to the parent directory in which this code is stored that points to the folder
+                                    that contains the MERRA2 netCDF4 files list
+        variables(list):            a list containing the strings of variable names in the MERRA2 netCDF4 file.
+        timing(string):             a string for the frequency of the MERRA2 netCDF4 files, either 'hourly', 'three_hourly' or 'monthly'.
+        time_steps(int):            an int for the number of total time steps (the 0 axis) of the returned numpy arrays. This is set to 0 by default.
+        y_steps(int):               an int for the number of y steps (the 1 axis) of the returned numpy arrays. This is set to 91 by default.
+        x_steps(int):               an int for the number of x steps (the 2 axis) of the returned numpy arrays. This is set to 105 by default.
+        datatype(string):           a string for the datatype being used in the returned numpy arrays. This is set to 'float32' by default.
+        workers(int):               an int for the number of workers that decode the MERRA2 netCDF4 files in parallel. This is set to 1 (sequential) by default.
+        pool(string):               a string for the kind of worker pool used if workers > 1, either 'thread' or 'process'. This is set to 'process' by default.
+                                    'prefetch' reads and decodes the next queue_depth files with workers background threads while the main thread
+                                    copies the current file into the arrays, also for workers = 1. This overlaps slow (e.g. network) I/O.
+        bounding_box(list):         a list [lat_min, lat_max, lon_min, lon_max] of the region to read. This is set to [] (the entire grid) by default.
+        output_files(list):         a list of .npy file paths relative to the parent directory, one per variable, that are written as numpy memmaps.
+                                    .h5 file paths are written as compressed, chunked HDF5 stores, with a process pool if workers > 1 and pool = 'thread'.
+                                    This is set to [] (numpy arrays in memory) by default.
+        incremental(boolean):       a boolean indicating whether the output_files of an earlier run are reused. A manifest of the ingested files is stored
+                                    next to the output_files and only new or changed files are decoded and patched or appended in place.
+                                    This is set to 'False' by default.
+        aggregate(string):          a string for the reduction of every file to a single time step, either 'mean', 'min' or 'max'.
+                                    For daily files this returns daily arrays. This is set to '' (no reduction) by default.
+        seasonal_split(boolean):    a boolean indicating whether the arrays of the wet and dry season are filled while the files are read,
+                                    or a list of season names of merra_seasons (or a dict of names and season definitions) to fill instead.
+                                    Their output files get the suffix '_' + season, e.g. '_junsep' or '_novapr'. This is set to 'False' by default.
+        queue_depth(int):           an int for the number of files decoded ahead of the main thread if pool = 'prefetch', the time the main thread
+                                    waited for decoded files is the stall_time of the stage record. This is set to 4 by default.
+        chunk_layout(string):       a string for the chunk layout of .h5 output_files, either 'time' or 'pixel'. Pixel-chunked stores are written
+                                    to a .npy staging file that is copied into the store once all files are written (see staged_output()).
+                                    This is set to 'time' by default.
+
+    Returns:
+        longitudes(list):           a list containing the longitudes of the input variables.
+        latitudes(list):            a list containing the latiitudes of the input variables.
+        time(list):                 a list containing the time steps of the input variables.
+        file_dates(list):           a list containing the date of every processed file, sorted by date.
+        data(dict):                 a dict that maps every variable name to its numpy array (or numpy memmap) for the entire given time.
+                                    If seasonal_split, the keys variable + '_' + season (e.g. '_junsep' and '_novapr') map to the arrays of the seasons.
+    """
+
+    # add path to data folder of interest
+    directory = parent_directory + data_directory
+
+    # sort the files by date and compute the time slice of every file from its date
+    # (daily/monthly depending on input)
+    file_list = sorted(os.listdir(directory))
+    file_paths = [directory + filename for filename in file_list]
+    file_dates = [merra_file_date(filename, timing) for filename in file_list]
+    steps = merra_steps_per_file[timing]
+    offsets = [merra_time_offset(file_date, file_dates[0], timing) for file_date in file_dates]
+
+    # time slices of every file in the returned arrays, an aggregated file is a single time step
+    if aggregate:
+        output_steps = 1
+    else:
+        output_steps = steps
+    output_offsets = [(offset//steps)*output_steps for offset in offsets]
+
+    #longitudes, latitudes and time for the netCDF4 file.
+    # This doesn't change, so can be set from the first file
+    data = Dataset(file_paths[0], mode='r')
+    longitudes = data.variables['lon'][:]
+    latitudes = data.variables['lat'][:]
+    time = data.variables['time'][:]
+    data.close()
+
+    # only read the hyperslab inside the bounding box from every file
+    if bounding_box:
+        lat_slice, lon_slice = merra_bounding_box_slices(longitudes, latitudes, bounding_box)
+        longitudes = longitudes[lon_slice]
+        latitudes = latitudes[lat_slice]
+        y_steps = latitudes.shape[0]
+        x_steps = longitudes.shape[0]
+    else:
+        lat_slice = slice(None)
+        lon_slice = slice(None)
+
+    # the arrays grow with files past the given time steps
+    time_steps = max(time_steps, output_offsets[-1] + output_steps)
+
+    # reuse the outputs of an earlier run if the manifest of its files is consistent with the files list,
+    # otherwise all files are decoded
+    data_total_time = None
+    decode = [True] * len(file_list)
+    if output_files and incremental:
+        manifest_file = merra_manifest_path(output_files[0])
+        manifest = pd.DataFrame(columns=merra_manifest_columns)
+        if os.path.exists(manifest_file):
+            manifest = pd.read_csv(manifest_file)
+            known_offsets = dict(zip(manifest['filename'], manifest['time_offset']))
+            if all(known_offsets.get(filename, offset) == offset for filename, offset in zip(file_list, offsets)):
+                data_total_time = [open_output_array((time_steps, y_steps, x_steps), datatype, output_file, chunk_layout) for output_file in output_files]
+                if any(data_array is None for data_array in data_total_time):
+                    data_total_time = None
+        if data_total_time is None:
+            manifest = pd.DataFrame(columns=merra_manifest_columns)
+        manifest, decode, removed_offsets = update_merra_manifest(file_list, file_paths, offsets, manifest)
+        print(f'decoding {sum(decode)} new or changed of {len(file_list)} files')
+
+    #create data ndarrays with initialized time steps, one per variable
+    if data_total_time is None:
+        if output_files:
+            data_total_time = [create_output_array((time_steps, y_steps, x_steps), datatype, output_file, chunk_layout) for output_file in output_files]
+        else:
+            data_total_time = [create_output_array((time_steps, y_steps, x_steps), datatype) for var in variables]
+    elif removed_offsets:
+        # time slices of removed files are reset, as in a full run
+        for data_array in data_total_time:
+            for offset in removed_offsets:
+                data_array[(offset//steps)*output_steps:(offset//steps+1)*output_steps,:,:] = 0
+
+    # every file is written to the time slice of every array in file_targets, None skips an array
+    data_names = list(variables)
+    file_targets = [[output_offset]*len(variables) for output_offset in output_offsets]
+
+    # the seasonal arrays are filled with the files of their season in the order of time
+    seasons = season_definitions(seasonal_split)
+    if seasons:
+        time_index = MerraTimeIndex(file_dates, timing)
+        for season in seasons:
+            season_mask = time_index.season_mask(seasons[season])
+            season_positions = np.cumsum(season_mask) - 1
+            season_shape = (int(np.sum(season_mask))*output_steps, y_steps, x_steps)
+            if output_files:
+                season_files = [os.path.splitext(output_file)[0] + '_' + season + os.path.splitext(output_file)[1] for output_file in output_files[:len(variables)]]
+                season_arrays = [create_output_array(season_shape, datatype, season_file, chunk_layout) for season_file in season_files]
+                output_files = output_files + season_files
+            else:
+                season_arrays = [create_output_array(season_shape, datatype) for var in variables]
+            for file_target, offset in zip(file_targets, offsets):
+                if (season_mask[offset//steps]) and not (incremental and output_files):
+                    file_target.extend([season_positions[offset//steps]*output_steps]*len(variables))
+                else:
+                    file_target.extend([None]*len(variables))
+            data_total_time = data_total_time + season_arrays
+            data_names = data_names + [var + '_' + season for var in variables]
+
+    decode_paths = [file_path for file_path, changed in zip(file_paths, decode) if changed]
+    decode_targets = [file_target for file_target, changed in zip(file_targets, decode) if changed]
+
+    # loop over all files in data folder of interest, every file is opened once for all variables.
+    # HDF5 stores are written by the main process only, while the netCDF4 files are decoded in worker processes,
+    # because the HDF5 library must not be entered by h5py and netCDF4 from different threads at the same time
+    h5_outputs = any(output_file.endswith('.h5') for output_file in output_files)
+    if pool == 'prefetch':
+        # producer/consumer pipeline: background threads fill a bounded queue of decoded files, the main thread writes them in order
+        # and measures how long it waits for the next file. The stall time is added to the stage record, to tune workers and queue_depth
+        stall_time = 0
+        with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+            queue = deque()
+            for idx in range(len(decode_paths) + queue_depth):
+                if idx < len(decode_paths):
+                    queue.append((executor.submit(read_merra_file, decode_paths[idx], variables, lat_slice, lon_slice, aggregate, True), decode_targets[idx]))
+                if idx >= queue_depth:
+                    future, file_target = queue.popleft()
+                    wait_time = perf_counter()
+                    values = future.result()
+                    stall_time += perf_counter() - wait_time
+                    store_merra_values(data_total_time, file_target, output_steps, values)
+        record_stage_value('stall_time', stall_time)
+
+    elif workers > 1 and pool == 'thread' and not h5_outputs:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(write_merra_file, file_path, variables, data_total_time, file_target, output_steps, lat_slice, lon_slice, aggregate)
+                       for file_path, file_target in zip(decode_paths, decode_targets)]
+            for future in futures:
+                future.result()
+
+    elif workers > 1 and pool == 'process' and output_files and not h5_outputs:
+        # every worker writes its file straight into the memory-mapped output files
+        for data_array in data_total_time:
+            flush_output_array(data_array)
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(write_merra_file_to_disk, file_path, variables, output_files, file_target, output_steps, lat_slice, lon_slice, aggregate)
+                       for file_path, file_target in zip(decode_paths, decode_targets)]
+            for future in futures:
+                future.result()
+
+    elif workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            # keep the number of decoded files waiting to be written bounded
+            pending = dict()
+            for idx, (file_path, file_target) in enumerate(zip(decode_paths, decode_targets)):
+                pending[executor.submit(read_merra_file, file_path, variables, lat_slice, lon_slice, aggregate)] = file_target
+                if (len(pending) >= 2*workers) or (idx == len(decode_paths)-1):
+                    done = wait(pending, return_when=(ALL_COMPLETED if idx == len(decode_paths)-1 else FIRST_COMPLETED))[0]
+                    for future in done:
+                        store_merra_values(data_total_time, pending.pop(future), output_steps, future.result())
+
+    else:
+        for file_path, file_target in zip(decode_paths, decode_targets):
+            write_merra_file(file_path, variables, data_total_time, file_target, output_steps, lat_slice, lon_slice, aggregate)
+
+    # in incremental runs the seasonal arrays are rebuilt from the patched arrays, since new files can shift the positions in the seasons
+    if seasons and incremental and output_files:
+        for season_idx, season in enumerate(seasons):
+            season_mask = np.repeat(time_index.season_mask(seasons[season]), output_steps)
+            for var_idx in range(len(variables)):
+                copy_masked_time_steps(data_total_time[(season_idx+1)*len(variables) + var_idx], data_total_time[var_idx], season_mask)
+
+    # the manifest is only written once all files are in the outputs, the staging files of pixel-chunked stores are copied into the stores first
+    if output_files:
+        for data_array in data_total_time:
+            flush_output_array(data_array)
+        for idx, output_file in enumerate(output_files):
+            if staged_output(output_file, chunk_layout):
+                data_total_time[idx] = None
+                data_total_time[idx] = finish_staged_array(output_file)
+        if incremental:
+            manifest.to_csv(manifest_file, index=False)
+
+    return [longitudes, latitudes, time, file_dates, dict(zip(data_names, data_total_time))]
+
+
+@instrumented()
+def process_merra_data(data_directory, seasonal_indices = True, variables = [], two_vars = True, timing='', time_steps = 0, y_steps = 91, x_steps = 0, datatype = 'float32',
+                       workers = 1, pool = 'process', bounding_box = [], output_files = [], incremental = False, start_date = '1980-01-01', end_date = '2016-12-31',
+                       aggregate = '', queue_depth = 4, chunk_layout = 'time'):
     """
     process_merra_data() returns the mean numpy array of the MERRA2 lists for given variables (max 2 variables per MERRA2 netCDF4 file) 
     and a given frequency and optionally also the mean numpy arrays for the dry and wet seasons.
     It can also save the values of the MERRA2 lists to a numpy array and return it.
     It can also optionally return a list of indices that indicate which entries of the numpy array belong to the dry and which to the wet season.
+    Every file is written to the time slice given by the date in its file name, so the files can be decoded in parallel.
     
     Parameters:
         data_directory(string):     a string of a directory relative to the parent directory in which this code is stored that points to the folder
                                     that contains the MERRA2 netCDF4 files list
         seasonal(boolean):          a boolean that indicates whether the data for the wet and dry season shall be returned. This is set to 'True' by default.
         variables(list):            a list containing the strings of variable names in the MERRA2 netCDF4 file. A maximum of 2 variables per netCDF4 can be processed.
+                                    Use process_merra_variables() for any number of variables.
         two_vars(boolean):          a boolean indicating whether the MERRA2 netCDF4 file contains 2 variables of interest. This is set to 'True' by default.
         hourly(boolean):            a boolean indicating wether the MERRA2 netCDF4 file has a hourly frequency. This is set to 'False' by default.
         time_steps(int):            an int for the number of total time steps (the 0 axis) in the optionally returned numpy array.
@@ -84,13 +1113,33 @@ def process_merra_data(data_directory, seasonal_indices = True, variables = [],
                                     For example, the number of y steps for the latitudes from 30°W to 35°E in the x size of a MERRA2 grid is 105.
                                     This is set to 105 by default.
         datatype(string):           a string for the datatype being used in the returned numpy array. This is set to 'float32' by default.
+        workers(int):               an int for the number of workers that decode the MERRA2 netCDF4 files in parallel. This is set to 1 (sequential) by default.
+        pool(string):               a string for the kind of worker pool used if workers > 1, either 'thread' or 'process'.
+                                    Thread workers write their file straight into its time slice, but take turns in decoding.
+                                    Process workers send the decoded file back to the main process, which writes it. This is set to 'process' by default.
+                                    'prefetch' reads the next queue_depth files in background threads while the main thread writes the current one.
+        bounding_box(list):         a list [lat_min, lat_max, lon_min, lon_max] of the region to read. It is turned into index slices once from the
+                                    latitudes and longitudes of the first file, and only that hyperslab is decoded from every file.
+                                    y_steps and x_steps are then taken from the bounding box. This is set to [] (the entire grid) by default.
+        output_files(list):         a list of .npy file paths relative to the parent directory, one per variable. If given, the returned numpy arrays are
+                                    memory-mapped files written directly by the workers, so the peak memory stays bounded for any length of the time axis.
+                                    .h5 file paths are written as compressed, chunked HDF5 stores. This is set to [] (numpy arrays in memory) by default.
+        incremental(boolean):       a boolean indicating whether only new or changed files are decoded into the output_files of an earlier run.
+                                    This is set to 'False' by default.
+        start_date(string):         a string for the first date of the continuous time range the files have to cover. This is set to '1980-01-01' by default.
+        end_date(string):           a string for the last date of the continuous time range the files have to cover. This is set to '2016-12-31' by default.
+        aggregate(string):          a string for the daily reduction of hourly or three hourly files while they are read, either 'mean', 'min' or 'max'.
+                                    The array of every time step is then never created. This is set to '' (no reduction) by default.
+        queue_depth(int):           an int for the number of files decoded ahead if pool = 'prefetch'. This is set to 4 by default.
+        chunk_layout(string):       a string for the chunk layout of .h5 output_files, either 'time' (chunks of complete maps) or 'pixel'
+                                    (chunks of long time series of small tiles, e.g. for daily arrays). This is set to 'time' by default.
 
     Returns:
         longitudes(list):           a list containing the longitudes of the input variables.
         latitudes(list):            a list containing the latiitudes of the input variables.
         time(list):                 a list containing the time steps of the input variables.
-        junsep_indices(list):       a list of indices for the values of the returned numpy array that belong to the wet season.
-        novapr_indices(list):       a list of indices for the values of the returned numpy array that belong to the dry season.
+        junsep_indices(ndarray):    a numpy array of indices for the values of the returned numpy array that belong to the wet season.
+        novapr_indices(ndarray):    a numpy array of indices for the values of the returned numpy array that belong to the dry season.
         data_junsep(ndarray):       a numpy array containing the mean values for the wet seasons.
         data_novapr(ndarray):       a numpy array containing the mean values for the dry seasons.
         data_total(ndarray):        a numpy array containing the mean values for the entire time.
@@ -110,241 +1159,585 @@ def process_merra_data(data_directory, seasonal_indices = True, variables = [],
         time(list):                 a list containing the time steps of the input variables.
         data_total_time_0(ndarray): a numpy array containing the MERRA2 values for the first variable for the entire given time.
         data_total_time_1(ndarray): a numpy array containing the MERRA2 values for the second variable for the entire given time.
-        junsep_indices(list):       a list of indices for the values of the returned numpy array that belong to the wet season.
-        novapr_indices(list):       a list of indices for the values of the returned numpy array that belong to the dry season.
+        junsep_indices(ndarray):    a numpy array of indices for the values of the returned numpy array that belong to the wet season.
+        novapr_indices(ndarray):    a numpy array of indices for the values of the returned numpy array that belong to the dry season.
         data_junsep_0(ndarray):     a numpy array containing the mean values for the wet seasons of the first variable.
         data_novapr_0(ndarray):     a numpy array containing the mean values for the dry seasons of the first variable.
         data_total_0(ndarray):      a numpy array containing the mean values for the entire time of the first variable.
         data_junsep_1(ndarray):     a numpy array containing the mean values for the wet seasons of the second variable.
         data_novapr_1(ndarray):     a numpy array containing the mean values for the dry seasons of the second variable.
         data_total_1(ndarray):      a numpy array containing the mean values for the entire time of the second variable.
+
+        If hourly or three_hourly & aggregate:
+        longitudes(list):           a list containing the longitudes of the input variables.
+        latitudes(list):            a list containing the latiitudes of the input variables.
+        time(list):                 a list containing the time steps of the input variables.
+        data_daily_0(ndarray):      a numpy array containing the daily aggregates of the first variable for the entire given time.
+        data_daily_1(ndarray):      (if two_vars) a numpy array containing the daily aggregates of the second variable for the entire given time.
+        data_daily_novapr_0(ndarray): (if seasonal_indices) a numpy array containing the daily aggregates of the first variable for the dry seasons.
+        data_daily_junsep_0(ndarray): (if seasonal_indices) a numpy array containing the daily aggregates of the first variable for the wet seasons.
+        data_daily_novapr_1(ndarray): (if seasonal_indices & two_vars) a numpy array containing the daily aggregates of the second variable for the dry seasons.
+        data_daily_junsep_1(ndarray): (if seasonal_indices & two_vars) a numpy array containing the daily aggregates of the second variable for the wet seasons.
     """
     
 
-    # add path to data folder of interest
-    directory = parent_directory + data_directory
-
-    # boolean to for later initialization of all variables and arrays
-    first = True
+    #only the first variable (or the first two for hourly data) is processed
+    if timing == 'hourly' and two_vars:
+        variables = variables[:2]
+    else:
+        variables = variables[:1]
+
+    (longitudes, latitudes, time, file_dates, data) = process_merra_variables(data_directory, variables = variables, timing = timing, time_steps = time_steps,
+                                                                              y_steps = y_steps, x_steps = x_steps, datatype = datatype, workers = workers,
+                                                                              pool = pool, bounding_box = bounding_box, output_files = output_files,
+                                                                              incremental = incremental, aggregate = aggregate,
+                                                                              seasonal_split = (seasonal_indices and bool(aggregate)), queue_depth = queue_depth,
+                                                                              chunk_layout = chunk_layout)
+
+    # the daily aggregates are split by season while the files are read
+    if aggregate and (timing != 'monthly'):
+        test_ts = pd.Series(pd.to_datetime([file_date.strftime('%Y-%m-%d') for file_date in file_dates]))
+        continuous_ts = pd.date_range(start=start_date, end=end_date)
+        assert (continuous_ts.difference(test_ts).size == 0)
+        daily_data = [data[var] for var in variables]
+        if seasonal_indices:
+            for var in variables:
+                daily_data += [data[var + '_novapr'], data[var + '_junsep']]
+        return [longitudes, latitudes, time] + daily_data
 
-    file_list = os.listdir(directory)
-    # (daily/monthly depending on input)
-    counter_total = 0
+    # seasonal indices from the month of every file
     if seasonal_indices:
-        junsep_indices = []
-        novapr_indices = []
+        time_index = MerraTimeIndex(file_dates, timing)
+        junsep_indices = time_index.indices('junsep')
+        novapr_indices = time_index.indices('novapr')
+        step_junsep_indices = time_index.indices('junsep', timing)
+        step_novapr_indices = time_index.indices('novapr', timing)
 
-    # build array for dates to later check if the time range of the files analyzed
+    # build array for dates to check if the time range of the files analyzed
     # is continuous and that there are no missing values
-    continuity_check = []
-
-    # loop over all files in data folder of interest
-    for filename in sorted(file_list):
-        with open(os.path.join(directory, filename), 'r') as file: #open in readonly mode
-            data = Dataset(directory + filename, more="r")
-
-            #init data array
-            if (first):
-                #longitudes, latitudes and time for the netCDF4 file.
-                # This doesn't change, so can be set at initialization
-                longitudes = data.variables['lon'][:]
-                latitudes = data.variables['lat'][:]
-                time = data.variables['time'][:]
-
-                if timing == 'hourly':
-                    if two_vars:
-                        if seasonal_indices:
-                            hourly_novapr_indices = []
-                            hourly_junsep_indices = []
-                            for i in range(24*counter_total, 24*counter_total + 24) : hourly_novapr_indices.append(i)
-                            novapr_indices.append(counter_total)
-
-                        #create data ndarray with initialized time steps
-                        data_total_time_0 = np.zeros((time_steps, y_steps, x_steps), dtype=datatype)
-                        data_total_time_0[0:24,:,:] = data.variables[variables[0]][:,:,:]
-
-                        data_total_time_1 = np.zeros((time_steps, y_steps, x_steps), dtype=datatype)
-                        data_total_time_1[0:24,:,:] = data.variables[variables[1]][:,:,:]
-                    else:
-                        if seasonal_indices:
-                            hourly_novapr_indices = []
-                            hourly_junsep_indices = []
-                            for i in range(24*counter_total, 24*counter_total + 24) : hourly_novapr_indices.append(i)
-                            novapr_indices.append(counter_total)
-
-                        #create data ndarray with initialized time steps
-                        data_total_time_0 = np.zeros((time_steps, y_steps, x_steps), dtype=datatype)
-                        data_total_time_0[0:24,:,:] = data.variables[variables[0]][:,:,:]
-
-                elif timing == 'three_hourly':
-                    if seasonal_indices:
-                        three_hourly_novapr_indices = []
-                        three_hourly_junsep_indices = []
-                        for i in range(8*counter_total, 8*counter_total + 8) : three_hourly_novapr_indices.append(i)
-                        novapr_indices.append(counter_total) 
-
-                    data_total_time = np.zeros((time_steps, y_steps, x_steps), dtype=datatype)
-                    data_total_time[0:8,:,:] = data.variables[variables[0]][:,:,:]
-
-                elif timing == 'monthly':
-                    if seasonal_indices:
-                        novapr_indices.append(counter_total)
-
-                    data_total_time = np.zeros((time_steps, y_steps, x_steps), dtype=datatype)
-                    data_total_time[0,:,:] = data.variables[variables[0]][:,:,:]
-
-                counter_total += 1
-                # continuity check to see if we got all dates covered
-                # since aod files have another naming convention, we control for that
-                if timing == 'monthly':
-                    continuity_check.append(datetime.strptime(filename[27:33], '%Y%m').strftime('%Y-%m'))
-                else:
-                    continuity_check.append(datetime.strptime(filename[27:35], '%Y%m%d').strftime('%Y-%m-%d'))
-                
-                first = False
-                continue
-
-            if seasonal_indices:
-                # calculate mean for jun-sep period using regex
-                if (re.search(r'(.*)-(06|07|08|09)-(.*)', data.RangeBeginningDate)):
-                    # calculate current data to add to overall data
-                    if timing == 'hourly':
-                        for i in range(24*counter_total, 24*counter_total + 24) : hourly_junsep_indices.append(i) 
-                        junsep_indices.append(counter_total)
-                    elif timing == 'three_hourly':
-                        for i in range(8*counter_total, 8*counter_total + 8) : three_hourly_junsep_indices.append(i) 
-                        junsep_indices.append(counter_total)
-                    elif timing == 'monthly':
-                        junsep_indices.append(counter_total)
-
-                # calculate mean for nov-apr period using regex
-                if (re.search(r'(.*)-(11|12|01|02|03|04)-(.*)', data.RangeBeginningDate)):
-                    # calculate current data to add to overall data
-                    if timing == 'hourly':
-                        for i in range(24*counter_total, 24*counter_total + 24) : hourly_novapr_indices.append(i) 
-                        novapr_indices.append(counter_total)
-                    elif timing == 'three_hourly':
-                        for i in range(8*counter_total, 8*counter_total + 8) : three_hourly_novapr_indices.append(i) 
-                        novapr_indices.append(counter_total)
-                    elif timing == 'monthly':
-                        novapr_indices.append(counter_total)
-    
-            # calculate total data independent of season
-            if timing == 'hourly':
-                data_current_time_0 = data.variables[variables[0]][:,:,:]
-                data_total_time_0[24*counter_total: 24*counter_total+24,:,:] = data_current_time_0
-                if two_vars:
-                    data_current_time_1 = data.variables[variables[1]][:,:,:]
-                    data_total_time_1[24*counter_total:24*counter_total+24,:,:] = data_current_time_1
-            elif timing == 'three_hourly':
-                data_current_time = data.variables[variables[0]][:,:,:]
-                data_total_time[8*counter_total: 8*counter_total+8,:,:] = data_current_time
-            elif timing == 'monthly':
-                data_current_time = data.variables[variables[0]][:,:,:]
-                data_total_time[counter_total,:,:] = data_current_time
-
-            counter_total += 1
-            # add to dates array
-            if timing == 'monthly':
-                continuity_check.append(datetime.strptime(filename[27:33], '%Y%m').strftime('%Y-%m'))
-            else:
-                continuity_check.append(datetime.strptime(filename[27:35], '%Y%m%d').strftime('%Y-%m-%d'))
+    if timing == 'monthly':
+        continuity_check = [file_date.strftime('%Y-%m') for file_date in file_dates]
+    else:
+        continuity_check = [file_date.strftime('%Y-%m-%d') for file_date in file_dates]
 
     # continuity check:
     if timing == 'hourly':
         # given time range:
         test_ts = pd.Series(pd.to_datetime(continuity_check))
-        # continuous time range from 1980-01-01 to 2016-12-31
-        continuous_ts = pd.date_range(start='1980-01-01', end='2016-12-31')
+        # continuous time range from start_date to end_date
+        continuous_ts = pd.date_range(start=start_date, end=end_date)
         assert (continuous_ts.difference(test_ts).size == 0)
         if seasonal_indices:
             if two_vars:
-                return [longitudes, latitudes, time, data_total_time_0, data_total_time_1, hourly_junsep_indices, junsep_indices, hourly_novapr_indices, novapr_indices]
+                return [longitudes, latitudes, time, data[variables[0]], data[variables[1]], step_junsep_indices, junsep_indices, step_novapr_indices, novapr_indices]
             else:
-                return [longitudes, latitudes, time, data_total_time_0, hourly_junsep_indices, junsep_indices, hourly_novapr_indices, hourly_novapr_indices]
+                return [longitudes, latitudes, time, data[variables[0]], step_junsep_indices, junsep_indices, step_novapr_indices, novapr_indices]
         else:
             if two_vars:
-                return [longitudes, latitudes, time, data_total_time_0, data_total_time_1]
+                return [longitudes, latitudes, time, data[variables[0]], data[variables[1]]]
             else:
-                return [longitudes, latitudes, time, data_total_time_0]
+                return [longitudes, latitudes, time, data[variables[0]]]
 
     elif timing == 'three_hourly':
         # given time range:
         test_ts = pd.Series(pd.to_datetime(continuity_check))
-        # continuous time range from 1980-01-01 to 2016-12-31
-        continuous_ts = pd.date_range(start='1980-01-01', end='2016-12-31')
+        # continuous time range from start_date to end_date
+        continuous_ts = pd.date_range(start=start_date, end=end_date)
         assert (continuous_ts.difference(test_ts).size == 0)
         if seasonal_indices:
-            return [longitudes, latitudes, time, data_total_time, three_hourly_junsep_indices, junsep_indices, three_hourly_novapr_indices, novapr_indices]
+            return [longitudes, latitudes, time, data[variables[0]], step_junsep_indices, junsep_indices, step_novapr_indices, novapr_indices]
         else:
-            return [longitudes, latitudes, time, data_total_time]
+            return [longitudes, latitudes, time, data[variables[0]]]
     
     elif timing == 'monthly':
         #given time range:
         test_ts = pd.Series(pd.to_datetime(continuity_check).strftime('%Y-%m'))
-        #continuous time range from 1980-01 to 2016-12
-        continuous_ts = pd.date_range(start='1980-01', end='2016-12', freq='M').strftime('%Y-%m')
+        #continuous time range from the month of start_date to the month of end_date
+        continuous_ts = pd.date_range(start=start_date[:7], end=end_date[:7], freq='M').strftime('%Y-%m')
         assert (continuous_ts.difference(test_ts).size == 0)
         if seasonal_indices:
-            return [longitudes, latitudes, time, data_total_time, junsep_indices, novapr_indices]
+            return [longitudes, latitudes, time, data[variables[0]], junsep_indices, novapr_indices]
         else:
-            return [longitudes, latitudes, time, data_total_time]
+            return [longitudes, latitudes, time, data[variables[0]]]
 
 
-@jit
-def extract_seasonal_data(total_data, novapr_indices, junsep_indices):
-    novapr_data = np.zeros((np.array([novapr_indices], dtype='float32').shape[1], total_data.shape[1], total_data.shape[2]), dtype = 'float32')
-    junsep_data = np.zeros((np.array([junsep_indices], dtype='float32').shape[1], total_data.shape[1], total_data.shape[2]), dtype = 'float32')
+def read_merra_composite_files(file_paths, variables, lat_slice = slice(None), lon_slice = slice(None)):
+    # decodes the files of one date of every source folder
+    values = dict()
+    for file_path, file_variables in zip(file_paths, variables):
+        values.update(zip(file_variables, read_merra_file(file_path, file_variables, lat_slice, lon_slice, prefetch = True)))
+    return values
 
-    idx = 0
-    counter_novapr = 0
-    counter_junsep = 0
-    for entry in total_data:
-        if idx in novapr_indices:
-            novapr_data[counter_novapr] = entry
-            counter_novapr += 1
-        elif idx in junsep_indices:
-            junsep_data[counter_junsep] = entry
-            counter_junsep += 1
-        idx += 1
 
-    return novapr_data, junsep_data
+@instrumented()
+def build_merra_composite(sources, weights, timing = 'hourly', time_steps = 0, y_steps = 91, x_steps = 105, datatype = 'float32', workers = 1,
+                          bounding_box = [], composite_file = '', composite_daily_file = '', species_daily_files = {}, queue_depth = 4, chunk_layout = 'time'):
+    """
+    build_merra_composite() evaluates a weighted sum of MERRA2 species (e.g. pm2.5 = bc + 1.8 oc + ss + 1.375 so4 + dust) file by file
+    while the files are read, and writes the composite and the daily means of the composite and of every species in the same pass.
+    The species can come from several folders, whose files are matched by their date. Only queue_depth files are held in memory,
+    no full array of a species is ever materialized.
 
-@jit
-def hourly_data_to_daily_mean(data):
-    daily_mean_data = np.zeros((round(data.shape[0]/24), data.shape[1], data.shape[2]), dtype = 'float32')
-    day_counter = 0
-    daily_data = np.zeros((data.shape[1], data.shape[2]), dtype = 'float32')
+    Parameters:
+        sources(dict):              a dict of folders relative to the parent directory and the lists of variables read from their files,
+                                    e.g. {'\\raw_data\\test_data\\pm_data\\': ['BCSMASS', 'OCSMASS'], '\\raw_data\\...\\hourly_dusmass_pm2.5\\': ['DUSMASS25']}.
+        weights(dict):              a dict of variables and their weight in the composite, variables without weight are only read for their daily means.
+        timing(string):             a string for the frequency of the MERRA2 netCDF4 files, either 'hourly' or 'three_hourly'. This is set to 'hourly' by default.
+        time_steps(int):            an int for the number of time steps of the composite, it grows with files past it. This is set to 0 by default.
+        y_steps(int):               an int for the number of y steps of the outputs. This is set to 91 by default.
+        x_steps(int):               an int for the number of x steps of the outputs. This is set to 105 by default.
+        datatype(string):           a string for the datatype of the outputs. This is set to 'float32' by default.
+        workers(int):               an int for the number of background threads decoding files. This is set to 1 by default.
+        bounding_box(list):         a list [lat_min, lat_max, lon_min, lon_max] of the region to read. This is set to [] (the entire grid) by default.
+        composite_file(string):     a string of a .npy or .h5 file path relative to the parent directory for the composite at the frequency of the files.
+                                    This is set to '' (numpy array in memory) by default.
+        composite_daily_file(string): a string of a .npy or .h5 file path for the daily means of the composite. This is set to '' by default.
+        species_daily_files(dict):  a dict of variables and .npy or .h5 file paths for their daily means, '' keeps the daily means of a variable in memory.
+                                    Only the variables in the dict get daily means. This is set to {} (no daily means of the species) by default.
+        queue_depth(int):           an int for the number of dates decoded ahead of the main thread, the time the main thread waited for decoded
+                                    files is the stall_time of the stage record. This is set to 4 by default.
+        chunk_layout(string):       a string for the chunk layout of the daily .h5 outputs, either 'time' or 'pixel' (see staged_output()).
+                                    This is set to 'time' by default.
 
-    idx = 0
+    Returns:
+        longitudes(list):           a list containing the longitudes of the outputs.
+        latitudes(list):            a list containing the latitudes of the outputs.
+        file_dates(list):           a list containing the date of every processed file, sorted by date.
+        data(dict):                 a dict that maps 'composite', 'composite_daily' and variable + '_daily' of the variables in species_daily_files
+                                    to their numpy arrays (or numpy memmaps).
+    """
 
-    for hourly_data in data:
-        daily_data += hourly_data
-        if ((idx != 0) and (idx%24 == 0)):
-            daily_mean_data[day_counter] = daily_data / 24
-            daily_data = np.zeros((data.shape[1], data.shape[2]), dtype = 'float32')
-            day_counter += 1
-        idx += 1
-    return daily_mean_data
+    # match the files of all folders by their date, every folder has to hold a file of every day between the first and the last date,
+    # otherwise a missing species would silently be 0 in the composite
+    directories = list(sources)
+    folder_files = []
+    for data_directory in directories:
+        file_list = sorted(os.listdir(parent_directory + data_directory))
+        folder_files.append({merra_file_date(filename, timing): parent_directory + data_directory + filename for filename in file_list})
+    file_dates = sorted(set().union(*folder_files))
+    continuous_ts = pd.date_range(start=file_dates[0], end=file_dates[-1], freq='D')
+    for data_directory, files in zip(directories, folder_files):
+        missing_dates = continuous_ts.difference(pd.DatetimeIndex(list(files)))
+        assert (missing_dates.size == 0), f'{data_directory} misses the files of {missing_dates.size} dates, e.g. {missing_dates[0].date()}'
+    date_paths = [[files[file_date] for files in folder_files] for file_date in file_dates]
+    variables = [list(sources[data_directory]) for data_directory in directories]
+    all_variables = [var for file_variables in variables for var in file_variables]
+
+    steps = merra_steps_per_file[timing]
+    offsets = [merra_time_offset(file_date, file_dates[0], timing) for file_date in file_dates]
+
+    #longitudes and latitudes from the first file, only the hyperslab inside the bounding box is read
+    data = Dataset(date_paths[0][0], mode='r')
+    longitudes = data.variables['lon'][:]
+    latitudes = data.variables['lat'][:]
+    data.close()
+    if bounding_box:
+        lat_slice, lon_slice = merra_bounding_box_slices(longitudes, latitudes, bounding_box)
+        longitudes = longitudes[lon_slice]
+        latitudes = latitudes[lat_slice]
+        y_steps = latitudes.shape[0]
+        x_steps = longitudes.shape[0]
+    else:
+        lat_slice = slice(None)
+        lon_slice = slice(None)
+
+    time_steps = max(time_steps, offsets[-1] + steps)
+    days = -(-time_steps // steps)
+    outputs = {'composite': create_output_array((time_steps, y_steps, x_steps), datatype, composite_file),
+               'composite_daily': create_output_array((days, y_steps, x_steps), datatype, composite_daily_file, chunk_layout)}
+    # daily means only for the species that are written, e.g. not for the dust that is only read for the composite
+    for var in all_variables:
+        if var in species_daily_files:
+            outputs[var + '_daily'] = create_output_array((days, y_steps, x_steps), datatype, species_daily_files[var], chunk_layout)
+
+    def store(name, first, values):
+        if isinstance(outputs[name], h5py.Dataset):
+            with hdf5_lock:
+                outputs[name][first:first+values.shape[0]] = values
+        else:
+            outputs[name][first:first+values.shape[0]] = values
+
+    # producer/consumer pipeline as in process_merra_variables(pool = 'prefetch'): background threads decode the files of the next dates,
+    # the main thread evaluates the composite of the current date, its waits for decoded files are added to the stage record
+    stall_time = 0
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+        queue = deque()
+        for idx in range(len(date_paths) + queue_depth):
+            if idx < len(date_paths):
+                queue.append((executor.submit(read_merra_composite_files, date_paths[idx], variables, lat_slice, lon_slice), offsets[idx]))
+            if idx < queue_depth:
+                continue
+            future, offset = queue.popleft()
+            wait_time = perf_counter()
+            values = future.result()
+            stall_time += perf_counter() - wait_time
+            composite = np.zeros((steps, y_steps, x_steps), dtype=datatype)
+            for var, value in values.items():
+                value = np.ma.getdata(value)
+                if var in weights:
+                    if weights[var] == 1.:
+                        composite += value
+                    else:
+                        composite += weights[var]*value
+                if var in species_daily_files:
+                    store(var + '_daily', offset//steps, value.mean(axis=0, dtype='float64')[np.newaxis])
+            store('composite', offset, composite)
+            store('composite_daily', offset//steps, composite.mean(axis=0, dtype='float64')[np.newaxis])
+    record_stage_value('stall_time', stall_time)
+
+    for name in outputs:
+        if name == 'composite' and composite_file or name == 'composite_daily' and composite_daily_file or species_daily_files.get(name[:-6], ''):
+            flush_output_array(outputs[name])
+    # the daily staging files of pixel-chunked stores are copied into the stores
+    daily_files = dict({var + '_daily': output_file for var, output_file in species_daily_files.items()}, composite_daily = composite_daily_file)
+    for name, output_file in daily_files.items():
+        if name in outputs and staged_output(output_file, chunk_layout):
+            outputs[name] = None
+            outputs[name] = finish_staged_array(output_file)
+
+    return [longitudes, latitudes, file_dates, outputs]
+
+
+def extract_seasonal_data(total_data, novapr_indices, junsep_indices, output_files = [], views = False, datatype = 'float32', workers = 1):
+    """
+    extract_seasonal_data() splits the time steps (the 0 axis) of an array into the dry (nov-apr) and the wet (jun-sep) season.
+    The seasons are given as boolean masks or sorted indices of the 0 axis, e.g. MerraTimeIndex.mask('novapr', 'hourly'),
+    and the time steps are gathered in blocks with np.take, so numpy memmaps and HDF5 stores are split out of core.
 
-@jit
-def three_hourly_data_to_daily_mean(data):
-    daily_mean_data = np.zeros((round(data.shape[0]/8), data.shape[1], data.shape[2]), dtype = 'float32')
-    day_counter = 0
-    daily_data = np.zeros((data.shape[1], data.shape[2]), dtype = 'float32')
+    Parameters:
+        total_data(ndarray):        a numpy array, numpy memmap or HDF5 dataset with time on the 0 axis.
+        novapr_indices(ndarray):    a boolean mask or a list/numpy array of the indices of the time steps of the dry season.
+        junsep_indices(ndarray):    a boolean mask or a list/numpy array of the indices of the time steps of the wet season.
+        output_files(list):         a list of two .npy or .h5 file paths relative to the parent directory the dry and the wet season
+                                    are written to. This is set to [] (numpy arrays in memory) by default.
+        views(boolean):             a boolean indicating whether lazy SeasonalView objects of the master array are returned instead of copies.
+                                    This is set to False by default.
+        datatype(string):           a string for the datatype of the seasonal arrays. This is set to 'float32' by default.
+        workers(int):               an int for the number of threads gathering blocks of time steps in parallel. This is set to 1 by default.
 
-    idx = 0
+    Returns:
+        novapr_data(ndarray):       a numpy array (or numpy memmap/HDF5 dataset, SeasonalView) of the time steps of the dry season.
+        junsep_data(ndarray):       a numpy array (or numpy memmap/HDF5 dataset, SeasonalView) of the time steps of the wet season.
+    """
 
-    for hourly_data in data:
-        daily_data += hourly_data
-        if ((idx != 0) and (idx%8 == 0)):
-            daily_mean_data[day_counter] = daily_data / 8
-            daily_data = np.zeros((data.shape[1], data.shape[2]), dtype = 'float32')
-            day_counter += 1
-        idx += 1
-    return daily_mean_data
+    seasonal_data = []
+    for season_idx, selection in enumerate([novapr_indices, junsep_indices]):
+        if views:
+            seasonal_data.append(SeasonalView(total_data, selection))
+            continue
+        indices = time_step_indices(selection, total_data.shape[0])
+        output_file = output_files[season_idx] if output_files else ''
+        season_data = create_output_array((indices.shape[0],) + tuple(total_data.shape[1:]), datatype, output_file)
+        take_time_steps(season_data, total_data, indices, workers = workers)
+        if output_file:
+            flush_output_array(season_data)
+        seasonal_data.append(season_data)
+
+    return seasonal_data[0], seasonal_data[1]
+
+class SeasonalView:
+    """
+    SeasonalView is a lazy view of the time steps of a season on the 0 axis of a processed array.
+    It wraps the master array (a numpy array, numpy memmap or HDF5 dataset) and the indices of a season instead of a copy of
+    the seasonal time steps, and supports slicing, iteration, reductions and np.asarray() like the seasonal array would.
+    Only the time steps that are accessed are read, e.g. view[:, y, x] only gathers the time series of a single pixel.
+
+    Parameters:
+        data(ndarray):              a numpy array, numpy memmap or HDF5 dataset with time on the 0 axis.
+        selection(ndarray):         a boolean mask or a list/numpy array of the indices of the time steps of the season.
+    """
+
+    def __init__(self, data, selection):
+        self.data = data
+        self.indices = time_step_indices(selection, data.shape[0])
+        self.shape = (self.indices.shape[0],) + tuple(data.shape[1:])
+        self.ndim = len(self.shape)
+        self.dtype = np.dtype(data.dtype)
+
+    @classmethod
+    def from_time_index(cls, data, time_index, season, frequency = 'daily'):
+        # view of a season ('junsep' or 'novapr') of an array with the given frequency, e.g. SeasonalView.from_time_index(dust_daily_data, time_index, 'novapr')
+        return cls(data, time_index.mask(season, frequency))
+
+    def __len__(self):
+        return self.shape[0]
+
+    def gather(self, indices, key = ()):
+        # reads the time steps at the sorted indices of the master array, indexed by key on the other axes
+        if isinstance(self.data, h5py.Dataset):
+            starts, stops = time_step_runs(indices)
+            blocks = [read_chunked_selection(self.data, (slice(start, stop),) + key) for start, stop in zip(starts, stops)]
+            if blocks:
+                return np.concatenate(blocks)
+            return read_chunked_selection(self.data, (slice(0, 0),) + key)
+        # basic indexing of the other axes is a view, so only the selected values are copied
+        return np.take(self.data[(slice(None),) + key], indices, axis=0)
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+        if key and key[0] is Ellipsis:
+            key = (slice(None),) + key
+        time_key, key = key[0] if key else slice(None), key[1:]
+        if isinstance(time_key, (int, np.integer)):
+            if isinstance(self.data, h5py.Dataset):
+                return read_chunked_selection(self.data, (int(self.indices[time_key]),) + key)
+            return self.data[(int(self.indices[time_key]),) + key]
+        return self.gather(self.indices[time_key], key)
+
+    def __iter__(self):
+        # iterates the time steps run by run, every run of consecutive time steps is read as one block
+        starts, stops = time_step_runs(self.indices)
+        for start, stop in zip(starts, stops):
+            yield from self.data[start:stop]
+
+    def __array__(self, dtype = None):
+        values = self.gather(self.indices)
+        if dtype is not None:
+            return values.astype(dtype)
+        return values
+
+    def reduce(self, how = 'mean', axis = None, dtype = None, out = None):
+        # 'mean', 'sum', 'min' or 'max' of the seasonal time steps, reductions over the time axis are accumulated run by run
+        if axis != 0:
+            return getattr(np.asarray(self), how)(axis=axis, out=out)
+        starts, stops = time_step_runs(self.indices)
+        result = None
+        for start, stop in zip(starts, stops):
+            if isinstance(self.data, h5py.Dataset):
+                with hdf5_lock:
+                    block = self.data[start:stop]
+            else:
+                block = self.data[start:stop]
+            if how in ['mean', 'sum']:
+                value = block.sum(axis=0, dtype='float64')
+                result = value if result is None else result + value
+            elif how == 'min':
+                value = block.min(axis=0)
+                result = value if result is None else np.minimum(result, value)
+            else:
+                value = block.max(axis=0)
+                result = value if result is None else np.maximum(result, value)
+        if how == 'mean':
+            result = result / self.shape[0]
+        if how in ['mean', 'sum']:
+            result = result.astype(dtype or self.dtype)
+        if out is not None:
+            out[...] = result
+            return out
+        return result
+
+    # np.mean(view, axis=0) etc. call these methods with the dtype and out arguments of the numpy reductions
+    def mean(self, axis = None, dtype = None, out = None):
+        return self.reduce('mean', axis, dtype, out)
+
+    def sum(self, axis = None, dtype = None, out = None):
+        return self.reduce('sum', axis, dtype, out)
+
+    def min(self, axis = None, out = None):
+        return self.reduce('min', axis, out = out)
+
+    def max(self, axis = None, out = None):
+        return self.reduce('max', axis, out = out)
+
+    def materialize(self, output_file = '', workers = 1):
+        # copy of the seasonal time steps as numpy array, or as .npy/.h5 file relative to the parent directory
+        season_data = create_output_array(self.shape, self.dtype, output_file)
+        take_time_steps(season_data, self.data, self.indices, workers = workers)
+        if output_file:
+            flush_output_array(season_data)
+        return season_data
+
+
+@instrumented()
+def split_seasons(data, time_index, seasons = True, frequency = 'daily', aggregate = '', output_files = {}, datatype = 'float32', block = 8760):
+    """
+    split_seasons() computes the subsets or aggregates of any number of seasons of an array in a single pass over its time steps (the 0 axis).
+    Every block of time steps is read once and copied to (or accumulated into) every season it overlaps, so e.g. a sensitivity
+    analysis over several season definitions reads a numpy memmap or HDF5 store only once. Seasons may overlap.
+
+    Parameters:
+        data(ndarray):              a numpy array, numpy memmap or HDF5 dataset with time on the 0 axis.
+        time_index(MerraTimeIndex): the time index of the 0 axis of data.
+        seasons(list):              True (wet and dry season), a list of season names of merra_seasons (e.g. ['djf', 'mam', 'jja', 'son'])
+                                    or a dict of names and season definitions (e.g. {'harmattan': {'days': [335, 59]}}). This is set to True by default.
+        frequency(string):          a string for the frequency of data, either 'daily', 'monthly', 'hourly' or 'three_hourly'. This is set to 'daily' by default.
+        aggregate(string):          a string for the reduction of every season over time, either 'mean', 'sum', 'min' or 'max'.
+                                    This is set to '' (the subsets of the seasons) by default.
+        output_files(dict):         a dict of season names and .npy or .h5 file paths relative to the parent directory the subsets are written to.
+                                    This is set to {} (numpy arrays in memory) by default.
+        datatype(string):           a string for the datatype of the subsets and aggregates. This is set to 'float32' by default.
+        block(int):                 an int for the number of time steps read at once. This is set to 8760 by default.
+
+    Returns:
+        seasonal_data(dict):        a dict of season names and the numpy arrays (or numpy memmaps/HDF5 datasets) of their subsets or aggregates.
+    """
+
+    seasons = season_definitions(seasons)
+    masks = {season: time_index.mask(seasons[season], frequency) for season in seasons}
+    for season in seasons:
+        if masks[season].shape[0] != data.shape[0]:
+            raise ValueError(f'time index of {masks[season].shape[0]} {frequency} time steps for an array of {data.shape[0]} time steps')
+
+    if aggregate:
+        accumulators = dict()
+        for season in seasons:
+            if aggregate in ['mean', 'sum']:
+                accumulators[season] = np.zeros(data.shape[1:], dtype='float64')
+            elif aggregate == 'min':
+                accumulators[season] = np.full(data.shape[1:], np.inf)
+            elif aggregate == 'max':
+                accumulators[season] = np.full(data.shape[1:], -np.inf)
+    else:
+        seasonal_data = {season: create_output_array((int(np.sum(masks[season])),) + tuple(data.shape[1:]), datatype, output_files.get(season, ''))
+                         for season in seasons}
+        positions = dict.fromkeys(seasons, 0)
+
+    for first in range(0, data.shape[0], block):
+        in_block = {season: masks[season][first:first+block] for season in seasons}
+        if not any(np.any(season_in_block) for season_in_block in in_block.values()):
+            continue
+        values = read_time_block(data, first, first+block)
+
+        for season in seasons:
+            if not np.any(in_block[season]):
+                continue
+            season_values = values[in_block[season]]
+            if aggregate in ['mean', 'sum']:
+                accumulators[season] += season_values.sum(axis=0, dtype='float64')
+            elif aggregate == 'min':
+                np.minimum(accumulators[season], season_values.min(axis=0), out=accumulators[season])
+            elif aggregate == 'max':
+                np.maximum(accumulators[season], season_values.max(axis=0), out=accumulators[season])
+            elif not aggregate:
+                season_data = seasonal_data[season]
+                if isinstance(season_data, h5py.Dataset):
+                    with hdf5_lock:
+                        season_data[positions[season]:positions[season]+season_values.shape[0]] = season_values
+                else:
+                    season_data[positions[season]:positions[season]+season_values.shape[0]] = season_values
+                positions[season] += season_values.shape[0]
+
+    if aggregate:
+        seasonal_data = dict()
+        for season in seasons:
+            counts = int(np.sum(masks[season]))
+            if aggregate == 'mean':
+                seasonal_data[season] = (accumulators[season] / max(counts, 1)).astype(datatype)
+            else:
+                seasonal_data[season] = accumulators[season].astype(datatype)
+    else:
+        for season in seasons:
+            if output_files.get(season, ''):
+                flush_output_array(seasonal_data[season])
+
+    return seasonal_data
+
+
+def resample_time_block(data, output, offsets, ends, first, last, how, quantile):
+    # reduces the groups first to last-1 of the 0 axis of data into output, only reading the time steps of these groups
+    block = read_time_block(data, offsets[first], ends[last-1])
+    lengths = ends[first:last] - offsets[first:last]
+
+    if np.all(lengths == lengths[0]):
+        # groups of equal length (e.g. 24 hours per day): reshape and reduce the group axis
+        block = block.reshape((last-first, lengths[0]) + block.shape[1:])
+        if how == 'mean':
+            result = block.mean(axis=1, dtype='float64')
+        elif how == 'sum':
+            result = block.sum(axis=1, dtype='float64')
+        elif how == 'min':
+            result = block.min(axis=1)
+        elif how == 'max':
+            result = block.max(axis=1)
+        else:
+            result = np.quantile(block, quantile, axis=1)
+    else:
+        # groups of different length (e.g. days per month): reduce at the group offsets
+        local_offsets = offsets[first:last] - offsets[first]
+        if how == 'mean':
+            result = np.add.reduceat(block, local_offsets, axis=0, dtype='float64') / lengths.reshape((-1,) + (1,)*(block.ndim-1))
+        elif how == 'sum':
+            result = np.add.reduceat(block, local_offsets, axis=0, dtype='float64')
+        elif how == 'min':
+            result = np.minimum.reduceat(block, local_offsets, axis=0)
+        elif how == 'max':
+            result = np.maximum.reduceat(block, local_offsets, axis=0)
+        else:
+            result = np.stack([np.quantile(block[start:start+length], quantile, axis=0) for start, length in zip(local_offsets, lengths)])
+
+    if isinstance(output, h5py.Dataset):
+        with hdf5_lock:
+            output[first:last] = result
+    else:
+        output[first:last] = result
+
+
+@instrumented()
+def resample_time_axis(data, factor = 0, offsets = [], how = 'mean', quantile = 0.5, datatype = 'float32', output_file = '', workers = 1, chunk_layout = 'time'):
+    """
+    resample_time_axis() reduces groups of consecutive time steps (the 0 axis) of a numpy array to a single time step,
+    e.g. hourly to daily (factor = 24), three hourly to daily (factor = 8) or daily to monthly and yearly (offsets of the months or years).
+    The groups are reduced in blocks of about 256 MB, so numpy memmaps and HDF5 stores are resampled out of core, and the blocks can be reduced in parallel.
+
+    Parameters:
+        data(ndarray):              a numpy array, numpy memmap or HDF5 dataset with time on the 0 axis.
+        factor(int):                an int for the number of time steps per group, a last incomplete group is reduced as well. This is set to 0 by default.
+        offsets(list):              a list (or numpy array) of the first time step of every group, used if factor = 0,
+                                    e.g. MerraTimeIndex.period_offsets('monthly'). This is set to [] by default.
+        how(string):                a string for the reduction, either 'mean', 'sum', 'min', 'max' or 'quantile'. This is set to 'mean' by default.
+        quantile(float):            a float for the quantile between 0 and 1 if how = 'quantile'. This is set to 0.5 by default.
+        datatype(string):           a string for the datatype of the returned array. This is set to 'float32' by default.
+        output_file(string):        a string of a .npy or .h5 file path relative to the parent directory the result is written to.
+                                    This is set to '' (numpy array in memory) by default.
+        workers(int):               an int for the number of threads reducing blocks in parallel. This is set to 1 by default.
+        chunk_layout(string):       a string for the chunk layout of a .h5 output_file, either 'time' or 'pixel' (see staged_output()).
+                                    This is set to 'time' by default.
+
+    Returns:
+        resampled_data(ndarray):    a numpy array (or numpy memmap/HDF5 dataset) with one time step per group.
+    """
+
+    if factor:
+        offsets = np.arange(0, data.shape[0], factor)
+    offsets = np.asarray(offsets, dtype='int64')
+    ends = np.append(offsets[1:], data.shape[0])
+    output = create_output_array((offsets.shape[0],) + tuple(data.shape[1:]), datatype, output_file, chunk_layout)
+
+    # number of groups per block so that a block holds about 256 MB of input
+    step_bytes = np.dtype(data.dtype).itemsize * int(np.prod(data.shape[1:]))
+    group_steps = max(1, int(np.ceil(data.shape[0] / max(offsets.shape[0], 1))))
+    block_groups = max(1, (1 << 28) // (step_bytes * group_steps))
+    blocks = [(first, min(first + block_groups, offsets.shape[0])) for first in range(0, offsets.shape[0], block_groups)]
+
+    if workers > 1:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(resample_time_block, data, output, offsets, ends, first, last, how, quantile) for first, last in blocks]
+            for future in futures:
+                future.result()
+    else:
+        for first, last in blocks:
+            resample_time_block(data, output, offsets, ends, first, last, how, quantile)
+
+    if output_file:
+        flush_output_array(output)
+    if staged_output(output_file, chunk_layout):
+        del output
+        output = finish_staged_array(output_file)
+    return output
+
+
+def hourly_data_to_daily_mean(data, workers = 1, output_file = '', chunk_layout = 'time'):
+    # daily means of hourly data, every day are the 24 hours from 00:00 to 23:00
+    return resample_time_axis(data, factor = 24, how = 'mean', output_file = output_file, workers = workers, chunk_layout = chunk_layout)
 
 
+def three_hourly_data_to_daily_mean(data, workers = 1, output_file = '', chunk_layout = 'time'):
+    # daily means of three hourly data, every day are the 8 time steps from 00:00 to 21:00
+    return resample_time_axis(data, factor = 8, how = 'mean', output_file = output_file, workers = workers, chunk_layout = chunk_layout)
+
+
+@instrumented()
 def process_outcome_data():
     """
     process_outcome_data() returns dataframes of the economic input data of interest.
@@ -581,6 +1974,411 @@ def process_outcome_data():
 
 
 
+"--------------------------------------------------------------------"
+'Climatology Functions'
+"--------------------------------------------------------------------"
+
+
+def open_processed_array(input_file, mmap_mode = 'r'):
+    # opens a processed .npy file as numpy memmap or a .h5 file as HDF5 dataset (relative to the parent directory) without reading it,
+    # the pages (chunks) are only read once they are indexed. The caller owns an open HDF5 dataset and closes it with data.file.close().
+    # mmap_mode None reads the entire array into memory
+    if input_file.endswith('.h5'):
+        if mmap_mode is None:
+            return read_chunked_array(input_file)
+        return load_chunked_array(input_file)
+    return np.load(parent_directory + input_file, mmap_mode=mmap_mode)
+
+
+def processed_array_fingerprint(input_file, time_index):
+    # md5 of the size and modification time of a processed array and of its time index, a cache of the array is invalid once it changes
+    stat = os.stat(parent_directory + input_file)
+    fingerprint = hashlib.md5(f'{stat.st_size}-{stat.st_mtime_ns}'.encode())
+    fingerprint.update(np.asarray(time_index.dates.values).tobytes())
+    fingerprint.update(np.asarray(time_index.available).tobytes())
+    return fingerprint.hexdigest()
+
+
+def day_of_year_climatology(data, time_index, frequency = 'daily', block = 8760):
+    """
+    day_of_year_climatology() computes the mean and standard deviation of every pixel for every calendar day in a single pass over the time steps.
+    Every block of time steps is reduced per calendar day and merged into float64 Welford accumulators (count, mean, sum of squared deviations),
+    which is numerically stable and never holds more than one block of a numpy memmap or HDF5 store in memory.
+    Time steps of days without a MERRA2 file are skipped.
+
+    Parameters:
+        data(ndarray):              a numpy array, numpy memmap or HDF5 dataset with time on the 0 axis.
+        time_index(MerraTimeIndex): the time index of the 0 axis of data.
+        frequency(string):          a string for the frequency of data, either 'daily', 'hourly' or 'three_hourly'. This is set to 'daily' by default.
+        block(int):                 an int for the number of time steps read at once. This is set to 8760 by default.
+
+    Returns:
+        climatology_mean(ndarray):  a float64 numpy array (366, y, x) of the mean of every calendar day (Feb 29 is day 60).
+        climatology_std(ndarray):   a float64 numpy array (366, y, x) of the (population) standard deviation of every calendar day.
+        climatology_count(ndarray): an int64 numpy array (366,) of the number of time steps of every calendar day.
+    """
+
+    calendar_day = time_index.calendar_day(frequency)
+    available = np.repeat(time_index.available, time_index.steps(frequency))
+    if calendar_day.shape[0] != data.shape[0]:
+        raise ValueError(f'time index of {calendar_day.shape[0]} {frequency} time steps for an array of {data.shape[0]} time steps')
+
+    count = np.zeros(366, dtype='int64')
+    mean = np.zeros((366,) + tuple(data.shape[1:]), dtype='float64')
+    m2 = np.zeros((366,) + tuple(data.shape[1:]), dtype='float64')
+
+    for first in range(0, data.shape[0], block):
+        values = read_time_block(data, first, first+block)
+        block_days = calendar_day[first:first+block]
+        block_available = available[first:first+block]
+
+        for day in np.unique(block_days[block_available]):
+            day_values = values[(block_days == day) & block_available].astype('float64')
+            day_count = day_values.shape[0]
+            day_mean = day_values.mean(axis=0)
+            day_m2 = ((day_values - day_mean)**2).sum(axis=0)
+
+            # merge the statistics of the block into the accumulators of the day (parallel Welford update)
+            idx = day - 1
+            total_count = count[idx] + day_count
+            delta = day_mean - mean[idx]
+            mean[idx] += delta * (day_count / total_count)
+            m2[idx] += day_m2 + delta**2 * (count[idx] * day_count / total_count)
+            count[idx] = total_count
+
+    std = np.sqrt(m2 / np.maximum(count, 1).reshape((-1,) + (1,)*(m2.ndim-1)))
+    return mean, std, count
+
+
+def write_day_of_year_anomalies(anomalies, data, calendar_day, climatology_mean, climatology_std = None, block = 8760):
+    # writes the anomalies of data from the climatology of the calendar day of every time step to anomalies, in blocks of time steps
+    for first in range(0, data.shape[0], block):
+        values = read_time_block(data, first, first+block)
+        block_days = calendar_day[first:first+block] - 1
+        block_anomalies = values - climatology_mean[block_days]
+        if climatology_std is not None:
+            block_std = climatology_std[block_days]
+            block_anomalies = np.divide(block_anomalies, block_std, out=np.zeros_like(block_anomalies), where=(block_std > 0))
+        if isinstance(anomalies, h5py.Dataset):
+            with hdf5_lock:
+                anomalies[first:first+block] = block_anomalies
+        else:
+            anomalies[first:first+block] = block_anomalies
+
+
+def day_of_year_anomalies(data, time_index, climatology_mean, climatology_std = None, frequency = 'daily', datatype = 'float32',
+                          output_file = '', block = 8760):
+    # anomalies of every time step from the climatology of its calendar day, standardized if climatology_std is given
+    # (pixels without variance get an anomaly of 0). The anomalies can be written to a .npy or .h5 output_file
+    anomalies = create_output_array(data.shape, datatype, output_file)
+    write_day_of_year_anomalies(anomalies, data, time_index.calendar_day(frequency), climatology_mean, climatology_std, block)
+    if output_file:
+        flush_output_array(anomalies)
+    return anomalies
+
+
+@instrumented()
+def cached_climatology(input_file, time_index, frequency = 'daily', cache_file = ''):
+    """
+    cached_climatology() returns the calendar day climatology of a processed array and caches it in a .npz file next to the array.
+    The cache stores a fingerprint of the array and its time index and is recomputed once either changes.
+
+    Parameters:
+        input_file(string):         a string of the .npy or .h5 file path of the processed array relative to the parent directory.
+        time_index(MerraTimeIndex): the time index of the 0 axis of the processed array.
+        frequency(string):          a string for the frequency of the processed array. This is set to 'daily' by default.
+        cache_file(string):         a string of the .npz file path relative to the parent directory. This is set to '' (input_file + '_climatology.npz') by default.
+
+    Returns:
+        climatology_mean(ndarray):  a float64 numpy array (366, y, x) of the mean of every calendar day.
+        climatology_std(ndarray):   a float64 numpy array (366, y, x) of the standard deviation of every calendar day.
+        climatology_count(ndarray): an int64 numpy array (366,) of the number of time steps of every calendar day.
+    """
+
+    if not cache_file:
+        cache_file = os.path.splitext(input_file)[0] + '_climatology.npz'
+    fingerprint = processed_array_fingerprint(input_file, time_index)
+
+    if os.path.exists(parent_directory + cache_file):
+        cache = np.load(parent_directory + cache_file)
+        if (str(cache['fingerprint']) == fingerprint) and (str(cache['frequency']) == frequency):
+            return cache['mean'], cache['std'], cache['count']
+
+    print(f'computing climatology of {input_file} ...')
+    data = open_processed_array(input_file)
+    mean, std, count = day_of_year_climatology(data, time_index, frequency)
+    if isinstance(data, h5py.Dataset):
+        data.file.close()
+    np.savez(parent_directory + cache_file, mean=mean, std=std, count=count, fingerprint=fingerprint, frequency=frequency)
+    return mean, std, count
+
+
+@instrumented()
+def cached_anomalies(input_file, time_index, frequency = 'daily', standardize = False, cache_file = ''):
+    # returns the calendar day anomalies of a processed array as HDF5 dataset, cached in a .h5 store (pixel chunks) next to the array
+    # that is rebuilt once the array, its time index or the standardization changes. The dataset is open, the caller owns it
+    # and closes it with anomalies.file.close()
+    if not cache_file:
+        cache_file = os.path.splitext(input_file)[0] + ('_standardized' if standardize else '') + '_anomalies.h5'
+    fingerprint = processed_array_fingerprint(input_file, time_index)
+
+    if os.path.exists(parent_directory + cache_file):
+        anomalies = load_chunked_array(cache_file)
+        if anomalies.attrs.get('fingerprint', '') == fingerprint and bool(anomalies.attrs.get('standardized', False)) == standardize:
+            return anomalies
+        anomalies.file.close()
+
+    mean, std, count = cached_climatology(input_file, time_index, frequency)
+    print(f'computing anomalies of {input_file} ...')
+    data = open_processed_array(input_file)
+    anomalies = create_chunked_array(cache_file, data.shape, 'float32', chunk_layout = 'pixel')
+    write_day_of_year_anomalies(anomalies, data, time_index.calendar_day(frequency), mean, std if standardize else None)
+    if isinstance(data, h5py.Dataset):
+        data.file.close()
+    anomalies.attrs['fingerprint'] = fingerprint
+    anomalies.attrs['standardized'] = standardize
+    anomalies.file.flush()
+    return anomalies
+
+
+"--------------------------------------------------------------------"
+'Rolling Window Functions'
+"--------------------------------------------------------------------"
+
+
+def rolling_window_sum(values, window):
+    # sums of all complete trailing windows of the 0 axis of values from cumulative sums in float64, the cost does not depend on the window length
+    cumulative = np.zeros((values.shape[0] + 1,) + values.shape[1:], dtype='float64')
+    np.cumsum(values, axis=0, dtype='float64', out=cumulative[1:])
+    return cumulative[window:] - cumulative[:-window]
+
+
+def rolling_window_max(values, window, how = 'max'):
+    # max (or min) of all complete trailing windows of the 0 axis of values with the van Herk/Gil-Werman algorithm:
+    # prefix and suffix maxima within segments of the window length, so every time step costs 3 comparisons for any window length
+    reduce = np.maximum if how == 'max' else np.minimum
+    steps = values.shape[0]
+    segments = -(-steps // window)
+    fill = -np.inf if how == 'max' else np.inf
+    padded = np.full((segments*window,) + values.shape[1:], fill, dtype='float64')
+    padded[:steps] = values
+    padded = padded.reshape((segments, window) + values.shape[1:])
+    prefix = reduce.accumulate(padded, axis=1).reshape((segments*window,) + values.shape[1:])
+    suffix = reduce.accumulate(padded[:, ::-1], axis=1)[:, ::-1].reshape((segments*window,) + values.shape[1:])
+    # the window ending at t starts at t-window+1, its suffix part ends with its segment and its prefix part starts with the next segment
+    return reduce(suffix[:steps-window+1], prefix[window-1:steps])
+
+
+def rolling_time_block(data, outputs, windows, how, threshold, first, last):
+    # rolling statistics of the time steps first to last-1, read together with the max(windows)-1 preceding time steps
+    halo = min(first, max(windows) - 1)
+    values = read_time_block(data, first - halo, last)
+    if how == 'count':
+        values = (values > threshold)
+
+    for window, output in zip(windows, outputs):
+        # the first window-1 time steps of the array have no complete window
+        incomplete = max(0, window - 1 - first)
+        result = np.full((last - first,) + values.shape[1:], np.nan)
+        if values.shape[0] >= window:
+            if how in ['mean', 'sum', 'count']:
+                complete = rolling_window_sum(values, window)
+                if how == 'mean':
+                    complete /= window
+            else:
+                complete = rolling_window_max(values, window, how)
+            result[incomplete:] = complete[complete.shape[0] - (last - first - incomplete):]
+
+        if isinstance(output, h5py.Dataset):
+            with hdf5_lock:
+                output[first:last] = result
+        else:
+            output[first:last] = result
+
+
+@instrumented()
+def rolling_time_window(data, windows, how = 'mean', threshold = 0, datatype = 'float32', output_files = [], block = 8760, workers = 1):
+    """
+    rolling_time_window() computes trailing moving statistics over the time steps (the 0 axis) of an array, e.g. the 3, 7 and 30 day moving
+    means of a daily (time, 91, 105) cube. The window ending at time step t holds the time steps t-window+1 to t, as the lags of create_lag_array().
+    Sums, means and exceedance counts come from cumulative sums and maxima/minima from the van Herk/Gil-Werman algorithm, so the cost does not
+    depend on the window length. The cube is processed in blocks of time steps, which can be computed in parallel threads,
+    so numpy memmaps and HDF5 stores are never loaded at once, and all windows are computed from the same read of a block.
+
+    Parameters:
+        data(ndarray):              a numpy array, numpy memmap or HDF5 dataset with time on the 0 axis.
+        windows(int):               an int for the number of time steps of the window, or a list of ints for several windows.
+        how(string):                a string for the statistic, either 'mean', 'sum', 'max', 'min' or 'count' (number of time steps above threshold).
+                                    This is set to 'mean' by default.
+        threshold(float):           a float for the exceedance threshold if how = 'count'. This is set to 0 by default.
+        datatype(string):           a string for the datatype of the returned arrays. This is set to 'float32' by default.
+        output_files(list):         a list of .npy or .h5 file paths relative to the parent directory, one per window, the results are written to.
+                                    This is set to [] (numpy arrays in memory) by default.
+        block(int):                 an int for the number of time steps computed at once. This is set to 8760 by default.
+        workers(int):               an int for the number of threads computing blocks in parallel. This is set to 1 by default.
+
+    Returns:
+        rolling_data(ndarray):      a numpy array (or numpy memmap/HDF5 dataset) of the shape of data with the statistic of the window ending at
+                                    every time step, NaN for the first window-1 time steps. A dict of windows and arrays if windows is a list.
+    """
+
+    if how not in ['mean', 'sum', 'max', 'min', 'count']:
+        raise ValueError(f'unknown rolling statistic {how}, use \'mean\', \'sum\', \'max\', \'min\' or \'count\'')
+    window_list = [windows] if isinstance(windows, (int, np.integer)) else list(windows)
+    if min(window_list) < 1:
+        raise ValueError('rolling windows need at least 1 time step')
+    if not output_files:
+        output_files = [''] * len(window_list)
+    outputs = [create_output_array(data.shape, datatype, output_file) for output_file in output_files]
+
+    blocks = [(first, min(first + block, data.shape[0])) for first in range(0, data.shape[0], block)]
+    if workers > 1:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(rolling_time_block, data, outputs, window_list, how, threshold, first, last) for first, last in blocks]
+            for future in futures:
+                future.result()
+    else:
+        for first, last in blocks:
+            rolling_time_block(data, outputs, window_list, how, threshold, first, last)
+
+    for output, output_file in zip(outputs, output_files):
+        if output_file:
+            flush_output_array(output)
+
+    if isinstance(windows, (int, np.integer)):
+        return outputs[0]
+    return dict(zip(window_list, outputs))
+
+
+"--------------------------------------------------------------------"
+'Synthetic Data Functions'
+"--------------------------------------------------------------------"
+
+
+def merra_grid(bounding_box = []):
+    # latitudes and longitudes of the MERRA2 grid (0.5° x 0.625°), optionally only inside a [lat_min, lat_max, lon_min, lon_max] bounding box
+    latitudes = np.linspace(-90, 90, 361)
+    longitudes = np.linspace(-180, 179.375, 576)
+    if bounding_box:
+        lat_slice, lon_slice = merra_bounding_box_slices(longitudes, latitudes, bounding_box)
+        latitudes = latitudes[lat_slice]
+        longitudes = longitudes[lon_slice]
+    return latitudes, longitudes
+
+
+def merra_stream(year):
+    # MERRA2 stream number in the file names, which depends on the production period
+    if year < 1992:
+        return 100
+    elif year < 2001:
+        return 200
+    elif year < 2011:
+        return 300
+    else:
+        return 400
+
+
+def synthetic_merra_values(variable, latitudes, longitudes, steps, rng):
+    # plausible synthetic values (float32, time x lat x lon) for the MERRA2 variables of this project, other variables are uniform in [0, 1)
+    shape = (steps, latitudes.shape[0], longitudes.shape[0])
+    # dust is emitted over the sahara and sahel, so the fields are mostly close to zero
+    sahara = np.exp(-((latitudes[:,None]-20)/8)**2 - ((longitudes[None,:]-10)/20)**2)
+    if variable == 'DUSMASS25':
+        return (sahara * rng.lognormal(-18, 1, shape)).astype('float32')
+    elif variable == 'AODANA':
+        return (0.1 + sahara * rng.gamma(2, 0.3, shape)).astype('float32')
+    elif variable in ['ULML', 'VLML']:
+        return rng.normal(0, 5, shape).astype('float32')
+    elif variable == 'PRECTOTCORR':
+        return (rng.exponential(1e-5, shape) * (rng.random(shape) < 0.3)).astype('float32')
+    elif variable == 'TLML':
+        return (300 - 0.5*np.abs(latitudes)[None,:,None] + rng.normal(0, 3, shape)).astype('float32')
+    elif variable in ['BCSMASS', 'OCSMASS', 'SSSMASS25', 'SO4SMASS']:
+        return rng.lognormal(-20, 1, shape).astype('float32')
+    else:
+        return rng.random(shape, dtype='float32')
+
+
+def write_synthetic_merra_file(file_path, file_date, variables, timing, latitudes, longitudes, seed):
+    # writes a single synthetic MERRA2 netCDF4 file, the values only depend on the seed and the date of the file
+    steps = merra_steps_per_file[timing]
+    rng = np.random.default_rng([seed, file_date.year, file_date.month, file_date.day])
+    data = Dataset(file_path, mode='w')
+    try:
+        data.createDimension('time', steps)
+        data.createDimension('lat', latitudes.shape[0])
+        data.createDimension('lon', longitudes.shape[0])
+        data.createVariable('lat', 'f8', ('lat',))[:] = latitudes
+        data.createVariable('lon', 'f8', ('lon',))[:] = longitudes
+        time = data.createVariable('time', 'i4', ('time',))
+        time.units = 'minutes since ' + file_date.strftime('%Y-%m-%d') + ' 00:00:00'
+        if timing == 'hourly':
+            time[:] = np.arange(steps)*60 + 30
+        else:
+            time[:] = np.arange(steps)*(1440 // steps)
+        for var in variables:
+            data.createVariable(var, 'f4', ('time', 'lat', 'lon'), zlib=True, complevel=1)[:] = synthetic_merra_values(var, latitudes, longitudes, steps, rng)
+        data.RangeBeginningDate = file_date.strftime('%Y-%m-%d')
+        data.RangeBeginningTime = '00:00:00.000000'
+    finally:
+        data.close()
+
+
+def generate_synthetic_merra_data(data_directory, variables = [], timing = 'hourly', start_date = '1980-01-01', end_date = '1980-12-31',
+                                  collection = '', bounding_box = [], seed = 0, workers = 1):
+    """
+    generate_synthetic_merra_data() writes a folder of synthetic MERRA2 netCDF4 files that can be processed by process_merra_data().
+    The files follow the MERRA2 naming convention (e.g. MERRA2_100.tavg1_2d_flx_Nx.19800101.nc4, the date is at filename[27:35]),
+    carry the given variables on the MERRA2 grid and a RangeBeginningDate attribute. The values are reproducible for a given seed.
+
+    Parameters:
+        data_directory(string):     a string of a directory relative to the parent directory in which this code is stored, where the files are written.
+        variables(list):            a list containing the strings of variable names, e.g. ['ULML', 'VLML'].
+        timing(string):             a string for the frequency of the files, either 'hourly', 'three_hourly' or 'monthly'. This is set to 'hourly' by default.
+        start_date(string):         a string for the date of the first file. This is set to '1980-01-01' by default.
+        end_date(string):           a string for the date of the last file. This is set to '1980-12-31' by default.
+        collection(string):         a string for the MERRA2 collection in the file names, which has to be 15 characters long.
+                                    This is set to '' (tavg1_2d_flx_Nx, inst3_2d_gas_Nx or instM_2d_gas_Nx depending on timing) by default.
+        bounding_box(list):         a list [lat_min, lat_max, lon_min, lon_max] of the region of the grid. This is set to [] (the entire grid) by default.
+        seed(int):                  an int for the seed of the random values. This is set to 0 by default.
+        workers(int):               an int for the number of processes that write files in parallel. This is set to 1 (sequential) by default.
+
+    Returns:
+        file_paths(list):           a list containing the paths of the written files.
+    """
+
+    directory = parent_directory + data_directory
+    os.makedirs(directory, exist_ok=True)
+
+    if not collection:
+        collection = {'hourly': 'tavg1_2d_flx_Nx', 'three_hourly': 'inst3_2d_gas_Nx', 'monthly': 'instM_2d_gas_Nx'}[timing]
+    latitudes, longitudes = merra_grid(bounding_box)
+
+    if timing == 'monthly':
+        file_dates = pd.date_range(start=start_date, end=end_date, freq='MS')
+        file_names = [f'MERRA2_{merra_stream(file_date.year)}.{collection}.{file_date.strftime("%Y%m")}.nc4' for file_date in file_dates]
+    else:
+        file_dates = pd.date_range(start=start_date, end=end_date, freq='D')
+        file_names = [f'MERRA2_{merra_stream(file_date.year)}.{collection}.{file_date.strftime("%Y%m%d")}.nc4' for file_date in file_dates]
+    file_paths = [directory + file_name for file_name in file_names]
+
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(write_synthetic_merra_file, file_path, file_date, variables, timing, latitudes, longitudes, seed)
+                       for file_path, file_date in zip(file_paths, file_dates)]
+            for future in futures:
+                future.result()
+    else:
+        for file_path, file_date in zip(file_paths, file_dates):
+            write_synthetic_merra_file(file_path, file_date, variables, timing, latitudes, longitudes, seed)
+
+    return file_paths
+
+
+######################################################################
+
+
+
 "--------------------------------------------------------------------"
 'Plotting Functions'
 "--------------------------------------------------------------------"
@@ -2081,377 +3879,87 @@ def simulation_comparison_animation(simulation_data_array, real_data_array, lats
 
 
 
-@jit
-def build_source_array(input_array, longitudes, latitudes):
-    #ToDO:
-    #modify so it uses return_region_pixel_array
+def source_region_pixels(sources = []):
+    """
+    source_region_pixels() returns the rows and columns of the dust source pixels of the advection diffusion simulation.
 
-    source_array = np.zeros((input_array.shape[0], longitudes, latitudes), dtype='float32')
+    Parameters:
+        sources(list):              a list of region names of return_region_pixel_array(), a numpy array (n, 2) of pixels (row, column)
+                                    or a boolean numpy array (y, x) as mask of the source pixels. This is set to [] (source_region_names) by default.
 
-    source_array[:,77,47] = input_array[:,77,47]
-    source_array[:,77,48] = input_array[:,77,48]
-    source_array[:,77,49] = input_array[:,77,49]
-    source_array[:,76,48] = input_array[:,76,48]
-    source_array[:,76,49] = input_array[:,76,49]
-    source_array[:,76,50] = input_array[:,76,50]
-    source_array[:,75,49] = input_array[:,75,49]
-    source_array[:,75,50] = input_array[:,75,50]
-    source_array[:,74,48] = input_array[:,74,48]
-    source_array[:,74,49] = input_array[:,74,49]
-    source_array[:,73,47] = input_array[:,73,47]
-    source_array[:,73,48] = input_array[:,73,48]
-    source_array[:,73,49] = input_array[:,73,49]
-    source_array[:,72,47] = input_array[:,72,47]
-    source_array[:,72,48] = input_array[:,72,48]
-    source_array[:,71,43] = input_array[:,71,43]
-    source_array[:,71,44] = input_array[:,71,44]
-    source_array[:,71,45] = input_array[:,71,45]
-    source_array[:,71,46] = input_array[:,71,46]
-    source_array[:,71,47] = input_array[:,71,47]
-    source_array[:,70,43] = input_array[:,70,43]
-    source_array[:,70,44] = input_array[:,70,44]
-    source_array[:,70,45] = input_array[:,70,45]
-    source_array[:,70,46] = input_array[:,70,46]
-    source_array[:,69,42] = input_array[:,69,42]
-    source_array[:,69,43] = input_array[:,69,43]
-    source_array[:,69,44] = input_array[:,69,44]
-    source_array[:,69,45] = input_array[:,69,45]
-    source_array[:,68,43] = input_array[:,68,43]
-    source_array[:,68,44] = input_array[:,68,44]
-    source_array[:,67,43] = input_array[:,67,43]
-
-    #right:
-    source_array[:,69,71] = input_array[:,69,71]
-    source_array[:,69,72] = input_array[:,69,72]
-    source_array[:,69,73] = input_array[:,69,73]
-    source_array[:,68,68] = input_array[:,68,68]
-    source_array[:,68,69] = input_array[:,68,69]
-    source_array[:,68,70] = input_array[:,68,70]
-    source_array[:,68,71] = input_array[:,68,71]
-    source_array[:,68,72] = input_array[:,68,72]
-    source_array[:,68,73] = input_array[:,68,73]
-    source_array[:,67,68] = input_array[:,67,68]
-    source_array[:,67,69] = input_array[:,67,69]
-    source_array[:,67,70] = input_array[:,67,70]
-    source_array[:,67,71] = input_array[:,67,71]
-    source_array[:,67,72] = input_array[:,67,72]
-    source_array[:,67,73] = input_array[:,67,73]
-    source_array[:,67,74] = input_array[:,67,74]
-    source_array[:,67,75] = input_array[:,67,75]
-    source_array[:,67,76] = input_array[:,67,76]
-    source_array[:,67,77] = input_array[:,67,77]
-    source_array[:,66,68] = input_array[:,66,68]
-    source_array[:,66,69] = input_array[:,66,69]
-    source_array[:,66,70] = input_array[:,66,70]
-    source_array[:,66,71] = input_array[:,66,71]
-    source_array[:,66,72] = input_array[:,66,72]
-    source_array[:,66,73] = input_array[:,66,73]
-    source_array[:,66,74] = input_array[:,66,74]
-    source_array[:,66,75] = input_array[:,66,75]
-    source_array[:,66,76] = input_array[:,66,76]
-    source_array[:,66,77] = input_array[:,66,77]
-    source_array[:,66,78] = input_array[:,66,78]
-    source_array[:,66,79] = input_array[:,66,79]
-    source_array[:,66,80] = input_array[:,66,80]
-    source_array[:,65,67] = input_array[:,65,67]
-    source_array[:,65,68] = input_array[:,65,68]
-    source_array[:,65,69] = input_array[:,65,69]
-    source_array[:,65,70] = input_array[:,65,70]
-    source_array[:,65,71] = input_array[:,65,71]
-    source_array[:,65,72] = input_array[:,65,72]
-    source_array[:,65,73] = input_array[:,65,73]
-    source_array[:,65,74] = input_array[:,65,74]
-    source_array[:,65,75] = input_array[:,65,75]
-    source_array[:,65,76] = input_array[:,65,76]
-    source_array[:,65,77] = input_array[:,65,77]
-    source_array[:,65,78] = input_array[:,65,78]
-    source_array[:,65,79] = input_array[:,65,79]
-    source_array[:,65,80] = input_array[:,65,80]
-    source_array[:,64,66] = input_array[:,64,66]
-    source_array[:,64,67] = input_array[:,64,67]
-    source_array[:,64,68] = input_array[:,64,68]
-    source_array[:,64,69] = input_array[:,64,69]
-    source_array[:,64,70] = input_array[:,64,70]
-    source_array[:,64,71] = input_array[:,64,71]
-    source_array[:,64,72] = input_array[:,64,72]
-    source_array[:,64,73] = input_array[:,64,73]
-    source_array[:,64,74] = input_array[:,64,74]
-    source_array[:,64,75] = input_array[:,64,75]
-    source_array[:,64,76] = input_array[:,64,76]
-    source_array[:,64,77] = input_array[:,64,77]
-    source_array[:,64,78] = input_array[:,64,78]
-    source_array[:,64,79] = input_array[:,64,79]
-    source_array[:,64,80] = input_array[:,64,80]
-    source_array[:,63,67] = input_array[:,64,67]
-    source_array[:,63,68] = input_array[:,63,68]
-    source_array[:,63,69] = input_array[:,63,69]
-    source_array[:,63,70] = input_array[:,63,70]
-    source_array[:,63,71] = input_array[:,63,71]
-    source_array[:,63,72] = input_array[:,63,72]
-    source_array[:,63,73] = input_array[:,63,73]
-    source_array[:,63,74] = input_array[:,63,74]
-    source_array[:,63,75] = input_array[:,63,75]
-    source_array[:,63,76] = input_array[:,63,76]
-    source_array[:,63,77] = input_array[:,63,77]
-    source_array[:,63,78] = input_array[:,63,78]
-    source_array[:,63,79] = input_array[:,63,79]
-    source_array[:,63,80] = input_array[:,63,80]
-    source_array[:,62,69] = input_array[:,62,69]
-    source_array[:,62,70] = input_array[:,62,70]
-    source_array[:,62,71] = input_array[:,62,71]
-    source_array[:,62,72] = input_array[:,62,72]
-    source_array[:,62,73] = input_array[:,62,73]
-    source_array[:,62,74] = input_array[:,62,74]
-    source_array[:,62,75] = input_array[:,62,75]
-    source_array[:,62,76] = input_array[:,62,76]
-    source_array[:,62,77] = input_array[:,62,77]
-    source_array[:,62,78] = input_array[:,62,78]
-    source_array[:,62,79] = input_array[:,62,79]
-    source_array[:,62,80] = input_array[:,62,80]
-    source_array[:,61,69] = input_array[:,61,69]
-    source_array[:,61,70] = input_array[:,61,70]
-    source_array[:,61,71] = input_array[:,61,71]
-    source_array[:,61,72] = input_array[:,61,72]
-    source_array[:,61,73] = input_array[:,61,73]
-    source_array[:,61,74] = input_array[:,61,74]
-    source_array[:,61,75] = input_array[:,61,75]
-    source_array[:,61,76] = input_array[:,61,76]
-    source_array[:,61,77] = input_array[:,61,77]
-    source_array[:,61,78] = input_array[:,61,78]
-    source_array[:,61,79] = input_array[:,61,79]
-    source_array[:,61,80] = input_array[:,61,80]
-    source_array[:,60,71] = input_array[:,60,71]
-    source_array[:,60,72] = input_array[:,60,72]
-    source_array[:,60,77] = input_array[:,60,77]
-    source_array[:,60,78] = input_array[:,60,78]
-    source_array[:,60,79] = input_array[:,60,79]
-
-    #upper right:
-    source_array[:,82,82] = input_array[:,82,82]
-    source_array[:,82,83] = input_array[:,82,83]
-    source_array[:,82,84] = input_array[:,82,84]
-    source_array[:,81,82] = input_array[:,81,82]
-    source_array[:,81,83] = input_array[:,81,83]
-    source_array[:,81,84] = input_array[:,81,84]
-
-    #upper right corner:
-    source_array[:,87,87] = input_array[:,87,87]
-    source_array[:,87,88] = input_array[:,87,88]
-    source_array[:,87,89] = input_array[:,87,89]
-    source_array[:,87,90] = input_array[:,87,90]
-    source_array[:,87,91] = input_array[:,87,91]
-    source_array[:,86,87] = input_array[:,86,87]
-    source_array[:,86,88] = input_array[:,86,88]
-    source_array[:,86,89] = input_array[:,86,89]
-    source_array[:,86,91] = input_array[:,86,91]
+    Returns:
+        source_rows(ndarray):       a numpy array containing the rows of the source pixels, sorted row by row.
+        source_cols(ndarray):       a numpy array containing the columns of the source pixels.
+    """
+    if isinstance(sources, np.ndarray) and sources.dtype == bool:
+        source_rows, source_cols = np.nonzero(sources)
+        return source_rows, source_cols
+    if isinstance(sources, str):
+        sources = [sources]
+    if len(sources) == 0:
+        sources = source_region_names
+    if all(isinstance(region_name, str) for region_name in sources):
+        pixels = np.concatenate([return_region_pixel_array(region_name = region_name) for region_name in sources])
+    else:
+        pixels = np.asarray(sources)
+    pixels = np.unique(pixels.astype(int).reshape((-1, 2)), axis=0)
+    return np.ascontiguousarray(pixels[:,0]), np.ascontiguousarray(pixels[:,1])
 
-    return source_array
 
+def build_source_array(input_array, longitudes, latitudes, sources = []):
+    # array of the input values at the source pixels (see source_region_pixels()) and 0 elsewhere, of shape (time, longitudes, latitudes)
+    source_rows, source_cols = source_region_pixels(sources)
+    source_array = np.zeros((input_array.shape[0], longitudes, latitudes), dtype='float32')
+    source_array[:, source_rows, source_cols] = input_array[:, source_rows, source_cols]
+    return source_array
 
-@jit
-def fill_with_source(uninitialized_array, source_array):
-    #ToDO:
-    #modify so it uses return_region_pixel_array
-    uninitialized_array[77,47] = source_array[77,47]
-    uninitialized_array[77,48] = source_array[77,48]
-    uninitialized_array[77,49] = source_array[77,49]
-    uninitialized_array[76,48] = source_array[76,48]
-    uninitialized_array[76,49] = source_array[76,49]
-    uninitialized_array[76,50] = source_array[76,50]
-    uninitialized_array[75,49] = source_array[75,49]
-    uninitialized_array[75,50] = source_array[75,50]
-    uninitialized_array[74,48] = source_array[74,48]
-    uninitialized_array[74,49] = source_array[74,49]
-    uninitialized_array[73,47] = source_array[73,47]
-    uninitialized_array[73,48] = source_array[73,48]
-    uninitialized_array[73,49] = source_array[73,49]
-    uninitialized_array[72,47] = source_array[72,47]
-    uninitialized_array[72,48] = source_array[72,48]
-    uninitialized_array[71,43] = source_array[71,43]
-    uninitialized_array[71,44] = source_array[71,44]
-    uninitialized_array[71,45] = source_array[71,45]
-    uninitialized_array[71,46] = source_array[71,46]
-    uninitialized_array[71,47] = source_array[71,47]
-    uninitialized_array[70,43] = source_array[70,43]
-    uninitialized_array[70,44] = source_array[70,44]
-    uninitialized_array[70,45] = source_array[70,45]
-    uninitialized_array[70,46] = source_array[70,46]
-    uninitialized_array[69,42] = source_array[69,42]
-    uninitialized_array[69,43] = source_array[69,43]
-    uninitialized_array[69,44] = source_array[69,44]
-    uninitialized_array[69,45] = source_array[69,45]
-    uninitialized_array[68,43] = source_array[68,43]
-    uninitialized_array[68,44] = source_array[68,44]
-    uninitialized_array[67,43] = source_array[67,43]
-
-    #right:
-    uninitialized_array[69,71] = source_array[69,71]
-    uninitialized_array[69,72] = source_array[69,72]
-    uninitialized_array[69,73] = source_array[69,73]
-    uninitialized_array[68,68] = source_array[68,68]
-    uninitialized_array[68,69] = source_array[68,69]
-    uninitialized_array[68,70] = source_array[68,70]
-    uninitialized_array[68,71] = source_array[68,71]
-    uninitialized_array[68,72] = source_array[68,72]
-    uninitialized_array[68,73] = source_array[68,73]
-    uninitialized_array[67,68] = source_array[67,68]
-    uninitialized_array[67,69] = source_array[67,69]
-    uninitialized_array[67,70] = source_array[67,70]
-    uninitialized_array[67,71] = source_array[67,71]
-    uninitialized_array[67,72] = source_array[67,72]
-    uninitialized_array[67,73] = source_array[67,73]
-    uninitialized_array[67,74] = source_array[67,74]
-    uninitialized_array[67,75] = source_array[67,75]
-    uninitialized_array[67,76] = source_array[67,76]
-    uninitialized_array[67,77] = source_array[67,77]
-    uninitialized_array[66,68] = source_array[66,68]
-    uninitialized_array[66,69] = source_array[66,69]
-    uninitialized_array[66,70] = source_array[66,70]
-    uninitialized_array[66,71] = source_array[66,71]
-    uninitialized_array[66,72] = source_array[66,72]
-    uninitialized_array[66,73] = source_array[66,73]
-    uninitialized_array[66,74] = source_array[66,74]
-    uninitialized_array[66,75] = source_array[66,75]
-    uninitialized_array[66,76] = source_array[66,76]
-    uninitialized_array[66,77] = source_array[66,77]
-    uninitialized_array[66,78] = source_array[66,78]
-    uninitialized_array[66,79] = source_array[66,79]
-    uninitialized_array[66,80] = source_array[66,80]
-    uninitialized_array[65,67] = source_array[65,67]
-    uninitialized_array[65,68] = source_array[65,68]
-    uninitialized_array[65,69] = source_array[65,69]
-    uninitialized_array[65,70] = source_array[65,70]
-    uninitialized_array[65,71] = source_array[65,71]
-    uninitialized_array[65,72] = source_array[65,72]
-    uninitialized_array[65,73] = source_array[65,73]
-    uninitialized_array[65,74] = source_array[65,74]
-    uninitialized_array[65,75] = source_array[65,75]
-    uninitialized_array[65,76] = source_array[65,76]
-    uninitialized_array[65,77] = source_array[65,77]
-    uninitialized_array[65,78] = source_array[65,78]
-    uninitialized_array[65,79] = source_array[65,79]
-    uninitialized_array[65,80] = source_array[65,80]
-    uninitialized_array[64,66] = source_array[64,66]
-    uninitialized_array[64,67] = source_array[64,67]
-    uninitialized_array[64,68] = source_array[64,68]
-    uninitialized_array[64,69] = source_array[64,69]
-    uninitialized_array[64,70] = source_array[64,70]
-    uninitialized_array[64,71] = source_array[64,71]
-    uninitialized_array[64,72] = source_array[64,72]
-    uninitialized_array[64,73] = source_array[64,73]
-    uninitialized_array[64,74] = source_array[64,74]
-    uninitialized_array[64,75] = source_array[64,75]
-    uninitialized_array[64,76] = source_array[64,76]
-    uninitialized_array[64,77] = source_array[64,77]
-    uninitialized_array[64,78] = source_array[64,78]
-    uninitialized_array[64,79] = source_array[64,79]
-    uninitialized_array[64,80] = source_array[64,80]
-    uninitialized_array[63,67] = source_array[64,67]
-    uninitialized_array[63,68] = source_array[63,68]
-    uninitialized_array[63,69] = source_array[63,69]
-    uninitialized_array[63,70] = source_array[63,70]
-    uninitialized_array[63,71] = source_array[63,71]
-    uninitialized_array[63,72] = source_array[63,72]
-    uninitialized_array[63,73] = source_array[63,73]
-    uninitialized_array[63,74] = source_array[63,74]
-    uninitialized_array[63,75] = source_array[63,75]
-    uninitialized_array[63,76] = source_array[63,76]
-    uninitialized_array[63,77] = source_array[63,77]
-    uninitialized_array[63,78] = source_array[63,78]
-    uninitialized_array[63,79] = source_array[63,79]
-    uninitialized_array[63,80] = source_array[63,80]
-    uninitialized_array[62,69] = source_array[62,69]
-    uninitialized_array[62,70] = source_array[62,70]
-    uninitialized_array[62,71] = source_array[62,71]
-    uninitialized_array[62,72] = source_array[62,72]
-    uninitialized_array[62,73] = source_array[62,73]
-    uninitialized_array[62,74] = source_array[62,74]
-    uninitialized_array[62,75] = source_array[62,75]
-    uninitialized_array[62,76] = source_array[62,76]
-    uninitialized_array[62,77] = source_array[62,77]
-    uninitialized_array[62,78] = source_array[62,78]
-    uninitialized_array[62,79] = source_array[62,79]
-    uninitialized_array[62,80] = source_array[62,80]
-    uninitialized_array[61,69] = source_array[61,69]
-    uninitialized_array[61,70] = source_array[61,70]
-    uninitialized_array[61,71] = source_array[61,71]
-    uninitialized_array[61,72] = source_array[61,72]
-    uninitialized_array[61,73] = source_array[61,73]
-    uninitialized_array[61,74] = source_array[61,74]
-    uninitialized_array[61,75] = source_array[61,75]
-    uninitialized_array[61,76] = source_array[61,76]
-    uninitialized_array[61,77] = source_array[61,77]
-    uninitialized_array[61,78] = source_array[61,78]
-    uninitialized_array[61,79] = source_array[61,79]
-    uninitialized_array[61,80] = source_array[61,80]
-    uninitialized_array[60,71] = source_array[60,71]
-    uninitialized_array[60,72] = source_array[60,72]
-    uninitialized_array[60,77] = source_array[60,77]
-    uninitialized_array[60,78] = source_array[60,78]
-    uninitialized_array[60,79] = source_array[60,79]
-
-    #upper right:
-    uninitialized_array[82,82] = source_array[82,82]
-    uninitialized_array[82,83] = source_array[82,83]
-    uninitialized_array[82,84] = source_array[82,84]
-    uninitialized_array[81,82] = source_array[81,82]
-    uninitialized_array[81,83] = source_array[81,83]
-    uninitialized_array[81,84] = source_array[81,84]
-
-    #upper right corner:
-    uninitialized_array[87,87] = source_array[87,87]
-    uninitialized_array[87,88] = source_array[87,88]
-    uninitialized_array[87,89] = source_array[87,89]
-    uninitialized_array[87,90] = source_array[87,90]
-    uninitialized_array[87,91] = source_array[87,91]
-    uninitialized_array[86,87] = source_array[86,87]
-    uninitialized_array[86,88] = source_array[86,88]
-    uninitialized_array[86,89] = source_array[86,89]
-    uninitialized_array[86,91] = source_array[86,91]
 
+def fill_with_source(uninitialized_array, source_array, sources = []):
+    # sets the source pixels (see source_region_pixels()) of a (y, x) array to the values of the source array
+    source_rows, source_cols = source_region_pixels(sources)
+    uninitialized_array[source_rows, source_cols] = source_array[source_rows, source_cols]
     return uninitialized_array
 
+
+def source_time_series(input_array, source_rows, source_cols, datatype = 'float32', block = 8760):
+    # (time, n_source) values of the source pixels of a (time, y, x) numpy array, numpy memmap or HDF5 dataset,
+    # read in blocks of time steps so only the source pixels are ever held in memory
+    source_values = np.zeros((input_array.shape[0], source_rows.shape[0]), dtype=datatype)
+    for first in range(0, input_array.shape[0], block):
+        source_values[first:first+block] = read_time_block(input_array, first, first+block)[:, source_rows, source_cols]
+    return source_values
+
 @jit
-def advection_diffusion_fd(num_time_steps, num_x_steps, num_y_steps, min_time, max_time,
-                           source_input_latitudes, source_input_longitudes, diff,
-                           source_input_array, wx,  wy, datatype = 'float32'):
+def advection_diffusion_fd_loop(f_sol, first_time, min_time, max_time,
+                                xwind_mtpl, ywind_mtpl, diff,
+                                source_rows, source_cols, source_values, wx,  wy, f_sol_current):
     """
-    Returns dust field for 2D advection-diffusion and given input array
+    Computes the dust field for 2D advection-diffusion and given input array, updating the field pixel by pixel ('loop' engine).
+    The time steps min_time+1 to max_time-1 are written to the block f_sol, whose first row is the time step first_time, starting from the field f_sol_current.
+    xwind_mtpl and ywind_mtpl are the wind multiplier tables of GridMetrics, source_values the (time, n_source) input values of the source pixels,
+    wx and wy the winds of the time steps min_time to max_time-1 only. Returns the field to continue the next block with
     """
     dt = np.float32(0.5)
     dx = 1
     dy = 1
-
-
-
-    f_sol = np.zeros((num_time_steps, num_y_steps, num_x_steps), dtype=datatype)
-
-    source_array = build_source_array(source_input_array, 91, 105)
-   
-    # ywind mulitplier: *3600 (für h) / 55597.46332227382 =  0.06475115562615506 = 0.06475
-    # xwind mulitplier: *3600 (für h) / 65305.56055924967 =  0.05512547429607979 = 0.05513
-
-    ywind_mtpl = np.float32(0.03237557781307753)
-    xwind_mtpl = np.float32(0.027562737148039897)
-
-    f_sol_current = np.zeros((num_y_steps, num_x_steps), dtype=datatype)
+    num_y_steps = f_sol.shape[1]
+    num_x_steps = f_sol.shape[2]
 
     #loop
     for n in range(min_time,max_time-1):
         # if first:
-        f_sol_current = fill_with_source(f_sol_current, source_array[n,:,:])
-        f_sol_first = np.zeros((num_y_steps, num_x_steps), dtype=datatype)
+        for k in range(source_rows.shape[0]):
+            f_sol_current[source_rows[k],source_cols[k]] = source_values[n,k]
+        f_sol_first = np.zeros((num_y_steps, num_x_steps), dtype=f_sol.dtype)
         for j in range(1,num_y_steps-1):
             for i in range(1,num_x_steps-1):
                 
                 # if ( (f_sol[n,j,i+1] == 0) and ( f_sol[n,j,i-1] == 0) and (f_sol[n,j+1,i] == 0) and (f_sol[n,j-1,i] == 0) ):
                 #     continue
 
-                #taking 1800 for half hour as we are using half hour time steps
-                xwind_mtpl = np.float32(1800/(distance2(source_input_latitudes[j], source_input_longitudes[i], source_input_latitudes[j], source_input_longitudes[i+1])*1000))
-
-                wx0 = ((wx[n,j,i] * xwind_mtpl))
-                wy0 = ((wy[n,j,i] * ywind_mtpl))
+                #the multipliers convert the wind in m/s to pixels per half hour time step
+                wx0 = ((wx[n-min_time,j,i] * xwind_mtpl[j,i]))
+                wy0 = ((wy[n-min_time,j,i] * ywind_mtpl[j,i]))
 
                 #solution for time n
                 f_sol_first[j,i] = ((dt * diff*(((f_sol_current[j,i+1]-2*f_sol_current[j,i]+f_sol_current[j,i-1])/(dx**2))
@@ -2472,8 +3980,9 @@ def advection_diffusion_fd(num_time_steps, num_x_steps, num_y_steps, min_time, m
         #between n and n+1
         f_sol_n = f_sol_current
         #fill with interpolation data
-        f_sol_current = fill_with_source(f_sol_current, ((source_array[n,:,:] + source_array[(n+1),:,:])/2))
-        f_sol_second = np.zeros((num_y_steps, num_x_steps), dtype=datatype)
+        for k in range(source_rows.shape[0]):
+            f_sol_current[source_rows[k],source_cols[k]] = (source_values[n,k] + source_values[(n+1),k])/2
+        f_sol_second = np.zeros((num_y_steps, num_x_steps), dtype=f_sol.dtype)
 
         for j in range(1,num_y_steps-1):
             for i in range(1,num_x_steps-1):
@@ -2481,9 +3990,9 @@ def advection_diffusion_fd(num_time_steps, num_x_steps, num_y_steps, min_time, m
                 #wind:
                 # to calculate half hour value from hourly data, we take the mean of the wind data from half hour before and half hour after 
                 
-                wx_mean = ((wx[n,j,i] + wx[(n+1),j,i]) / 2) * xwind_mtpl
+                wx_mean = ((wx[n-min_time,j,i] + wx[(n+1-min_time),j,i]) / 2) * xwind_mtpl[j,i]
 
-                wy_mean = ((wy[n,j,i] + wy[(n+1),j,i]) / 2) * ywind_mtpl
+                wy_mean = ((wy[n-min_time,j,i] + wy[(n+1-min_time),j,i]) / 2) * ywind_mtpl[j,i]
 
                 f_sol_second[j,i] = ((dt * diff*(((f_sol_current[j,i+1]-2*f_sol_current[j,i]+f_sol_current[j,i-1])/(dx**2))
                 + ((f_sol_current[j+1,i]-2*f_sol_current[j,i]+f_sol_current[j-1,i])/(dy**2)))
@@ -2496,12 +4005,495 @@ def advection_diffusion_fd(num_time_steps, num_x_steps, num_y_steps, min_time, m
 
         f_sol_current = f_sol_second
 
-        f_sol[n+1] = ((f_sol_second + f_sol_first) / 2)
+        f_sol[n+1-first_time] = ((f_sol_second + f_sol_first) / 2)
         
 
-        # f_sol[n+1,:,:] = fill_with_source(f_sol[n+1,:,:], source_array[(n+1),:,:])
 
-    return f_sol
+    return f_sol_current
+
+
+class GridMetrics:
+    """
+    GridMetrics holds the metric factors of a latitude/longitude grid that the advection diffusion solver needs, computed once for the
+    grid instead of a haversine distance for every pixel and time step. On a regular grid dx only changes with the latitude row and dy is constant,
+    the tables are kept per pixel so irregular grids work as well.
+
+    Parameters:
+        latitudes(ndarray):         a numpy array (y) containing the latitudes of the pixel centers in degrees.
+        longitudes(ndarray):        a numpy array (x) containing the longitudes of the pixel centers in degrees.
+        time_step(float):           a float for the seconds of a solver time step. This is set to 1800 (half hour time steps) by default.
+
+    Attributes:
+        dx(ndarray):                a float64 numpy array (y, x) of the distances in m to the next pixel to the east (of the last column to the west).
+        dy(ndarray):                a float64 numpy array (y, x) of the distances in m to the next pixel to the north (of the last row to the south).
+        cell_area(ndarray):         a float64 numpy array (y, x) of the areas of the pixels in m^2 on the sphere, the pixel edges lie halfway between the centers.
+        xwind_mtpl(ndarray):        a float32 numpy array (y, x) of time_step / dx, which converts an eastward wind in m/s to pixels per time step.
+        ywind_mtpl(ndarray):        a float32 numpy array (y, x) of time_step / dy, which converts a northward wind in m/s to pixels per time step.
+    """
+
+    def __init__(self, latitudes, longitudes, time_step = 1800):
+        self.latitudes = np.asarray(np.ma.getdata(latitudes), dtype='float64')
+        self.longitudes = np.asarray(np.ma.getdata(longitudes), dtype='float64')
+        self.time_step = time_step
+        self.shape = (self.latitudes.shape[0], self.longitudes.shape[0])
+        if min(self.shape) < 2:
+            raise ValueError(f'grid metrics need at least 2 latitudes and longitudes, got {self.shape}')
+
+        lats, lons = np.meshgrid(self.latitudes, self.longitudes, indexing='ij')
+        # neighbours to the east and north, the last column and row take their neighbours to the west and south
+        east = np.append(np.arange(1, self.shape[1]), self.shape[1] - 2)
+        north = np.append(np.arange(1, self.shape[0]), self.shape[0] - 2)
+        self.dx = distance2(lats, lons, lats, lons[:, east]) * 1000
+        self.dy = distance2(lats, lons, lats[north], lons) * 1000
+
+        # area between the edges halfway between the pixel centers, R = 6371 km as in distance2()
+        lat_edges = np.radians(np.clip(self.grid_edges(self.latitudes), -90, 90))
+        lon_edges = np.radians(self.grid_edges(self.longitudes))
+        self.cell_area = np.outer(np.abs(np.diff(np.sin(lat_edges))), np.abs(np.diff(lon_edges))) * 6371000.**2
+
+        self.xwind_mtpl = (time_step / self.dx).astype('float32')
+        self.ywind_mtpl = (time_step / self.dy).astype('float32')
+
+    @staticmethod
+    def grid_edges(centers):
+        # edges halfway between the centers, the outer edges half a spacing beyond the first and last center
+        edges = (centers[1:] + centers[:-1]) / 2
+        return np.concatenate([[2*centers[0] - edges[0]], edges, [2*centers[-1] - edges[-1]]])
+
+
+def advection_diffusion_step(f_sol_current, wx_step, wy_step, dt, diff):
+    # one explicit half time step on the inner pixels as whole array slices, the boundary stays 0.
+    # the terms are evaluated in float64 in the order of the scalar loop (numba promotes the float32 values there), so both engines agree bitwise
+    f_sol = f_sol_current.astype('float64')
+    f_sol_center = f_sol[1:-1,1:-1]
+    diffusion = (np.float64(dt) * diff) * ((f_sol[1:-1,2:] - 2*f_sol_center + f_sol[1:-1,:-2]) + (f_sol[2:,1:-1] - 2*f_sol_center + f_sol[:-2,1:-1]))
+    advection_x = (wx_step * np.float64(dt/2)) * (f_sol_current[1:-1,2:] - f_sol_current[1:-1,:-2])
+    advection_y = (wy_step * np.float64(dt/2)) * (f_sol_current[2:,1:-1] - f_sol_current[:-2,1:-1])
+
+    f_sol_next = np.zeros(f_sol_current.shape, dtype=f_sol_current.dtype)
+    f_sol_next[1:-1,1:-1] = diffusion - advection_x - advection_y + f_sol_center
+    #set erratic values to 0
+    np.maximum(f_sol_next, 0, out=f_sol_next)
+    return f_sol_next
+
+
+def advection_diffusion_fd_numpy(f_sol, first_time, min_time, max_time,
+                                 xwind_mtpl, ywind_mtpl, diff,
+                                 source_rows, source_cols, source_values, wx, wy, f_sol_current):
+    # advection_diffusion_fd_loop() with every half step as whole array arithmetic ('numpy' engine), the sources are injected
+    # with a single fancy indexed assignment
+    dt = np.float32(0.5)
+    xwind_mtpl = xwind_mtpl[1:-1,1:-1]
+    ywind_mtpl = ywind_mtpl[1:-1,1:-1]
+
+    for n in range(min_time,max_time-1):
+        f_sol_current[source_rows, source_cols] = source_values[n]
+        f_sol_first = advection_diffusion_step(f_sol_current, (wx[n-min_time,1:-1,1:-1] * xwind_mtpl).astype('float64'),
+                                               (wy[n-min_time,1:-1,1:-1] * ywind_mtpl).astype('float64'), dt, diff)
+        f_sol_current = f_sol_first
+
+        #the interpolated source values are filled into f_sol_first as well, as in the loop engine
+        f_sol_current[source_rows, source_cols] = (source_values[n] + source_values[n+1])/2
+        wx_mean = (wx[n-min_time,1:-1,1:-1] + wx[n+1-min_time,1:-1,1:-1]).astype('float64')/2 * xwind_mtpl
+        wy_mean = (wy[n-min_time,1:-1,1:-1] + wy[n+1-min_time,1:-1,1:-1]).astype('float64')/2 * ywind_mtpl
+        f_sol_second = advection_diffusion_step(f_sol_current, wx_mean, wy_mean, dt, diff)
+        f_sol_current = f_sol_second
+
+        f_sol[n+1-first_time] = ((f_sol_second + f_sol_first) / 2)
+
+    return f_sol_current
+
+
+@njit(parallel=True, cache=True)
+def advection_diffusion_fd_parallel(f_sol, first_time, min_time, max_time,
+                                    xwind_mtpl, ywind_mtpl, diff,
+                                    source_rows, source_cols, source_values, wx, wy, f_sol_current):
+    # advection_diffusion_fd_loop() compiled with numba parallel, the rows of every half step are split over the cores ('parallel' engine).
+    # the compiled function is cached next to this file, so only the first run compiles it
+    dt = np.float32(0.5)
+    dx = 1
+    dy = 1
+    num_y_steps = f_sol.shape[1]
+    num_x_steps = f_sol.shape[2]
+
+    for n in range(min_time,max_time-1):
+        for k in range(source_rows.shape[0]):
+            f_sol_current[source_rows[k],source_cols[k]] = source_values[n,k]
+        f_sol_first = np.zeros((num_y_steps, num_x_steps), dtype=f_sol.dtype)
+        for j in prange(1,num_y_steps-1):
+            for i in range(1,num_x_steps-1):
+                wx0 = ((wx[n-min_time,j,i] * xwind_mtpl[j,i]))
+                wy0 = ((wy[n-min_time,j,i] * ywind_mtpl[j,i]))
+
+                f_sol_first[j,i] = ((dt * diff*(((f_sol_current[j,i+1]-2*f_sol_current[j,i]+f_sol_current[j,i-1])/(dx**2))
+                + ((f_sol_current[j+1,i]-2*f_sol_current[j,i]+f_sol_current[j-1,i])/(dy**2)))
+                - ((wx0) * (dt/(2*dx)) * (f_sol_current[j,i+1]-f_sol_current[j,i-1]))
+                - ((wy0) * (dt/(2*dy)) * (f_sol_current[j+1,i]-f_sol_current[j-1,i]))
+                + f_sol_current[j,i]))
+
+                if (f_sol_first[j,i] < 0):
+                    f_sol_first[j,i] = 0
+
+        f_sol_current = f_sol_first
+
+        for k in range(source_rows.shape[0]):
+            f_sol_current[source_rows[k],source_cols[k]] = (source_values[n,k] + source_values[(n+1),k])/2
+        f_sol_second = np.zeros((num_y_steps, num_x_steps), dtype=f_sol.dtype)
+        for j in prange(1,num_y_steps-1):
+            for i in range(1,num_x_steps-1):
+                wx_mean = ((wx[n-min_time,j,i] + wx[(n+1-min_time),j,i]) / 2) * xwind_mtpl[j,i]
+
+                wy_mean = ((wy[n-min_time,j,i] + wy[(n+1-min_time),j,i]) / 2) * ywind_mtpl[j,i]
+
+                f_sol_second[j,i] = ((dt * diff*(((f_sol_current[j,i+1]-2*f_sol_current[j,i]+f_sol_current[j,i-1])/(dx**2))
+                + ((f_sol_current[j+1,i]-2*f_sol_current[j,i]+f_sol_current[j-1,i])/(dy**2)))
+                - ((wx_mean) * (dt/(2*dx)) * (f_sol_current[j,i+1]-f_sol_current[j,i-1]))
+                - ((wy_mean) * (dt/(2*dy)) * (f_sol_current[j+1,i]-f_sol_current[j-1,i]))
+                + f_sol_current[j,i]))
+
+                if (f_sol_second[j,i] < 0):
+                    f_sol_second[j,i] = 0
+
+        f_sol_current = f_sol_second
+
+        for j in prange(num_y_steps):
+            for i in range(num_x_steps):
+                f_sol[n+1-first_time,j,i] = (f_sol_second[j,i] + f_sol_first[j,i]) / 2
+
+    return f_sol_current
+
+
+# engines of advection_diffusion_fd(), all compute the same dust field
+advection_diffusion_engines = {'loop': advection_diffusion_fd_loop, 'numpy': advection_diffusion_fd_numpy, 'parallel': advection_diffusion_fd_parallel}
+
+
+def open_sink_output(shape, datatype = 'float32', output_file = '', append = False, chunk_layout = 'time'):
+    # returns the output array of a sink and whether it is the output file of an earlier run, which is reopened if append.
+    # a HDF5 store left unreadable by a run killed while writing cannot be resumed, a .npy memmap is always readable
+    if append and output_file:
+        try:
+            data_array = open_output_array(shape, datatype, output_file, chunk_layout)
+        except OSError as error:
+            raise ValueError(f'the output {output_file} of the earlier run is unreadable ({error}), remove the checkpoint to start over') from error
+        if data_array is not None:
+            return data_array, True
+    return create_output_array(shape, datatype, output_file, chunk_layout), False
+
+
+class HourlyOutputSink:
+    """
+    HourlyOutputSink is an output sink of advection_diffusion_fd() that writes every block of the simulated dust field to an array,
+    either held in memory or disk-backed as .npy memmap or chunked HDF5 store (see create_output_array()).
+    A run that is resumed from checkpoints should write a .npy memmap, a HDF5 store can be left unreadable if the run is killed while writing it.
+
+    Parameters:
+        shape(tuple):               a tuple (time, y, x) for the shape of the dust field.
+        datatype(string):           a string for the datatype of the array. This is set to 'float32' by default.
+        output_file(string):        a string of a .npy or .h5 file path relative to the parent directory. This is set to '' (numpy array in memory) by default.
+        append(bool):               a bool whether the output file of an earlier run is opened to resume it from a checkpoint. This is set to False by default.
+    """
+
+    def __init__(self, shape, datatype = 'float32', output_file = '', append = False):
+        self.output_file = output_file
+        self.data, self.reopened = open_sink_output(shape, datatype, output_file, append)
+
+    def write(self, first, values):
+        if isinstance(self.data, h5py.Dataset):
+            with hdf5_lock:
+                self.data[first:first+values.shape[0]] = values
+        else:
+            self.data[first:first+values.shape[0]] = values
+
+    def checkpoint(self):
+        # the time steps written so far are on disk, nothing else has to be kept
+        if self.output_file:
+            flush_output_array(self.data)
+        return {}
+
+    def restore(self, state):
+        if not self.reopened:
+            raise ValueError('an hourly output sink resumed from a checkpoint needs the output file of the earlier run opened with append = True')
+
+    def close(self):
+        # a HDF5 store is closed after flushing, the .npy memmap stays readable
+        if self.output_file:
+            flush_output_array(self.data)
+        if isinstance(self.data, h5py.Dataset):
+            self.data.file.close()
+
+
+class DailyMeanSink:
+    """
+    DailyMeanSink is an output sink of advection_diffusion_fd() that reduces the simulated hourly dust field to daily means while the simulation runs,
+    with the same values as hourly_data_to_daily_mean(). Only the hours of an incomplete day are kept between two blocks.
+    A pixel-chunked HDF5 store is written to its .npy staging file, which stays resumable, and is copied into the store when the sink is closed.
+
+    Parameters:
+        num_time_steps(int):        an int for the number of hourly time steps of the dust field.
+        grid_shape(tuple):          a tuple (y, x) for the shape of the grid.
+        datatype(string):           a string for the datatype of the daily means. This is set to 'float32' by default.
+        output_file(string):        a string of a .npy or .h5 file path relative to the parent directory. This is set to '' (numpy array in memory) by default.
+        steps(int):                 an int for the number of time steps per day. This is set to 24 by default.
+        append(bool):               a bool whether the output file of an earlier run is opened to resume it from a checkpoint. This is set to False by default.
+        chunk_layout(string):       a string for the chunk layout of a .h5 output_file, either 'time' or 'pixel'. This is set to 'time' by default.
+    """
+
+    def __init__(self, num_time_steps, grid_shape, datatype = 'float32', output_file = '', steps = 24, append = False, chunk_layout = 'time'):
+        self.output_file = output_file
+        self.steps = steps
+        self.chunk_layout = chunk_layout
+        self.data, self.reopened = open_sink_output((-(-num_time_steps // steps),) + tuple(grid_shape), datatype, output_file, append, chunk_layout)
+        self.next_time = 0
+        self.pending = np.zeros((0,) + tuple(grid_shape), dtype=datatype)
+
+    def write(self, first, values):
+        if first != self.next_time:
+            raise ValueError(f'daily mean sink expects time step {self.next_time}, got {first}')
+        self.next_time = first + values.shape[0]
+        # the pending hours start a day, so the complete days are reduced as in resample_time_block()
+        first_day = (first - self.pending.shape[0]) // self.steps
+        values = np.concatenate([self.pending, values])
+        num_days = values.shape[0] // self.steps
+        if num_days:
+            days = values[:num_days*self.steps].reshape((num_days, self.steps) + values.shape[1:])
+            self.store(first_day, days.mean(axis=1, dtype='float64'))
+        self.pending = values[num_days*self.steps:].copy()
+
+    def store(self, first_day, daily_means):
+        if isinstance(self.data, h5py.Dataset):
+            with hdf5_lock:
+                self.data[first_day:first_day+daily_means.shape[0]] = daily_means
+        else:
+            self.data[first_day:first_day+daily_means.shape[0]] = daily_means
+
+    def checkpoint(self):
+        # the complete days are on disk, the hours of the current day are kept in the checkpoint
+        if self.output_file:
+            flush_output_array(self.data)
+        return {'next_time': self.next_time, 'pending': self.pending}
+
+    def restore(self, state):
+        if not self.reopened:
+            raise ValueError('a daily mean sink resumed from a checkpoint needs the output file of the earlier run opened with append = True')
+        self.next_time = int(state['next_time'])
+        self.pending = np.asarray(state['pending'], dtype=self.pending.dtype)
+
+    def close(self):
+        # a last incomplete day is averaged over its hours
+        if self.pending.shape[0]:
+            self.store(self.next_time // self.steps, self.pending.mean(axis=0, dtype='float64')[np.newaxis])
+            self.pending = self.pending[:0]
+        if self.output_file:
+            flush_output_array(self.data)
+        if staged_output(self.output_file, self.chunk_layout):
+            self.data = None
+            self.data = finish_staged_array(self.output_file)
+        if isinstance(self.data, h5py.Dataset):
+            self.data.file.close()
+
+
+class SeasonalMeanSink:
+    """
+    SeasonalMeanSink is an output sink of advection_diffusion_fd() that sums the simulated dust field over the time steps of every season
+    while the simulation runs, the means of the seasons are set as the dict means when the sink is closed.
+
+    Parameters:
+        time_index(MerraTimeIndex): the time index of the input arrays of the simulation.
+        seasons(bool/list/dict):    True (wet and dry season), a list of names of merra_seasons or a dict of names and season definitions.
+                                    This is set to True by default.
+        frequency(string):          a string for the frequency of the dust field. This is set to 'hourly' by default.
+        datatype(string):           a string for the datatype of the means. This is set to 'float32' by default.
+    """
+
+    def __init__(self, time_index, seasons = True, frequency = 'hourly', datatype = 'float32'):
+        self.masks = {name: time_index.mask(definition, frequency) for name, definition in season_definitions(seasons).items()}
+        self.datatype = datatype
+        self.sums = {}
+        self.counts = {name: 0 for name in self.masks}
+        self.means = {}
+
+    def write(self, first, values):
+        for name, mask in self.masks.items():
+            in_season = mask[first:first+values.shape[0]]
+            if name not in self.sums:
+                self.sums[name] = np.zeros(values.shape[1:], dtype='float64')
+            if in_season.any():
+                self.sums[name] += values[in_season].sum(axis=0, dtype='float64')
+                self.counts[name] += int(in_season.sum())
+
+    def checkpoint(self):
+        state = {}
+        for name in self.sums:
+            state[name + '_sum'] = self.sums[name]
+            state[name + '_count'] = self.counts[name]
+        return state
+
+    def restore(self, state):
+        for name in self.masks:
+            if name + '_sum' in state:
+                self.sums[name] = np.array(state[name + '_sum'], dtype='float64')
+                self.counts[name] = int(state[name + '_count'])
+
+    def close(self):
+        for name, total in self.sums.items():
+            self.means[name] = (total / max(self.counts[name], 1)).astype(self.datatype)
+
+
+def write_output_sinks(sinks, first, values):
+    # passes a block of time steps to every output sink, plain callables are called with the first time step and the block
+    for sink in sinks:
+        if hasattr(sink, 'write'):
+            sink.write(first, values)
+        else:
+            sink(first, values)
+
+
+def close_output_sinks(sinks):
+    for sink in sinks:
+        if hasattr(sink, 'close'):
+            sink.close()
+
+
+def simulation_input_fingerprint(source_values, wx, wy, grid_metrics, samples = 64):
+    # md5 of the source values, the grid metrics and about 64 time steps of the winds spread over the run, a checkpoint is only resumed
+    # with the inputs it was written for. The winds are sampled, hashing the complete (time, y, x) arrays would take longer than a block of the simulation
+    fingerprint = hashlib.md5(f'{wx.shape}-{wy.shape}-{wx.dtype}-{wy.dtype}'.encode())
+    fingerprint.update(np.ascontiguousarray(source_values).tobytes())
+    fingerprint.update(grid_metrics.xwind_mtpl.tobytes())
+    fingerprint.update(grid_metrics.ywind_mtpl.tobytes())
+    for n in np.unique(np.linspace(0, wx.shape[0] - 1, samples).astype('int64')):
+        fingerprint.update(np.ascontiguousarray(wx[n]).tobytes())
+        fingerprint.update(np.ascontiguousarray(wy[n]).tobytes())
+    return fingerprint.hexdigest()
+
+
+def save_simulation_checkpoint(checkpoint_file, f_sol_current, next_time, parameters, sinks):
+    # saves the current field, the next time step, the parameters of the run and the state of the sinks to a .npz file relative to the parent directory.
+    # the sinks flush their outputs before the checkpoint is written, so the outputs on disk always hold the time steps before the checkpoint.
+    # the file is written next to the checkpoint and renamed, so a run killed while saving keeps the previous checkpoint
+    state = dict(parameters)
+    state['f_sol_current'] = f_sol_current
+    state['next_time'] = next_time
+    for idx, sink in enumerate(sinks):
+        if hasattr(sink, 'checkpoint'):
+            for key, value in sink.checkpoint().items():
+                state[f'sink_{idx}_{key}'] = value
+    with open(parent_directory + checkpoint_file + '.tmp', 'wb') as checkpoint:
+        np.savez(checkpoint, **state)
+    os.replace(parent_directory + checkpoint_file + '.tmp', parent_directory + checkpoint_file)
+
+
+def load_simulation_checkpoint(checkpoint_file, parameters, sinks):
+    # returns the field and the next time step of a checkpoint saved with save_simulation_checkpoint() and restores the state of the sinks.
+    # the checkpoint has to be written by a run with the same parameters and inputs
+    stored = np.load(parent_directory + checkpoint_file)
+    for key, value in parameters.items():
+        if str(stored[key]) != str(value):
+            raise ValueError(f'checkpoint {checkpoint_file} was written with {key} = {stored[key]}, not {value}')
+    for idx, sink in enumerate(sinks):
+        if hasattr(sink, 'restore'):
+            prefix = f'sink_{idx}_'
+            sink.restore({key[len(prefix):]: stored[key] for key in stored.files if key.startswith(prefix)})
+    return stored['f_sol_current'], int(stored['next_time'])
+
+
+def advection_diffusion_fd(num_time_steps, num_x_steps, num_y_steps, min_time, max_time,
+                           source_input_latitudes, source_input_longitudes, diff,
+                           source_input_array, wx, wy, datatype = 'float32', engine = 'loop', grid_metrics = None, sources = [],
+                           sinks = None, block = 720, checkpoint_file = '', checkpoint_every = 8640, resume_from = ''):
+    """
+    advection_diffusion_fd() simulates the dust field of the 2D advection-diffusion model with two explicit half hour steps per hourly
+    time step, the source pixels are refilled with the input values before every half step. The winds are scaled to pixels per
+    half hour with the wind multiplier tables of the grid metrics.
+    The dust field is computed in blocks of time steps that are streamed to the output sinks, so only a block and the current field are held in memory.
+
+    Parameters:
+        num_time_steps(int):        an int for the number of time steps of the dust field.
+        num_x_steps(int):           an int for the number of x steps (longitudes) of the grid.
+        num_y_steps(int):           an int for the number of y steps (latitudes) of the grid.
+        min_time(int):              an int for the first simulated time step.
+        max_time(int):              an int for the time step after the last simulated one.
+        source_input_latitudes(ndarray): a numpy array containing the latitudes of the grid.
+        source_input_longitudes(ndarray): a numpy array containing the longitudes of the grid.
+        diff(float):                a float for the diffusion coefficient.
+        source_input_array(ndarray): a numpy array (time, y, x) (or numpy memmap) containing the dust values, only the source pixels are read.
+        wx(ndarray):                a numpy array (time, y, x) (or numpy memmap) containing the eastward wind, only the time steps of the current block are read.
+        wy(ndarray):                a numpy array (time, y, x) (or numpy memmap) containing the northward wind, only the time steps of the current block are read.
+        datatype(string):           a string for the datatype of the dust field. This is set to 'float32' by default.
+        engine(string):             a string for the engine, 'loop' (pixel by pixel), 'numpy' (whole array slices) or 'parallel'
+                                    (numba prange over the rows). The engines compute identical dust fields. This is set to 'loop' by default.
+        grid_metrics(GridMetrics):  the metric factors of the grid with 1800 s time steps. This is set to None (computed from the latitudes and longitudes) by default.
+        sources(list):              the source pixels as region names, (n, 2) pixel array or (y, x) mask, see source_region_pixels().
+                                    This is set to [] (source_region_names) by default.
+        sinks(list):                a list of output sinks the blocks (time, y, x) of the dust field are passed to in order, e.g. HourlyOutputSink,
+                                    DailyMeanSink, SeasonalMeanSink or any function called with the first time step and the block.
+                                    The sinks are closed at the end of the simulation. This is set to None (dust field returned in memory) by default.
+        block(int):                 an int for the number of time steps per block, a multiple of 24 keeps the blocks aligned to days. This is set to 720 by default.
+        checkpoint_file(string):    a string of a .npz file path relative to the parent directory the current field, time step, parameters, input fingerprint
+                                    and sink states are saved to after the block every checkpoint_every time steps. The file is removed once the simulation
+                                    is complete. This is set to '' (no checkpoints) by default.
+        checkpoint_every(int):      an int for the minimum number of time steps between two checkpoints, checkpoints are only saved after a block so a
+                                    multiple of block keeps them evenly spaced. This is set to 8640 (12 blocks of 720) by default.
+        resume_from(string):        a string of a .npz checkpoint file path relative to the parent directory the simulation is continued from,
+                                    the sinks have to be opened with append = True. This is set to '' (simulation from the start) by default.
+
+    Returns:
+        f_sol(ndarray):             a numpy array (time, y, x) containing the simulated dust field, or None if the dust field is streamed to sinks.
+    """
+    if engine not in advection_diffusion_engines:
+        raise ValueError(f'unknown advection diffusion engine {engine}, use one of {list(advection_diffusion_engines)}')
+    if grid_metrics is None:
+        grid_metrics = GridMetrics(source_input_latitudes, source_input_longitudes)
+    if grid_metrics.shape != (num_y_steps, num_x_steps):
+        raise ValueError(f'grid metrics of shape {grid_metrics.shape} do not match the grid ({num_y_steps}, {num_x_steps})')
+
+    # only the (time, n_source) values of the source pixels are read from the input
+    source_rows, source_cols = source_region_pixels(sources)
+    source_values = source_time_series(source_input_array, source_rows, source_cols)
+
+    if sinks is None:
+        if resume_from:
+            raise ValueError('resuming from a checkpoint needs output sinks that append to the output of the earlier run')
+        output_sinks = [HourlyOutputSink((num_time_steps, num_y_steps, num_x_steps), datatype)]
+    else:
+        output_sinks = list(sinks)
+
+    f_sol_current = np.zeros((num_y_steps, num_x_steps), dtype=datatype)
+    start_time = 0
+    if checkpoint_file or resume_from:
+        parameters = {'num_time_steps': num_time_steps, 'min_time': min_time, 'max_time': max_time, 'diff': float(diff), 'datatype': datatype,
+                      'num_sinks': len(output_sinks), 'fingerprint': simulation_input_fingerprint(source_values, wx, wy, grid_metrics)}
+    if resume_from:
+        f_sol_current, start_time = load_simulation_checkpoint(resume_from, parameters, output_sinks)
+        f_sol_current = f_sol_current.astype(datatype)
+        print(f'resuming advection diffusion simulation at time step {start_time}')
+
+    last_checkpoint = start_time
+    for first in range(start_time, num_time_steps, block):
+        last = min(first + block, num_time_steps)
+        # the time step n computes the row n+1, time steps before min_time + 1 stay 0
+        f_sol = np.zeros((last - first, num_y_steps, num_x_steps), dtype=datatype)
+        block_min_time = max(first - 1, min_time)
+        block_max_time = min(last, max_time)
+        if block_min_time < block_max_time - 1:
+            # only the winds of the block are read, so wx and wy can be numpy memmaps of the entire time span
+            wx_block = read_time_block(wx, block_min_time, block_max_time)
+            wy_block = read_time_block(wy, block_min_time, block_max_time)
+            f_sol_current = advection_diffusion_engines[engine](f_sol, first, block_min_time, block_max_time,
+                                                                grid_metrics.xwind_mtpl, grid_metrics.ywind_mtpl, float(diff),
+                                                                source_rows, source_cols, source_values, wx_block, wy_block, f_sol_current)
+            del wx_block, wy_block
+        write_output_sinks(output_sinks, first, f_sol)
+        del f_sol
+        if checkpoint_file and (last - last_checkpoint >= checkpoint_every) and (last < num_time_steps):
+            save_simulation_checkpoint(checkpoint_file, f_sol_current, last, parameters, output_sinks)
+            last_checkpoint = last
+    close_output_sinks(output_sinks)
+    if checkpoint_file and os.path.exists(parent_directory + checkpoint_file):
+        os.remove(parent_directory + checkpoint_file)
+
+    if sinks is None:
+        return output_sinks[0].data
 
 
 "--------------------------------------------------------------------"
@@ -2793,8 +4785,14 @@ def get_pixels_data_two_dim(data, pixels_list, pixels_data_x_shape = 105, pixels
         pixel_data[pixel[0]][pixel[1]] = data[pixel[0]][pixel[1]]
     return pixel_data
 
-@jit
 def get_time_span_region_data(data, region):
+    # a HDF5 store is read in one selection of the bounding rectangle of the region, iterating its time steps would decompress every chunk per time step
+    if isinstance(data, h5py.Dataset):
+        return read_chunked_selection(data, (slice(None), region[:,0].astype(int), region[:,1].astype(int))).astype('float32')
+    return get_array_time_span_region_data(data, region)
+
+@jit
+def get_array_time_span_region_data(data, region):
     hourly_region_data = np.zeros((data.shape[0], region.shape[0]), dtype = 'float32')
     idx = 0
 
@@ -2992,10 +4990,46 @@ def create_population_weight_array(pop_array, countries_list):
 
     return pop_array
 
+class WeightedArray:
+    """
+    WeightedArray is the lazy product of a (time, y, x) array and a (y, x) weight array (e.g. the population weights). No product is
+    stored, indexing only reads and weights the selected time steps and pixels, e.g. data[:, region[:,0], region[:,1]] of a country.
+    The first key of an index applies to the time axis and the others to the pixels, as for numpy arrays.
+
+    Parameters:
+        data(ndarray):              a numpy array, numpy memmap or HDF5 dataset (time, y, x).
+        weights(ndarray):           a numpy array (y, x) of the weights of every pixel.
+    """
+
+    def __init__(self, data, weights):
+        self.data = data
+        self.weights = np.asarray(weights)
+        self.shape = tuple(data.shape)
+        self.ndim = len(self.shape)
+        self.dtype = np.result_type(data.dtype, self.weights.dtype)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+        if isinstance(self.data, h5py.Dataset):
+            values = read_chunked_selection(self.data, key)
+        else:
+            values = self.data[key]
+        return np.multiply(values, self.weights[key[1:]])
+
+    def __array__(self, dtype = None, copy = None):
+        values = self[:]
+        return values if dtype is None else values.astype(dtype)
+
+
 "--------------------------------------------------------------------"
 'Regression Functions'
 "--------------------------------------------------------------------"
 
+@instrumented()
 def daily_dust_country_regression(aod_daily_data, daily_bodele_aod_data, precipitation_daily_data, temperature_daily_data, daily_junsep_indices, daily_novapr_indices, countries_list):
 
     predicted_daily_aod_data = np.zeros((13515, 91,105), dtype='float32')
@@ -3022,13 +5056,15 @@ def daily_dust_country_regression(aod_daily_data, daily_bodele_aod_data, precipi
 
     return predicted_daily_aod_data, r_squared_map
 
+@instrumented()
 def daily_dust_regression(dust_daily_data, dust_daily_data_junsep, dust_daily_data_novapr, daily_bodele_dust_data,
                           daily_bodele_dust_data_junsep, daily_bodele_dust_data_novapr, precipitation_daily_data, precipitation_daily_data_junsep, precipitation_daily_data_novapr,
                           temperature_daily_data, temperature_daily_data_junsep, temperature_daily_data_novapr, daily_junsep_indices, daily_novapr_indices):
 
-    predicted_daily_dust_data = np.zeros((13515, 91,105), dtype='float32')
-    predicted_daily_dust_data_dry = np.zeros((6707, 91,105), dtype='float32')
-    predicted_daily_dust_data_wet = np.zeros((4514, 91,105), dtype='float32')
+    # the seasonal arrays can be copies or SeasonalView objects of the daily arrays
+    predicted_daily_dust_data = np.zeros(dust_daily_data.shape, dtype='float32')
+    predicted_daily_dust_data_dry = np.zeros(dust_daily_data_novapr.shape, dtype='float32')
+    predicted_daily_dust_data_wet = np.zeros(dust_daily_data_junsep.shape, dtype='float32')
     r_squared_map = np.zeros((91,105), dtype='float32')
     r_squared_map_dry = np.zeros((91,105), dtype='float32')
     r_squared_map_wet = np.zeros((91,105), dtype='float32')
@@ -3114,142 +5150,132 @@ def get_mse_data(daily_data, daily_predicted_data):
 
     return mse_array
 
-def extract_yearly_indices(years,daily_seasonal_indices):
-    yearly_seasonal_indices_list = [[]] * years
-    year = 0
-    previous_idx = 0
-    current_indices = []
-    for idx in daily_seasonal_indices:
-        if (idx > 1):
-            if (idx-1 != previous_idx):
-                yearly_seasonal_indices_list[year] = current_indices
-                year += 1
-                current_indices = []
-        previous_idx = idx
-        current_indices.append(idx)
-    return yearly_seasonal_indices_list
-
-
-def create_dust_exposure_df(predicted_values, predicted_values_weighted,country_list, years, daily_seasonal_indices):
-    yearly_countries_predicted_values = np.zeros((len(country_list), (2016-1980)+1), dtype='float32')
-    yearly_countries_predicted_values_weighted = np.zeros((len(country_list), (2016-1980)+1), dtype='float32')
-
-    yearly_countries_predicted_values_seasonal = np.zeros((len(country_list), (2016-1980)+1), dtype='float32')
-    yearly_countries_predicted_values_weighted_seasonal = np.zeros((len(country_list), (2016-1980)+1), dtype='float32')
-
-    seasonal_indices_by_year = extract_yearly_indices(years, daily_seasonal_indices)
-
-    for idx, country in enumerate(country_list):
-        daily_country_predicted_values = np.zeros((predicted_values.shape[0], return_region_pixel_array(country).shape[0]), dtype='float32')
-        daily_country_predicted_values_weighted = np.zeros((predicted_values_weighted.shape[0], return_region_pixel_array(country).shape[0]), dtype='float32')
-        for day in range(predicted_values.shape[0]):
-            daily_country_predicted_values[day] = get_pixels_data_one_dim(predicted_values[day], return_region_pixel_array(country))
-            daily_country_predicted_values_weighted[day] = get_pixels_data_one_dim(predicted_values_weighted[day], return_region_pixel_array(country))
-        yearly_country_predicted_values = np.zeros(((2016-1980)+1, return_region_pixel_array(country).shape[0]), dtype='float32')
-        yearly_country_predicted_values_weighted = np.zeros(((2016-1980)+1, return_region_pixel_array(country).shape[0]), dtype='float32')
-
-        yearly_country_predicted_values_seasonal = np.zeros(((2016-1980)+1, return_region_pixel_array(country).shape[0]), dtype='float32')
-        yearly_country_predicted_values_weighted_seasonal = np.zeros(((2016-1980)+1, return_region_pixel_array(country).shape[0]), dtype='float32')
-
-        current_days = 0
-        for year_idx in range((2016-1980)+1):
-            if(year_idx%4 == 0):
-                yearly_country_predicted_values[year_idx] = np.sum(daily_country_predicted_values[current_days:current_days+366], axis = 0)/366
-                yearly_country_predicted_values_weighted[year_idx] = np.sum(daily_country_predicted_values_weighted[current_days:current_days+366], axis = 0)/366
-                current_days += 366
-            else:
-                yearly_country_predicted_values[year_idx] = np.sum(daily_country_predicted_values[current_days:current_days+365], axis = 0)/365
-                yearly_country_predicted_values_weighted[year_idx] = np.sum(daily_country_predicted_values_weighted[current_days:current_days+365], axis = 0)/365
-                current_days += 365
-            
-            daily_seasonal_data = np.zeros((return_region_pixel_array(country).shape[0]), dtype='float32')
-            daily_seasonal_data_weighted = np.zeros((return_region_pixel_array(country).shape[0]), dtype='float32')
+def extract_yearly_indices(years, daily_seasonal_indices, time_index = None):
+    # lists of the daily seasonal indices of every season year (see MerraTimeIndex.season_year), e.g. the dry season of 1981 is Nov 1980 to Apr 1981.
+    # the seasonal indices can also be given as SeasonalView of the daily data
+    if isinstance(daily_seasonal_indices, SeasonalView):
+        daily_seasonal_indices = daily_seasonal_indices.indices
+    daily_seasonal_indices = np.asarray(daily_seasonal_indices, dtype='int64')
+    time_index = exposure_time_index(int(daily_seasonal_indices.max()) + 1 if daily_seasonal_indices.shape[0] else 1, time_index)
+    in_season = np.zeros(len(time_index.dates), dtype=bool)
+    in_season[daily_seasonal_indices] = True
+    season_years = time_index.season_year(in_season)[daily_seasonal_indices]
+    first_year = int(time_index.year[0])
+    return [list(daily_seasonal_indices[season_years == year]) for year in range(first_year, first_year + years)]
 
-            for day in seasonal_indices_by_year[year_idx]:
-                daily_seasonal_data += daily_country_predicted_values[day]
-                daily_seasonal_data_weighted += daily_country_predicted_values_weighted[day]
-            
-            yearly_country_predicted_values_seasonal[year_idx] = daily_seasonal_data/len(seasonal_indices_by_year[year_idx])
-            yearly_country_predicted_values_weighted_seasonal[year_idx] = daily_seasonal_data_weighted/len(seasonal_indices_by_year[year_idx])
 
-        yearly_countries_predicted_values[idx] = np.sum(yearly_country_predicted_values, axis = 1)/yearly_country_predicted_values.shape[1]
-        yearly_countries_predicted_values_weighted[idx] = np.sum(yearly_country_predicted_values_weighted, axis = 1)/yearly_country_predicted_values_weighted.shape[1]
+def exposure_time_index(time_steps, time_index = None):
+    # daily time index of the predicted values, by default the days from Jan 1 1980 on
+    if time_index is None:
+        time_index = MerraTimeIndex(pd.date_range(start='1980-01-01', periods=time_steps, freq='D'))
+    return time_index
 
-        yearly_countries_predicted_values_seasonal[idx] = np.sum(yearly_country_predicted_values_seasonal, axis = 1)/yearly_country_predicted_values_seasonal.shape[1]
-        yearly_countries_predicted_values_weighted_seasonal[idx] = np.sum(yearly_country_predicted_values_weighted_seasonal, axis = 1)/yearly_country_predicted_values_weighted_seasonal.shape[1]
 
+def yearly_time_means(data, time_index, season = None, years = [], frequency = 'daily'):
+    """
+    yearly_time_means() computes the mean of every calendar year or season year over the time steps (the 0 axis) of an array in a single
+    np.add.reduceat call, with the year boundaries taken from the time index instead of counting 365/366 days.
 
-    dust_exposure_predicted_df = pd.DataFrame(yearly_countries_predicted_values, index = country_list, columns = range(1980,2016+1))
-    dust_exposure_predicted_weighted_df = pd.DataFrame(yearly_countries_predicted_values_weighted, index = country_list, columns = range(1980,2016+1))
+    Parameters:
+        data(ndarray):              a numpy array, numpy memmap or HDF5 dataset with time on the 0 axis, e.g. (time, 91, 105) or (time, pixels).
+        time_index(MerraTimeIndex): the time index of the 0 axis of data.
+        season(string):             None for calendar years, or the season as name or definition (see merra_seasons), boolean mask,
+                                    sorted indices or SeasonalView. A season across the year end counts for the year it ends in. This is set to None by default.
+        years(list):                a list of the years to return. This is set to [] (every calendar year of the time index) by default.
+        frequency(string):          a string for the frequency of data. This is set to 'daily' by default.
 
-    dust_exposure_predicted_seasonal_df = pd.DataFrame(yearly_countries_predicted_values_seasonal, index = country_list, columns = range(1980,2016+1))
-    dust_exposure_predicted_weighted_seasonal_df = pd.DataFrame(yearly_countries_predicted_values_weighted_seasonal, index = country_list, columns = range(1980,2016+1))
+    Returns:
+        years(ndarray):             a numpy array of the returned years.
+        yearly_means(ndarray):      a float64 numpy array (years, ...) of the yearly means, NaN for years without time steps.
+    """
+
+    steps = time_index.steps(frequency)
+    if season is None:
+        keys = np.repeat(time_index.year.astype('int32'), steps)
+        selection = np.arange(data.shape[0])
+        values = read_time_block(data, 0, data.shape[0])
+    else:
+        if isinstance(season, SeasonalView):
+            selection = season.indices
+        elif isinstance(season, (str, dict)):
+            selection = np.flatnonzero(time_index.mask(season, frequency))
+        else:
+            selection = time_step_indices(season, data.shape[0])
+        in_season = np.zeros(data.shape[0], dtype=bool)
+        in_season[selection] = True
+        in_season = in_season.reshape((-1, steps)).any(axis=1)
+        keys = np.repeat(time_index.season_year(in_season), steps)[selection]
+        values = create_output_array((selection.shape[0],) + tuple(data.shape[1:]), data.dtype)
+        take_time_steps(values, data, selection)
+
+    if len(years) == 0:
+        years = np.unique(time_index.year)
+    years = np.asarray(years)
+    yearly_means = np.full((years.shape[0],) + tuple(data.shape[1:]), np.nan)
+    if selection.shape[0] == 0:
+        return years, yearly_means
+
+    # the time steps are sorted, so every year is one run of equal keys
+    starts = np.flatnonzero(np.concatenate([[True], keys[1:] != keys[:-1]]))
+    counts = np.diff(np.append(starts, keys.shape[0]))
+    sums = np.add.reduceat(values, starts, axis=0, dtype='float64')
+    group_years = keys[starts]
+    in_years = np.isin(group_years, years)
+    yearly_means[np.searchsorted(years, group_years[in_years])] = sums[in_years] / counts[in_years].reshape((-1,) + (1,)*(sums.ndim-1))
+    return years, yearly_means
+
+
+def yearly_exposure_means(predicted_values, predicted_values_weighted, years, daily_seasonal_indices, time_index = None, region = None, populated_only = False):
+    # yearly and seasonal yearly means of the predicted values and their population weighted values, of every pixel of a region (or of the grid).
+    # populated_only drops the pixels whose weighted values are NaN (no population)
+    time_index = exposure_time_index(predicted_values.shape[0], time_index)
+    first_year = int(time_index.year[0])
+    if isinstance(years, (int, np.integer)):
+        years = list(range(first_year, first_year + years))
+
+    if region is not None:
+        region = region.astype(int)
+        (predicted_values, predicted_values_weighted) = [read_chunked_selection(values, (slice(None), region[:,0], region[:,1]))
+                                                         if isinstance(values, h5py.Dataset) else values[:, region[:,0], region[:,1]]
+                                                         for values in (predicted_values, predicted_values_weighted)]
+        if populated_only:
+            predicted_values_weighted = predicted_values_weighted[:, ~np.isnan(predicted_values_weighted[0])]
+
+    yearly_means = [yearly_time_means(predicted_values, time_index, years = years)[1],
+                    yearly_time_means(predicted_values_weighted, time_index, years = years)[1],
+                    yearly_time_means(predicted_values, time_index, season = daily_seasonal_indices, years = years)[1],
+                    yearly_time_means(predicted_values_weighted, time_index, season = daily_seasonal_indices, years = years)[1]]
+    return years, yearly_means
+
+
+@instrumented()
+def yearly_exposure_df(predicted_values, predicted_values_weighted, country_list, years, daily_seasonal_indices, time_index = None, populated_only = False):
+    # dataframes (countries x years) of the country means of the yearly and seasonal yearly means of the predicted values and their weighted values
+    country_means = []
+    for country in country_list:
+        years_list, yearly_means = yearly_exposure_means(predicted_values, predicted_values_weighted, years, daily_seasonal_indices, time_index,
+                                                         region = return_region_pixel_array(country), populated_only = populated_only)
+        country_means.append([np.mean(yearly_mean, axis=1).astype('float32') for yearly_mean in yearly_means])
+
+    return [pd.DataFrame(np.array([means[idx] for means in country_means]), index = country_list, columns = years_list) for idx in range(4)]
+
+
+def create_dust_exposure_df(predicted_values, predicted_values_weighted,country_list, years, daily_seasonal_indices, time_index = None):
+    # yearly and seasonal yearly means of every country (mean over its pixels) of the predicted values and the population weighted values,
+    # years is the number of years from the first day of the time index (by default Jan 1 1980) or a list of years
+    (dust_exposure_predicted_df, dust_exposure_predicted_weighted_df,
+     dust_exposure_predicted_seasonal_df, dust_exposure_predicted_weighted_seasonal_df) = yearly_exposure_df(predicted_values, predicted_values_weighted, country_list,
+                                                                                                           years, daily_seasonal_indices, time_index)
 
     return dust_exposure_predicted_df, dust_exposure_predicted_weighted_df, dust_exposure_predicted_seasonal_df, dust_exposure_predicted_weighted_seasonal_df
 
-def create_dust_exposure_df_country_weighted(predicted_values, predicted_values_weighted,country_list, years, daily_seasonal_indices):
+def create_dust_exposure_df_country_weighted(predicted_values, predicted_values_weighted,country_list, years, daily_seasonal_indices, time_index = None):
     #takes only weighted values of populated pixels, others are omitted
-    
-    yearly_countries_predicted_values = np.zeros((len(country_list), (2016-1980)+1), dtype='float32')
-    yearly_countries_predicted_values_weighted = np.zeros((len(country_list), (2016-1980)+1), dtype='float32')
-
-    yearly_countries_predicted_values_seasonal = np.zeros((len(country_list), (2016-1980)+1), dtype='float32')
-    yearly_countries_predicted_values_weighted_seasonal = np.zeros((len(country_list), (2016-1980)+1), dtype='float32')
-
-    seasonal_indices_by_year = extract_yearly_indices(years, daily_seasonal_indices)
-
-    for idx, country in enumerate(country_list):
-        daily_country_predicted_values = np.zeros((predicted_values.shape[0], return_region_pixel_array(country).shape[0]), dtype='float32')
-        #get shape of populated pixels array
-        temp_shape = get_pixels_data_one_dim(predicted_values_weighted[0], return_region_pixel_array(country))
-        shape_population_array = temp_shape[~np.isnan(temp_shape)]
-        daily_country_predicted_values_weighted = np.zeros((predicted_values_weighted.shape[0], shape_population_array.shape[0]), dtype='float32')
-        for day in range(predicted_values.shape[0]):
-            daily_country_predicted_values[day] = get_pixels_data_one_dim(predicted_values[day], return_region_pixel_array(country))
-            #use temporal data 
-            temp_daily_weighted_data = get_pixels_data_one_dim(predicted_values_weighted[day], return_region_pixel_array(country))
-            #only take values above zero (pixels with no population were set to -1 in the predicted_values_weighted array)
-            temp_data = temp_daily_weighted_data[~np.isnan(temp_daily_weighted_data)]
-            daily_country_predicted_values_weighted[day] = temp_data
-        yearly_country_predicted_values = np.zeros(((2016-1980)+1, return_region_pixel_array(country).shape[0]), dtype='float32')
-        yearly_country_predicted_values_weighted = np.zeros(((2016-1980)+1, shape_population_array.shape[0]), dtype='float32')
-
-        yearly_country_predicted_values_seasonal = np.zeros(((2016-1980)+1, return_region_pixel_array(country).shape[0]), dtype='float32')
-        yearly_country_predicted_values_weighted_seasonal = np.zeros(((2016-1980)+1, shape_population_array.shape[0]), dtype='float32')
-
-        current_days = 0
-        for year_idx in range((2016-1980)+1):
-            if(year_idx%4 == 0):
-                yearly_country_predicted_values[year_idx] = np.sum(daily_country_predicted_values[current_days:current_days+366], axis = 0)/366
-                yearly_country_predicted_values_weighted[year_idx] = np.sum(daily_country_predicted_values_weighted[current_days:current_days+366], axis = 0)/366
-                current_days += 366
-            else:
-                yearly_country_predicted_values[year_idx] = np.sum(daily_country_predicted_values[current_days:current_days+365], axis = 0)/365
-                yearly_country_predicted_values_weighted[year_idx] = np.sum(daily_country_predicted_values_weighted[current_days:current_days+365], axis = 0)/365
-                current_days += 365
-            
-            daily_seasonal_data = np.zeros((return_region_pixel_array(country).shape[0]), dtype='float32')
-            daily_seasonal_data_weighted = np.zeros((shape_population_array.shape[0]), dtype='float32')
-
-            for day in seasonal_indices_by_year[year_idx]:
-                daily_seasonal_data += daily_country_predicted_values[day]
-                daily_seasonal_data_weighted += daily_country_predicted_values_weighted[day]
-            
-            yearly_country_predicted_values_seasonal[year_idx] = daily_seasonal_data/len(seasonal_indices_by_year[year_idx])
-            yearly_country_predicted_values_weighted_seasonal[year_idx] = daily_seasonal_data_weighted/len(seasonal_indices_by_year[year_idx])
-
-        yearly_countries_predicted_values[idx] = np.sum(yearly_country_predicted_values, axis = 1)/yearly_country_predicted_values.shape[1]
-        yearly_countries_predicted_values_weighted[idx] = np.sum(yearly_country_predicted_values_weighted, axis = 1)/yearly_country_predicted_values_weighted.shape[1]
-
-        yearly_countries_predicted_values_seasonal[idx] = np.sum(yearly_country_predicted_values_seasonal, axis = 1)/yearly_country_predicted_values_seasonal.shape[1]
-        yearly_countries_predicted_values_weighted_seasonal[idx] = np.sum(yearly_country_predicted_values_weighted_seasonal, axis = 1)/yearly_country_predicted_values_weighted_seasonal.shape[1]
-
-
-    dust_exposure_predicted_df = pd.DataFrame(yearly_countries_predicted_values, index = country_list, columns = range(1980,2016+1))
-    dust_exposure_predicted_weighted_df = pd.DataFrame(yearly_countries_predicted_values_weighted, index = country_list, columns = range(1980,2016+1))
-
-    dust_exposure_predicted_seasonal_df = pd.DataFrame(yearly_countries_predicted_values_seasonal, index = country_list, columns = range(1980,2016+1))
-    dust_exposure_predicted_weighted_seasonal_df = pd.DataFrame(yearly_countries_predicted_values_weighted_seasonal, index = country_list, columns = range(1980,2016+1))
+    #(pixels with no population are NaN in the predicted_values_weighted array)
+    (dust_exposure_predicted_df, dust_exposure_predicted_weighted_df,
+     dust_exposure_predicted_seasonal_df, dust_exposure_predicted_weighted_seasonal_df) = yearly_exposure_df(predicted_values, predicted_values_weighted, country_list,
+                                                                                                           years, daily_seasonal_indices, time_index,
+                                                                                                           populated_only = True)
 
     return dust_exposure_predicted_df, dust_exposure_predicted_weighted_df, dust_exposure_predicted_seasonal_df, dust_exposure_predicted_weighted_seasonal_df
 
@@ -3328,43 +5354,12 @@ def country_centroids_one_dim(country_centroids,countries_list,years):
 
 ## lon lat dataframe
 
-def create_yearly_dust_exposure_pixel_df(predicted_values, predicted_values_weighted, years, daily_seasonal_indices):
-
-    #extract seasonal indices by year, so we can later jsut get dry season values
-    seasonal_indices_by_year = extract_yearly_indices(years, daily_seasonal_indices)
-
-    #init return arrays
-    yearly_pixel_predicted_values = np.zeros(((2016-1980)+1,predicted_values.shape[1], predicted_values.shape[2]), dtype = 'float32')
-    yearly_pixel_predicted_values_weighted = np.zeros(((2016-1980)+1,predicted_values_weighted.shape[1], predicted_values_weighted.shape[2]), dtype = 'float32')
-    yearly_pixel_predicted_values_seasonal = np.zeros(((2016-1980)+1,predicted_values.shape[1], predicted_values.shape[2]), dtype = 'float32')
-    yearly_pixel_predicted_values_weighted_seasonal = np.zeros(((2016-1980)+1,predicted_values_weighted.shape[1], predicted_values_weighted.shape[2]), dtype = 'float32')
-
-    current_days = 0
-    for year_idx in range((2016-1980)+1):
-        # get yearly averages for each pixel
-        # control for leap years
-        if(year_idx%4 == 0):
-            yearly_pixel_predicted_values[year_idx] = np.sum(predicted_values[current_days:current_days+366], axis = 0)/366
-            yearly_pixel_predicted_values_weighted[year_idx] = np.sum(predicted_values_weighted[current_days:current_days+366], axis = 0)/366
-            # year_indices[current_days:current_days+366] = years[year_idx]
-            current_days += 366
-        else:
-            yearly_pixel_predicted_values[year_idx] = np.sum(predicted_values[current_days:current_days+365], axis = 0)/365
-            yearly_pixel_predicted_values_weighted[year_idx] = np.sum(predicted_values_weighted[current_days:current_days+365], axis = 0)/365
-            # year_indices[current_days:current_days+365] = years[year_idx]
-            current_days += 365
-
-        #init temp seasonal values arrays
-        daily_pixel_predicted_values_seasonal = np.zeros((predicted_values.shape[1], predicted_values.shape[2]), dtype='float32')
-        daily_pixel_predicted_values_seasonal_weighted = np.zeros((predicted_values_weighted.shape[1], predicted_values_weighted.shape[2]), dtype='float32')
-
-        # 
-        for day in seasonal_indices_by_year[year_idx]:
-            daily_pixel_predicted_values_seasonal += predicted_values[day]
-            daily_pixel_predicted_values_seasonal_weighted += predicted_values_weighted[day]
-        
-        yearly_pixel_predicted_values_seasonal[year_idx] = daily_pixel_predicted_values_seasonal/len(seasonal_indices_by_year[year_idx])
-        yearly_pixel_predicted_values_weighted_seasonal[year_idx] = daily_pixel_predicted_values_seasonal_weighted/len(seasonal_indices_by_year[year_idx])
+def create_yearly_dust_exposure_pixel_df(predicted_values, predicted_values_weighted, years, daily_seasonal_indices, time_index = None):
+
+    # yearly and seasonal yearly (e.g. just dry season) averages for each pixel, the year boundaries come from the real calendar
+    yearly_means = yearly_exposure_means(predicted_values, predicted_values_weighted, years, daily_seasonal_indices, time_index)[1]
+    (yearly_pixel_predicted_values, yearly_pixel_predicted_values_weighted,
+     yearly_pixel_predicted_values_seasonal, yearly_pixel_predicted_values_weighted_seasonal) = [yearly_mean.astype('float32') for yearly_mean in yearly_means]
 
     return yearly_pixel_predicted_values, yearly_pixel_predicted_values_weighted, yearly_pixel_predicted_values_seasonal, yearly_pixel_predicted_values_weighted_seasonal
 
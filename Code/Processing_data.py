@@ -1,21 +1,43 @@
 import os
-import pickle
+import argparse
 import numpy as np
 import pandas as pd
 import gc
 
 os.environ["PROJ_LIB"] = "C:\\Users\\Daniel\\anaconda3\\Library\\share"; #fixr
 
-from functions import process_merra_data, process_outcome_data, hourly_data_to_daily_mean, three_hourly_data_to_daily_mean, extract_seasonal_data
-from functions import three_hourly_data_to_daily_mean
+from functions import process_merra_data, process_outcome_data, hourly_data_to_daily_mean, three_hourly_data_to_daily_mean
+from functions import MerraTimeIndex, cached_climatology
+from functions import instrumented, start_stage_log
 
 parent_directory = os.path.abspath(os.path.join(os.path.dirname(os.path.realpath(__file__)), os.pardir))
 
+# number of workers decoding the MERRA2 netCDF4 files in parallel
+num_workers = os.cpu_count()
+
+# region of the hourly and three hourly data: 15°S to 30°N and 30°W to 35°E (91x105 MERRA2 grid points)
+west_africa_bounding_box = [-15, 30, -30, 35]
+
+# continuous time range of the MERRA2 files by default, a rerun only decodes new or changed files into the hourly arrays
+merra_start_date = '1980-01-01'
+merra_end_date = '2016-12-31'
+
 import warnings
 warnings.filterwarnings("ignore")
 
+@instrumented('processing_data')
 def main():
 
+    # the time range can be set to the range of the files written by generate_synthetic_data.py,
+    # the number of time steps of every array follows from it (e.g. 13515 days from 1980-01-01 to 2016-12-31)
+    parser = argparse.ArgumentParser(description='process the MERRA2 netCDF4 files')
+    parser.add_argument('--start_date', default=merra_start_date, help='date of the first MERRA2 file')
+    parser.add_argument('--end_date', default=merra_end_date, help='date of the last MERRA2 file')
+    args = parser.parse_args()
+    start_date = args.start_date
+    end_date = args.end_date
+    daily_time_steps = len(pd.date_range(start_date, end_date))
+    monthly_time_steps = len(pd.date_range(start_date[:7], end_date[:7], freq='MS'))
 
     ######################################################################
     # Processing MERRA2 Data
@@ -35,10 +57,10 @@ def main():
     monthly_junsep_indices,
     monthly_novapr_indices) = process_merra_data('\\raw_data\\2.1_dust_data\\monthly_aod\\', 
                                                  seasonal_indices = True, variables = ['AODANA'], two_vars = False, 
-                                                 timing = 'monthly', time_steps = 444, y_steps = 361, x_steps = 576, 
-                                                 datatype = 'float32')
+                                                 timing = 'monthly', time_steps = monthly_time_steps, y_steps = 361, x_steps = 576, 
+                                                 start_date = start_date, end_date = end_date,
+                                                 datatype = 'float32', workers = num_workers)
 
-    aod_monthly_novapr_data, aod_monthly_junsep_data = extract_seasonal_data(aod_monthly_data, monthly_novapr_indices, monthly_junsep_indices)
     print('processed monthly aerosol optical depth raw data')
 
     print('saving processed monthly aerosol optical depth arrays to \\processed_data ...')
@@ -46,14 +68,6 @@ def main():
     with open(parent_directory + '\\processed_data\\aod_monthly_data.npy', 'wb') as numpy_array:
         np.save(numpy_array, aod_monthly_data.data)
     del aod_monthly_data
-    
-    with open(parent_directory + '\\processed_data\\aod_monthly_novapr_data.npy', 'wb') as numpy_array:
-        np.save(numpy_array, aod_monthly_novapr_data.data)
-    del aod_monthly_novapr_data
-
-    with open(parent_directory + '\\processed_data\\aod_monthly_junsep_data.npy', 'wb') as numpy_array:
-        np.save(numpy_array, aod_monthly_junsep_data.data)
-    del aod_monthly_junsep_data
     print('saved processed monthly aerosol optical depth arrays to \\processed_data')
 
     #invoke garbage collector
@@ -75,38 +89,17 @@ def main():
     hourly_novapr_indices,
     daily_novapr_indices) =   process_merra_data('\\raw_data\\3.1_physical_model\\hourly_wind\\', 
                                                  seasonal_indices = True, variables = ['ULML', 'VLML'], two_vars = True, 
-                                                 timing = 'hourly', time_steps = 324360, y_steps = 91, x_steps = 105, 
-                                                 datatype = 'float32')
-                                                 
-    wind_eastward_hourly_novapr_data, wind_eastward_hourly_junsep_data = extract_seasonal_data(wind_eastward_hourly_data, hourly_novapr_indices, hourly_junsep_indices)     
-    wind_northward_hourly_novapr_data, wind_northward_hourly_junsep_data = extract_seasonal_data(wind_northward_hourly_data, hourly_novapr_indices, hourly_junsep_indices) 
+                                                 timing = 'hourly', time_steps = 24*daily_time_steps, y_steps = 91, x_steps = 105, 
+                                                 start_date = start_date, end_date = end_date,
+                                                 datatype = 'float32', workers = num_workers, bounding_box = west_africa_bounding_box,
+                                                 output_files = ['\\processed_data\\wind_eastward_hourly_data.npy', '\\processed_data\\wind_northward_hourly_data.npy'], incremental = True)
+
     print('processed wind raw data')
 
     print('saving processed hourly wind arrays to \\processed_data ...')
-    #wind data
-    with open(parent_directory + '\\processed_data\\wind_eastward_hourly_data.npy', 'wb') as numpy_array:
-        np.save(numpy_array, wind_eastward_hourly_data.data)
+    #wind data (the hourly arrays are already written to \\processed_data during processing)
     del wind_eastward_hourly_data
-    
-    with open(parent_directory + '\\processed_data\\wind_northward_hourly_data.npy', 'wb') as numpy_array:
-        np.save(numpy_array, wind_northward_hourly_data.data)
     del wind_northward_hourly_data
-
-    with open(parent_directory + '\\processed_data\\wind_eastward_hourly_novapr_data.npy', 'wb') as numpy_array:
-        np.save(numpy_array, wind_eastward_hourly_novapr_data.data)
-    del wind_eastward_hourly_novapr_data
-
-    with open(parent_directory + '\\processed_data\\wind_eastward_hourly_junsep_data.npy', 'wb') as numpy_array:
-        np.save(numpy_array, wind_eastward_hourly_junsep_data.data)
-    del wind_eastward_hourly_junsep_data
-    
-    with open(parent_directory + '\\processed_data\\wind_northward_hourly_novapr_data.npy', 'wb') as numpy_array:
-        np.save(numpy_array, wind_northward_hourly_novapr_data.data)
-    del wind_northward_hourly_novapr_data
-    
-    with open(parent_directory + '\\processed_data\\wind_northward_hourly_junsep_data.npy', 'wb') as numpy_array:
-        np.save(numpy_array, wind_northward_hourly_junsep_data.data)
-    del wind_northward_hourly_junsep_data
     print('saved processed hourly wind arrays to \\processed_data')
     
     #invoke garbage collector
@@ -115,44 +108,22 @@ def main():
     print('processing dustmass - pm 2.5 raw data ...')                                                    
     dust_hourly_data = process_merra_data('\\raw_data\\3.1_physical_model\\hourly_dusmass_pm2.5\\', 
                                             seasonal_indices = False, variables = ['DUSMASS25'], two_vars = False, 
-                                            timing = 'hourly', time_steps = 324360, y_steps = 91, x_steps = 105, 
-                                            datatype = 'float32')[3]
-
-    dust_hourly_novapr_data, dust_hourly_junsep_data = extract_seasonal_data(dust_hourly_data, hourly_novapr_indices, hourly_junsep_indices)
-
-    dust_daily_data = hourly_data_to_daily_mean(dust_hourly_data)
+                                            timing = 'hourly', time_steps = 24*daily_time_steps, y_steps = 91, x_steps = 105, 
+                                            start_date = start_date, end_date = end_date,
+                                            datatype = 'float32', workers = num_workers, bounding_box = west_africa_bounding_box,
+                                            output_files = ['\\processed_data\\dust_hourly_data.npy'], incremental = True)[3]
 
-    dust_daily_data_novapr, dust_daily_data_junsep = extract_seasonal_data(dust_daily_data, daily_novapr_indices, daily_junsep_indices)
+    # the daily means are kept as pixel-chunked .h5 store, which regression.py reads pixel by pixel
+    dust_daily_data = hourly_data_to_daily_mean(dust_hourly_data, workers = num_workers, output_file = '\\processed_data\\dust_daily_data.h5',
+                                                chunk_layout = 'pixel')
 
     print('processed dustmass - pm 2.5 raw data')   
 
-    print('saving processed hourly dust arrays to \\processed_data ...')
-    #dust data
-    with open(parent_directory + '\\processed_data\\dust_hourly_data.npy', 'wb') as numpy_array:
-        np.save(numpy_array, dust_hourly_data.data)
+    #dust data (the hourly and daily arrays are already written to \\processed_data during processing)
     del dust_hourly_data
-    
-    with open(parent_directory + '\\processed_data\\dust_hourly_novapr_data.npy', 'wb') as numpy_array:
-        np.save(numpy_array, dust_hourly_novapr_data.data)
-    del dust_hourly_novapr_data
-
-    with open(parent_directory + '\\processed_data\\dust_hourly_junsep_data.npy', 'wb') as numpy_array:
-        np.save(numpy_array, dust_hourly_junsep_data.data)
-    del dust_hourly_junsep_data
-
-    with open(parent_directory + '\\processed_data\\dust_daily_data.npy', 'wb') as numpy_array:
-        np.save(numpy_array, dust_daily_data.data)
+    dust_daily_data.file.close()
     del dust_daily_data
 
-    with open(parent_directory + '\\processed_data\\dust_daily_data_novapr.npy', 'wb') as numpy_array:
-        np.save(numpy_array, dust_daily_data_novapr.data)
-    del dust_daily_data_novapr
-
-    with open(parent_directory + '\\processed_data\\dust_daily_data_junsep.npy', 'wb') as numpy_array:
-        np.save(numpy_array, dust_daily_data_junsep.data)
-    del dust_daily_data_junsep
-    print('saved processed hourly dust arrays to \\processed_data')
-
     #invoke garbage collector
     gc.collect()
 
@@ -163,66 +134,33 @@ def main():
 
 
     print('processing hourly bias corrected total precipitation raw data ...') 
-    precipitation_hourly_data = process_merra_data('\\raw_data\\3.3_model_implementation\\hourly_precipitation\\', 
+    #the hourly files are reduced to daily means while they are read, the daily array is written to \\processed_data during processing
+    precipitation_daily_data = process_merra_data('\\raw_data\\3.3_model_implementation\\hourly_precipitation\\', 
                                                     seasonal_indices = False, variables = ['PRECTOTCORR'], two_vars = False, 
-                                                    timing = 'hourly', time_steps = 324360, y_steps = 91, x_steps = 105, 
-                                                    datatype = 'float32')[3]
-
-    precipitation_daily_data = hourly_data_to_daily_mean(precipitation_hourly_data)
-    precipitation_daily_data_novapr, precipitation_daily_data_junsep = extract_seasonal_data(precipitation_daily_data, daily_novapr_indices, daily_junsep_indices)
+                                                    timing = 'hourly', time_steps = daily_time_steps, y_steps = 91, x_steps = 105, 
+                                                    start_date = start_date, end_date = end_date,
+                                                    datatype = 'float32', workers = num_workers, bounding_box = west_africa_bounding_box,
+                                                    output_files = ['\\processed_data\\precipitation_daily_data.h5'], incremental = True,
+                                                    aggregate = 'mean', chunk_layout = 'pixel')[3]
     print('processed hourly bias corrected total precipitation raw data')  
-
-    print('saving processed hourly and daily mean precipitation arrays to \\processed_data ...')
-    #precipitation data
-    with open(parent_directory + '\\processed_data\\precipitation_hourly_data.npy', 'wb') as numpy_array:
-        np.save(numpy_array, precipitation_hourly_data.data)
-    del precipitation_hourly_data
-    
-    with open(parent_directory + '\\processed_data\\precipitation_daily_data.npy', 'wb') as numpy_array:
-        np.save(numpy_array, precipitation_daily_data.data)
+    precipitation_daily_data.file.close()
     del precipitation_daily_data
 
-    with open(parent_directory + '\\processed_data\\precipitation_daily_data_novapr.npy', 'wb') as numpy_array:
-        np.save(numpy_array, precipitation_daily_data_novapr.data)
-    del precipitation_daily_data_novapr
-
-    with open(parent_directory + '\\processed_data\\precipitation_daily_data_junsep.npy', 'wb') as numpy_array:
-        np.save(numpy_array, precipitation_daily_data_junsep.data)
-    del precipitation_daily_data_junsep
-    print('saved processed hourly and daily mean precipitation arrays to \\processed_data')
-
     #invoke garbage collector
     gc.collect()
 
     print('processing surface temperature raw data ...') 
-    temperature_hourly_data = process_merra_data('\\raw_data\\3.3_model_implementation\\hourly_temperature\\', 
+    temperature_daily_data = process_merra_data('\\raw_data\\3.3_model_implementation\\hourly_temperature\\', 
                                                   seasonal_indices = False, variables = ['TLML'], two_vars = False, 
-                                                  timing = 'hourly', time_steps = 324360, y_steps = 91, x_steps = 105, 
-                                                  datatype = 'float32')[3]
-
-    temperature_daily_data = hourly_data_to_daily_mean(temperature_hourly_data)
-    temperature_daily_data_novapr, temperature_daily_data_junsep = extract_seasonal_data(temperature_daily_data, daily_novapr_indices, daily_junsep_indices)                                
+                                                  timing = 'hourly', time_steps = daily_time_steps, y_steps = 91, x_steps = 105, 
+                                                  start_date = start_date, end_date = end_date,
+                                                  datatype = 'float32', workers = num_workers, bounding_box = west_africa_bounding_box,
+                                                  output_files = ['\\processed_data\\temperature_daily_data.h5'], incremental = True,
+                                                  aggregate = 'mean', chunk_layout = 'pixel')[3]
     print('processed surface temperature raw data')  
-
-    print('saving processed hourly and daily mean temperature arrays to \\processed_data ...')
-    #temperature data
-    with open(parent_directory + '\\processed_data\\temperature_hourly_data.npy', 'wb') as numpy_array:
-        np.save(numpy_array, temperature_hourly_data.data)
-    del temperature_hourly_data
-    
-    with open(parent_directory + '\\processed_data\\temperature_daily_data.npy', 'wb') as numpy_array:
-        np.save(numpy_array, temperature_daily_data.data)
+    temperature_daily_data.file.close()
     del temperature_daily_data
 
-    with open(parent_directory + '\\processed_data\\temperature_daily_data_novapr.npy', 'wb') as numpy_array:
-        np.save(numpy_array, temperature_daily_data_novapr.data)
-    del temperature_daily_data_novapr
-    
-    with open(parent_directory + '\\processed_data\\temperature_daily_data_junsep.npy', 'wb') as numpy_array:
-        np.save(numpy_array, temperature_daily_data_junsep.data)
-    del temperature_daily_data_junsep
-    print('saved processed hourly and daily mean temperature arrays to \\processed_data')
-
     #invoke garbage collector
     gc.collect()
 
@@ -234,21 +172,18 @@ def main():
     three_hourly_novapr_indices,
     daily_novapr_indices) = process_merra_data('\\raw_data\\3.3_model_implementation\\three_hourly_aod\\', 
                                                 seasonal_indices = True, variables = ['AODANA'], two_vars = False, 
-                                                timing = 'three_hourly', time_steps = 108120, y_steps = 91, x_steps = 105, 
-                                                datatype = 'float32')[2:]
-    aod_daily_data = three_hourly_data_to_daily_mean(aod_three_hourly_data)
+                                                timing = 'three_hourly', time_steps = 8*daily_time_steps, y_steps = 91, x_steps = 105, 
+                                                start_date = start_date, end_date = end_date,
+                                                datatype = 'float32', workers = num_workers, bounding_box = west_africa_bounding_box,
+                                                output_files = ['\\processed_data\\aod_three_hourly_data.npy'], incremental = True)[2:]
+    aod_daily_data = three_hourly_data_to_daily_mean(aod_three_hourly_data, workers = num_workers, output_file = '\\processed_data\\aod_daily_data.h5',
+                                                     chunk_layout = 'pixel')
     print('processed aerosol optical depth raw data') 
 
-    print('saving processed three hourly and daily mean aerosol optical depth arrays to \\processed_data ...')
-    #temperature data
-    with open(parent_directory + '\\processed_data\\aod_three_hourly_data.npy', 'wb') as numpy_array:
-        np.save(numpy_array, aod_three_hourly_data.data)
+    #aod data (the three hourly and daily arrays are already written to \\processed_data during processing)
     del aod_three_hourly_data
-    
-    with open(parent_directory + '\\processed_data\\aod_daily_data.npy', 'wb') as numpy_array:
-        np.save(numpy_array, aod_daily_data.data)
+    aod_daily_data.file.close()
     del aod_daily_data
-    print('saved processed three hourly and daily mean aerosol optical depth arrays to \\processed_data')
 
     #invoke garbage collector
     gc.collect()
@@ -264,31 +199,22 @@ def main():
 
 
     print('saving processed monthly and hourly seasonal indices to \\processed_data ...')
-    #save lists as pickle files
-    with open(parent_directory + '\\processed_data\\monthly_junsep_indices', 'wb') as pickle_file:
-        pickle.dump(monthly_junsep_indices, pickle_file)
-
-    with open(parent_directory + '\\processed_data\\monthly_novapr_indices', 'wb') as pickle_file:
-        pickle.dump(monthly_novapr_indices, pickle_file)
-
-    with open(parent_directory + '\\processed_data\\daily_junsep_indices', 'wb') as pickle_file:
-        pickle.dump(daily_junsep_indices, pickle_file)
-
-    with open(parent_directory + '\\processed_data\\daily_novapr_indices', 'wb') as pickle_file:
-        pickle.dump(daily_novapr_indices, pickle_file)
-    
-    with open(parent_directory + '\\processed_data\\three_hourly_junsep_indices', 'wb') as pickle_file:
-        pickle.dump(three_hourly_junsep_indices, pickle_file)
-
-    with open(parent_directory + '\\processed_data\\three_hourly_novapr_indices', 'wb') as pickle_file:
-        pickle.dump(three_hourly_novapr_indices, pickle_file)
-
-    with open(parent_directory + '\\processed_data\\hourly_junsep_indices', 'wb') as pickle_file:
-        pickle.dump(hourly_junsep_indices, pickle_file)
-
-    with open(parent_directory + '\\processed_data\\hourly_novapr_indices', 'wb') as pickle_file:
-        pickle.dump(hourly_novapr_indices, pickle_file)
+    #save the time indices, they generate the seasonal indices of every frequency on demand,
+    #no seasonal copies of the arrays are saved, the seasons are viewed with SeasonalView.from_time_index()
+    monthly_time_index = MerraTimeIndex.from_directory('\\raw_data\\2.1_dust_data\\monthly_aod\\', timing = 'monthly')
+    monthly_time_index.save('\\processed_data\\monthly_time_index.npz')
+    del monthly_time_index
+
+    time_index = MerraTimeIndex.from_directory('\\raw_data\\3.1_physical_model\\hourly_wind\\', timing = 'hourly')
+    time_index.save('\\processed_data\\time_index.npz')
     print('saved processed monthly and hourly seasonal indices to \\processed_data')
+
+    print('caching calendar day climatologies of the daily arrays to \\processed_data ...')
+    #the caches are read from the .h5 stores of the daily arrays and only recomputed once a daily array changes
+    for daily_file in ['dust_daily_data.h5', 'aod_daily_data.h5', 'precipitation_daily_data.h5', 'temperature_daily_data.h5']:
+        cached_climatology('\\processed_data\\' + daily_file, time_index)
+    del time_index
+    print('cached calendar day climatologies of the daily arrays to \\processed_data')
     
     print('saving processed monthly and hourly geographical and time arrays to \\processed_data ...')
     #save numpy arrays
@@ -378,5 +304,7 @@ def main():
 
 
 if __name__ == "__main__":
+    # wall time, CPU time, I/O and peak memory of every stage of the run
+    start_stage_log('\\processed_data\\run_log_processing_data.csv')
     main()
 
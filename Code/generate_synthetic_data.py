@@ -0,0 +1,86 @@
+import os
+import argparse
+
+os.environ["PROJ_LIB"] = "C:\\Users\\Daniel\\anaconda3\\Library\\share"; #fixr
+
+from functions import generate_synthetic_merra_data
+
+parent_directory = os.path.abspath(os.path.join(os.path.dirname(os.path.realpath(__file__)), os.pardir))
+
+# region of the hourly and three hourly data: 15°S to 30°N and 30°W to 35°E (91x105 MERRA2 grid points)
+west_africa_bounding_box = [-15, 30, -30, 35]
+
+import warnings
+warnings.filterwarnings("ignore")
+
+def main():
+
+    ######################################################################
+    # Generating Synthetic MERRA2 Data
+    ######################################################################
+
+    # writes synthetic MERRA2 netCDF4 files to the raw data folders read by Processing_data.py and processing_pm25components_data.py,
+    # so the whole pipeline can be run and benchmarked without the MERRA2 archive. The same --start_date and --end_date have to be
+    # passed to Processing_data.py and processing_pm25components_data.py, which check that their files cover the time range
+    parser = argparse.ArgumentParser(description='generate synthetic MERRA2 netCDF4 files')
+    parser.add_argument('--start_date', default='1980-01-01', help='date of the first file, also pass it to the processing scripts')
+    parser.add_argument('--end_date', default='1980-12-31', help='date of the last file, also pass it to the processing scripts')
+    parser.add_argument('--grid', default='west_africa', choices=['west_africa', 'global'],
+                        help='grid of the hourly and three hourly files, the monthly files are always global')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the random values')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='number of processes writing files in parallel')
+    args = parser.parse_args()
+
+    if args.grid == 'west_africa':
+        bounding_box = west_africa_bounding_box
+    else:
+        bounding_box = []
+
+    "--------------------------------------------------------------------"
+    '2.1_dust_data'
+    "--------------------------------------------------------------------"
+
+    print('generating monthly aerosol optical depth data ...')
+    generate_synthetic_merra_data('\\raw_data\\2.1_dust_data\\monthly_aod\\', variables = ['AODANA'], timing = 'monthly',
+                                  start_date = args.start_date, end_date = args.end_date, seed = args.seed, workers = args.workers)
+    print('generated monthly aerosol optical depth data')
+
+    "--------------------------------------------------------------------"
+    '3.1_physical_model'
+    "--------------------------------------------------------------------"
+
+    print('generating hourly wind and dustmass - pm 2.5 data ...')
+    generate_synthetic_merra_data('\\raw_data\\3.1_physical_model\\hourly_wind\\', variables = ['ULML', 'VLML'], timing = 'hourly',
+                                  start_date = args.start_date, end_date = args.end_date, bounding_box = bounding_box,
+                                  seed = args.seed, workers = args.workers)
+    generate_synthetic_merra_data('\\raw_data\\3.1_physical_model\\hourly_dusmass_pm2.5\\', variables = ['DUSMASS25'], timing = 'hourly',
+                                  start_date = args.start_date, end_date = args.end_date, collection = 'tavg1_2d_aer_Nx',
+                                  bounding_box = bounding_box, seed = args.seed, workers = args.workers)
+    print('generated hourly wind and dustmass - pm 2.5 data')
+
+    "--------------------------------------------------------------------"
+    '3.3_model_implementation'
+    "--------------------------------------------------------------------"
+
+    print('generating hourly precipitation, temperature and three hourly aerosol optical depth data ...')
+    generate_synthetic_merra_data('\\raw_data\\3.3_model_implementation\\hourly_precipitation\\', variables = ['PRECTOTCORR'], timing = 'hourly',
+                                  start_date = args.start_date, end_date = args.end_date, bounding_box = bounding_box,
+                                  seed = args.seed, workers = args.workers)
+    generate_synthetic_merra_data('\\raw_data\\3.3_model_implementation\\hourly_temperature\\', variables = ['TLML'], timing = 'hourly',
+                                  start_date = args.start_date, end_date = args.end_date, bounding_box = bounding_box,
+                                  seed = args.seed, workers = args.workers)
+    generate_synthetic_merra_data('\\raw_data\\3.3_model_implementation\\three_hourly_aod\\', variables = ['AODANA'], timing = 'three_hourly',
+                                  start_date = args.start_date, end_date = args.end_date, bounding_box = bounding_box,
+                                  seed = args.seed, workers = args.workers)
+    print('generated hourly precipitation, temperature and three hourly aerosol optical depth data')
+
+    print('generating hourly pm2.5 components data ...')
+    generate_synthetic_merra_data('\\raw_data\\test_data\\pm_data\\', variables = ['BCSMASS', 'OCSMASS', 'SSSMASS25', 'SO4SMASS'], timing = 'hourly',
+                                  start_date = args.start_date, end_date = args.end_date, collection = 'tavg1_2d_aer_Nx',
+                                  bounding_box = bounding_box, seed = args.seed, workers = args.workers)
+    print('generated hourly pm2.5 components data')
+
+
+
+if __name__ == "__main__":
+    main()
@@ -1,30 +1,42 @@
 import os
-import pickle
-import numpy as np
+import argparse
 import pandas as pd
 
 os.environ["PROJ_LIB"] = "C:\\Users\\Daniel\\anaconda3\\Library\\share"; #fixr
 
 
-from functions import process_merra_data, process_outcome_data, hourly_data_to_daily_mean, three_hourly_data_to_daily_mean, extract_seasonal_data
-from functions import three_hourly_data_to_daily_mean
+from functions import build_merra_composite
+from functions import instrumented, start_stage_log
 
 parent_directory = os.path.abspath(os.path.join(os.path.dirname(os.path.realpath(__file__)), os.pardir))
 
+# region of the hourly and three hourly data: 15°S to 30°N and 30°W to 35°E (91x105 MERRA2 grid points)
+west_africa_bounding_box = [-15, 30, -30, 35]
+
+# number of workers that decode the MERRA2 files in parallel
+num_workers = os.cpu_count()
+
+# continuous time range of the MERRA2 files by default
+merra_start_date = '1980-01-01'
+merra_end_date = '2016-12-31'
+
 import warnings
 warnings.filterwarnings("ignore")
 
+@instrumented('processing_pm25components_data')
 def main():
 
+    # the time range can be set to the range of the files written by generate_synthetic_data.py, as for Processing_data.py
+    parser = argparse.ArgumentParser(description='build the pm2.5 composite of the MERRA2 netCDF4 files')
+    parser.add_argument('--start_date', default=merra_start_date, help='date of the first MERRA2 file')
+    parser.add_argument('--end_date', default=merra_end_date, help='date of the last MERRA2 file')
+    args = parser.parse_args()
+    hourly_time_steps = 24*len(pd.date_range(args.start_date, args.end_date))
+
 
     ######################################################################
     # Processing MERRA2 Data
     ######################################################################
-    with open(parent_directory + '\\processed_data\\daily_novapr_indices', 'rb') as pickle_file:
-        daily_novapr_indices = pickle.load(pickle_file)
-
-    with open(parent_directory + '\\processed_data\\daily_junsep_indices', 'rb') as pickle_file:
-        daily_junsep_indices = pickle.load(pickle_file)
 
 
     "--------------------------------------------------------------------"
@@ -34,125 +46,31 @@ def main():
     print('processing hourly pm2.5 components raw data ...')
     #pm2.5
 
-    pm25_hourly_data = np.zeros((324360, 91, 105), dtype='float32')
-
-    bc_hourly_data = process_merra_data('\\raw_data\\test_data\\pm_data\\', 
-                                            seasonal_indices = False, variables = ['BCSMASS'], two_vars = False, 
-                                            timing = 'hourly', time_steps = 324360, y_steps = 91, x_steps = 105, 
-                                            datatype = 'float32')[3]
-    
-    pm25_hourly_data += bc_hourly_data
-
-    bc_daily_data = hourly_data_to_daily_mean(bc_hourly_data)
-
-    bc_daily_data_novapr, bc_daily_data_junsep = extract_seasonal_data(bc_daily_data, daily_novapr_indices, daily_junsep_indices)
-
-    with open(parent_directory + '\\processed_data\\bc_hourly_data.npy', 'wb') as numpy_array:
-        np.save(numpy_array, bc_hourly_data.data)
-    with open(parent_directory + '\\processed_data\\bc_daily_data.npy', 'wb') as numpy_array:
-        np.save(numpy_array, bc_daily_data.data)
-    with open(parent_directory + '\\processed_data\\bc_daily_data_novapr.npy', 'wb') as numpy_array:
-        np.save(numpy_array, bc_daily_data_novapr.data)
-    with open(parent_directory + '\\processed_data\\bc_daily_data_junsep.npy', 'wb') as numpy_array:
-        np.save(numpy_array, bc_daily_data_junsep.data)
-    del bc_hourly_data, bc_daily_data, bc_daily_data_novapr, bc_daily_data_junsep
-
-    oc_hourly_data = process_merra_data('\\raw_data\\test_data\\pm_data\\',
-                                            seasonal_indices = False, variables = ['OCSMASS'], two_vars = False, 
-                                            timing = 'hourly', time_steps = 324360, y_steps = 91, x_steps = 105, 
-                                            datatype = 'float32')[3]
-
-    pm25_hourly_data += (1.8*oc_hourly_data)
-
-    oc_daily_data = hourly_data_to_daily_mean(oc_hourly_data)
-
-    oc_daily_data_novapr, oc_daily_data_junsep = extract_seasonal_data(oc_daily_data, daily_novapr_indices, daily_junsep_indices)
-
-    with open(parent_directory + '\\processed_data\\oc_hourly_data.npy', 'wb') as numpy_array:
-        np.save(numpy_array, oc_hourly_data.data)
-    with open(parent_directory + '\\processed_data\\oc_daily_data.npy', 'wb') as numpy_array:
-        np.save(numpy_array, oc_daily_data.data)
-    with open(parent_directory + '\\processed_data\\oc_daily_data_novapr.npy', 'wb') as numpy_array:
-        np.save(numpy_array, oc_daily_data_novapr.data)
-    with open(parent_directory + '\\processed_data\\oc_daily_data_junsep.npy', 'wb') as numpy_array:
-        np.save(numpy_array, oc_daily_data_junsep.data)
-    del oc_hourly_data, oc_daily_data, oc_daily_data_novapr, oc_daily_data_junsep
-
-    dust_hourly_data = np.load(parent_directory + '\\processed_data\\dust_hourly_data.npy')
-
-    pm25_hourly_data += dust_hourly_data
-    del dust_hourly_data
-
-    ss_hourly_data = process_merra_data('\\raw_data\\test_data\\pm_data\\',
-                                            seasonal_indices = False, variables = ['SSSMASS25'], two_vars = False, 
-                                            timing = 'hourly', time_steps = 324360, y_steps = 91, x_steps = 105, 
-                                            datatype = 'float32')[3]
-
-    pm25_hourly_data += ss_hourly_data
-
-    ss_daily_data = hourly_data_to_daily_mean(ss_hourly_data)
-
-    ss_daily_data_novapr, ss_daily_data_junsep = extract_seasonal_data(ss_daily_data, daily_novapr_indices, daily_junsep_indices)
-
-    with open(parent_directory + '\\processed_data\\ss_hourly_data.npy', 'wb') as numpy_array:
-        np.save(numpy_array, ss_hourly_data.data)
-    with open(parent_directory + '\\processed_data\\ss_daily_data.npy', 'wb') as numpy_array:
-        np.save(numpy_array, ss_daily_data.data)
-    with open(parent_directory + '\\processed_data\\ss_daily_data_novapr.npy', 'wb') as numpy_array:
-        np.save(numpy_array, ss_daily_data_novapr.data)
-    with open(parent_directory + '\\processed_data\\ss_daily_data_junsep.npy', 'wb') as numpy_array:
-        np.save(numpy_array, ss_daily_data_junsep.data)
-    del ss_hourly_data, ss_daily_data, ss_daily_data_novapr, ss_daily_data_junsep                                  
-
-    so4_hourly_data = process_merra_data('\\raw_data\\test_data\\pm_data\\',
-                                            seasonal_indices = False, variables = ['SO4SMASS'], two_vars = False, 
-                                            timing = 'hourly', time_steps = 324360, y_steps = 91, x_steps = 105, 
-                                            datatype = 'float32')[3]
-
-    pm25_hourly_data += (1.375*so4_hourly_data)
-
-    so4_daily_data = hourly_data_to_daily_mean(so4_hourly_data)
-
-    so4_daily_data_novapr, so4_daily_data_junsep = extract_seasonal_data(so4_daily_data, daily_novapr_indices, daily_junsep_indices)
-
-    with open(parent_directory + '\\processed_data\\so4_hourly_data.npy', 'wb') as numpy_array:
-        np.save(numpy_array, so4_hourly_data.data)
-    with open(parent_directory + '\\processed_data\\so4_daily_data.npy', 'wb') as numpy_array:
-        np.save(numpy_array, so4_daily_data.data)
-    with open(parent_directory + '\\processed_data\\so4_daily_data_novapr.npy', 'wb') as numpy_array:
-        np.save(numpy_array, so4_daily_data_novapr.data)
-    with open(parent_directory + '\\processed_data\\so4_daily_data_junsep.npy', 'wb') as numpy_array:
-        np.save(numpy_array, so4_daily_data_junsep.data)
-    del so4_hourly_data, so4_daily_data, so4_daily_data_novapr, so4_daily_data_junsep  
-
-    pm25_daily_data = hourly_data_to_daily_mean(pm25_hourly_data)
-
-    pm25_daily_data_novapr, pm25_daily_data_junsep = extract_seasonal_data(pm25_daily_data, daily_novapr_indices, daily_junsep_indices)
-
+    # pm2.5 = bc + 1.8 oc + ss + 1.375 so4 + dust is evaluated file by file while the components and the dust are read,
+    # the hourly composite and the daily means of the composite and of every component are written in the same pass,
+    # the daily means to pixel-chunked HDF5 stores
+    pm25_components = ['bc', 'oc', 'ss', 'so4']
+    pm25_variables = ['BCSMASS', 'OCSMASS', 'SSSMASS25', 'SO4SMASS']
+    pm25_weights = {'BCSMASS': 1., 'OCSMASS': 1.8, 'SSSMASS25': 1., 'SO4SMASS': 1.375, 'DUSMASS25': 1.}
+
+    build_merra_composite({'\\raw_data\\test_data\\pm_data\\': pm25_variables,
+                           '\\raw_data\\3.1_physical_model\\hourly_dusmass_pm2.5\\': ['DUSMASS25']},
+                          weights = pm25_weights, timing = 'hourly', time_steps = hourly_time_steps, y_steps = 91, x_steps = 105,
+                          datatype = 'float32', workers = num_workers, bounding_box = west_africa_bounding_box,
+                          composite_file = '\\processed_data\\pm25_hourly_data.npy',
+                          composite_daily_file = '\\processed_data\\pm25_daily_data.h5',
+                          species_daily_files = {variable: '\\processed_data\\' + component + '_daily_data.h5'
+                                                 for component, variable in zip(pm25_components, pm25_variables)},
+                          chunk_layout = 'pixel')
+
+    #the hourly pm2.5 array and the daily arrays of pm2.5 and its components are written to \\processed_data during processing,
+    #regression.py opens the daily .h5 stores lazily
     print('processed hourly pm2.5 components raw data ...')
 
 
-    print('saving processed hourly pm2.5 components arrays to \\processed_data ...')
-    #pm2.5
-    with open(parent_directory + '\\processed_data\\pm25_hourly_data.npy', 'wb') as numpy_array:
-        np.save(numpy_array, pm25_hourly_data.data)
-    del pm25_hourly_data
-
-    with open(parent_directory + '\\processed_data\\pm25_daily_data.npy', 'wb') as numpy_array:
-        np.save(numpy_array, pm25_daily_data.data)
-    del pm25_daily_data
-
-    with open(parent_directory + '\\processed_data\\pm25_daily_data_novapr.npy', 'wb') as numpy_array:
-        np.save(numpy_array, pm25_daily_data_novapr.data)
-    del pm25_daily_data_novapr
-
-    with open(parent_directory + '\\processed_data\\pm25_daily_data_junsep.npy', 'wb') as numpy_array:
-        np.save(numpy_array, pm25_daily_data_junsep.data)
-    del pm25_daily_data_junsep
-    print('saved processed hourly pm2.5 components arrays to \\processed_data')
-
-
 
 if __name__ == "__main__":
+    # wall time, CPU time, I/O and peak memory of every stage of the run
+    start_stage_log('\\processed_data\\run_log_processing_pm25components_data.csv')
     main()
 
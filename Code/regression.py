@@ -1,5 +1,4 @@
 import os
-import pickle
 import numpy as np
 import pandas as pd
 
@@ -11,6 +10,8 @@ from functions import return_region_pixel_array, get_time_span_region_data, get_
 from functions import daily_dust_country_regression, get_mse_data
 from functions import create_population_array, create_population_weight_array
 from functions import create_dust_exposure_df, create_multiple_lag_array_from_df, growth_dataframe, country_centroids_one_dim
+from functions import open_processed_array, MerraTimeIndex, SeasonalView, WeightedArray
+from functions import instrumented, start_stage_log
 
 import warnings
 warnings.filterwarnings("ignore")
@@ -18,6 +19,7 @@ warnings.filterwarnings("ignore")
 
 parent_directory = os.path.abspath(os.path.join(os.path.dirname(os.path.realpath(__file__)), os.pardir))
 
+@instrumented('regression')
 def main():
 
     "--------------------------------------------------------------------"
@@ -31,24 +33,27 @@ def main():
 
 
     print('loading data ...')
-    with open(parent_directory + '\\processed_data\\daily_junsep_indices', 'rb') as pickle_file:
-        daily_junsep_indices = pickle.load(pickle_file)
-    with open(parent_directory + '\\processed_data\\daily_novapr_indices', 'rb') as pickle_file:
-        daily_novapr_indices = pickle.load(pickle_file)
-
-    aod_daily_data = np.load(parent_directory + '\\processed_data\\aod_daily_data.npy') 
-    dust_daily_data = np.load(parent_directory + '\\processed_data\\dust_daily_data.npy') 
-    dust_daily_data_novapr = np.load(parent_directory + '\\processed_data\\dust_daily_data_novapr.npy') 
-    dust_daily_data_junsep = np.load(parent_directory + '\\processed_data\\dust_daily_data_junsep.npy') 
-    precipitation_daily_data = np.load(parent_directory + '\\processed_data\\precipitation_daily_data.npy')
-    precipitation_daily_data_novapr = np.load(parent_directory + '\\processed_data\\precipitation_daily_data_novapr.npy')
-    precipitation_daily_data_junsep = np.load(parent_directory + '\\processed_data\\precipitation_daily_data_junsep.npy')
-    temperature_daily_data = np.load(parent_directory + '\\processed_data\\temperature_daily_data.npy')
-    temperature_daily_data_novapr = np.load(parent_directory + '\\processed_data\\temperature_daily_data_novapr.npy')
-    temperature_daily_data_junsep = np.load(parent_directory + '\\processed_data\\temperature_daily_data_junsep.npy')
+    time_index = MerraTimeIndex.load('\\processed_data\\time_index.npz')
+    daily_junsep_indices = time_index.indices('junsep')
+    daily_novapr_indices = time_index.indices('novapr')
+
+    #the daily arrays are opened as HDF5 datasets of their pixel-chunked stores, only the chunks that are indexed are read from disk,
+    #so the time series of a pixel only decompresses the chunk of its tile
+    aod_daily_data = open_processed_array('\\processed_data\\aod_daily_data.h5')
+    dust_daily_data = open_processed_array('\\processed_data\\dust_daily_data.h5')
+    precipitation_daily_data = open_processed_array('\\processed_data\\precipitation_daily_data.h5')
+    temperature_daily_data = open_processed_array('\\processed_data\\temperature_daily_data.h5')
+
+    #the seasonal arrays are lazy views of the daily arrays, no seasonal copies are loaded
+    dust_daily_data_novapr = SeasonalView.from_time_index(dust_daily_data, time_index, 'novapr')
+    dust_daily_data_junsep = SeasonalView.from_time_index(dust_daily_data, time_index, 'junsep')
+    precipitation_daily_data_novapr = SeasonalView.from_time_index(precipitation_daily_data, time_index, 'novapr')
+    precipitation_daily_data_junsep = SeasonalView.from_time_index(precipitation_daily_data, time_index, 'junsep')
+    temperature_daily_data_novapr = SeasonalView.from_time_index(temperature_daily_data, time_index, 'novapr')
+    temperature_daily_data_junsep = SeasonalView.from_time_index(temperature_daily_data, time_index, 'junsep')
 
     #pm2.5 daily data:
-    pm25_daily_data = np.load(parent_directory + '\\processed_data\\pm25_daily_data.npy')
+    pm25_daily_data = open_processed_array('\\processed_data\\pm25_daily_data.h5')
 
 
     benin_population_df = pd.read_csv(parent_directory + '\\raw_data\\3.3_model_implementation\\population_estimates\\gpw_v4_admin_unit_center_points_population_estimates_rev11_ben.csv')
@@ -84,8 +89,8 @@ def main():
     bodele_region_pixels = return_region_pixel_array(region_name='bodele')
     togo_coast_pixel = return_region_pixel_array(region_name='togo_coast')
     daily_bodele_dust_data = get_regional_mean_data(get_time_span_region_data(dust_daily_data, bodele_region_pixels))
-    daily_bodele_dust_data_junsep = get_regional_mean_data(get_time_span_region_data(dust_daily_data_junsep, bodele_region_pixels))
-    daily_bodele_dust_data_novapr = get_regional_mean_data(get_time_span_region_data(dust_daily_data_novapr, bodele_region_pixels))
+    daily_bodele_dust_data_junsep = daily_bodele_dust_data[time_index.mask('junsep')]
+    daily_bodele_dust_data_novapr = daily_bodele_dust_data[time_index.mask('novapr')]
 
     daily_togo_coast_dust_data = get_time_span_region_data(dust_daily_data, togo_coast_pixel)
     daily_togo_precipitation_data = get_time_span_region_data(precipitation_daily_data, togo_coast_pixel)
@@ -125,7 +130,7 @@ def main():
     # mse_array_dry = np.load(parent_directory + '\\processed_data\\mse_array_dry.npy')
     # mse_array_wet = np.load(parent_directory + '\\processed_data\\mse_array_wet.npy')
 
-    simulated_dustmass_daily_data = np.load(parent_directory + '\\processed_data\\simulated_dustmass_daily_data.npy')
+    simulated_dustmass_daily_data = open_processed_array('\\processed_data\\simulated_dustmass_daily_data.h5')
     
     
     mse_array = get_mse_data(dust_daily_data, predicted_daily_dust_data)
@@ -171,27 +176,28 @@ def main():
 
     print('creating first stage country level regression data ...')
 
-    # weighing variable arrays with popoulation data, including unpopulated areas (set to zero)
+    # weighing variable arrays with popoulation data, including unpopulated areas (set to zero).
+    # the weighted arrays are lazy, the products are only computed for the pixels of a country once its exposure is computed
 
     
-    aod_daily_data_weighted = aod_daily_data * population_weigth_array
-    dust_daily_data_weighted = dust_daily_data * population_weigth_array
-    precipitation_daily_data_weighted = precipitation_daily_data * population_weigth_array
-    temperature_daily_data_weighted = temperature_daily_data * population_weigth_array
+    aod_daily_data_weighted = WeightedArray(aod_daily_data, population_weigth_array)
+    dust_daily_data_weighted = WeightedArray(dust_daily_data, population_weigth_array)
+    precipitation_daily_data_weighted = WeightedArray(precipitation_daily_data, population_weigth_array)
+    temperature_daily_data_weighted = WeightedArray(temperature_daily_data, population_weigth_array)
 
     #pm25 data:
-    pm25_daily_data_weighted = pm25_daily_data * population_weigth_array
+    pm25_daily_data_weighted = WeightedArray(pm25_daily_data, population_weigth_array)
 
     # weighing variable arrays with popoulation data, but only for populated areas (see explanation above)
-    aod_daily_data_country_weighted = aod_daily_data * country_population_weigth_array
-    dust_daily_data_country_weighted = dust_daily_data * country_population_weigth_array
-    predicted_daily_dust_data_country_weighted = predicted_daily_dust_data * country_population_weigth_array
-    precipitation_daily_data_country_weighted = precipitation_daily_data * country_population_weigth_array
-    temperature_daily_data_country_weighted = temperature_daily_data * country_population_weigth_array
-    simulated_dustmass_daily_data_country_weighted = simulated_dustmass_daily_data * country_population_weigth_array
+    aod_daily_data_country_weighted = WeightedArray(aod_daily_data, country_population_weigth_array)
+    dust_daily_data_country_weighted = WeightedArray(dust_daily_data, country_population_weigth_array)
+    predicted_daily_dust_data_country_weighted = WeightedArray(predicted_daily_dust_data, country_population_weigth_array)
+    precipitation_daily_data_country_weighted = WeightedArray(precipitation_daily_data, country_population_weigth_array)
+    temperature_daily_data_country_weighted = WeightedArray(temperature_daily_data, country_population_weigth_array)
+    simulated_dustmass_daily_data_country_weighted = WeightedArray(simulated_dustmass_daily_data, country_population_weigth_array)
 
     #pm25 data:
-    pm25_daily_data_country_weighted = pm25_daily_data * country_population_weigth_array
+    pm25_daily_data_country_weighted = WeightedArray(pm25_daily_data, country_population_weigth_array)
 
 
     # country weighted data:
@@ -202,68 +208,68 @@ def main():
                                                                         ['benin', 'burkina_faso', 'gambia', 'ghana', 'guinea',
                                                                          'liberia','mali', 'niger', 'nigeria', 'senegal',
                                                                          'sierra_leone', 'togo'],
-                                                                         37, daily_novapr_indices)[1]
+                                                                         37, daily_novapr_indices, time_index)[1]
 
     aod_country_weighted_dry_season_df = create_dust_exposure_df_country_weighted(aod_daily_data, aod_daily_data_country_weighted,
                                                                         ['benin', 'burkina_faso', 'gambia', 'ghana', 'guinea',
                                                                          'liberia','mali', 'niger', 'nigeria', 'senegal',
                                                                          'sierra_leone', 'togo'],
-                                                                         37, daily_novapr_indices)[3]
+                                                                         37, daily_novapr_indices, time_index)[3]
 
     dust_country_weighted_yearly_df =  create_dust_exposure_df_country_weighted(dust_daily_data, dust_daily_data_country_weighted,
                                                                     ['benin', 'burkina_faso', 'gambia', 'ghana', 'guinea',
                                                                          'liberia','mali', 'niger', 'nigeria', 'senegal',
                                                                          'sierra_leone', 'togo'],
-                                                                        37, daily_novapr_indices)[1] 
+                                                                        37, daily_novapr_indices, time_index)[1] 
 
     dust_country_weighted_dry_season_df =  create_dust_exposure_df_country_weighted(dust_daily_data, dust_daily_data_country_weighted,
                                                                     ['benin', 'burkina_faso', 'gambia', 'ghana', 'guinea',
                                                                          'liberia','mali', 'niger', 'nigeria', 'senegal',
                                                                          'sierra_leone', 'togo'],
-                                                                        37, daily_novapr_indices)[3]                                                                   
+                                                                        37, daily_novapr_indices, time_index)[3]                                                                   
 
     dust_predicted_country_weighted_dry_season_df =  create_dust_exposure_df_country_weighted(predicted_daily_dust_data, predicted_daily_dust_data_country_weighted,
                                                                         ['benin', 'burkina_faso', 'gambia', 'ghana', 'guinea',
                                                                          'liberia','mali', 'niger', 'nigeria', 'senegal',
                                                                          'sierra_leone', 'togo'],
-                                                                          37, daily_novapr_indices)[3]
+                                                                          37, daily_novapr_indices, time_index)[3]
 
     dust_simulated_country_weighted_dry_season_df =  create_dust_exposure_df_country_weighted(simulated_dustmass_daily_data, simulated_dustmass_daily_data_country_weighted,
                                                                         ['benin', 'burkina_faso', 'gambia', 'ghana', 'guinea',
                                                                          'liberia','mali', 'niger', 'nigeria', 'senegal',
                                                                          'sierra_leone', 'togo'],
-                                                                          37, daily_novapr_indices)[3]
+                                                                          37, daily_novapr_indices, time_index)[3]
 
     precipitation_country_weighted_yearly_df = create_dust_exposure_df_country_weighted(precipitation_daily_data, precipitation_daily_data_country_weighted,
                                                                    ['benin', 'burkina_faso', 'gambia', 'ghana', 'guinea',
                                                                          'liberia','mali', 'niger', 'nigeria', 'senegal',
                                                                          'sierra_leone', 'togo'],
-                                                                    37, daily_novapr_indices)[1]
+                                                                    37, daily_novapr_indices, time_index)[1]
 
     temperature_country_weighted_yearly_df = create_dust_exposure_df_country_weighted(temperature_daily_data, temperature_daily_data_country_weighted,
                                                                     ['benin', 'burkina_faso', 'gambia', 'ghana', 'guinea',
                                                                          'liberia','mali', 'niger', 'nigeria', 'senegal',
                                                                          'sierra_leone', 'togo'],
-                                                                     37, daily_novapr_indices)[1]
+                                                                     37, daily_novapr_indices, time_index)[1]
     
     precipitation_country_weighted_dry_season_df = create_dust_exposure_df_country_weighted(precipitation_daily_data, precipitation_daily_data_country_weighted,
                                                                    ['benin', 'burkina_faso', 'gambia', 'ghana', 'guinea',
                                                                          'liberia','mali', 'niger', 'nigeria', 'senegal',
                                                                          'sierra_leone', 'togo'],
-                                                                    37, daily_novapr_indices)[3]
+                                                                    37, daily_novapr_indices, time_index)[3]
 
     temperature_country_weighted_dry_season_df = create_dust_exposure_df_country_weighted(temperature_daily_data, temperature_daily_data_country_weighted,
                                                                     ['benin', 'burkina_faso', 'gambia', 'ghana', 'guinea',
                                                                          'liberia','mali', 'niger', 'nigeria', 'senegal',
                                                                          'sierra_leone', 'togo'],
-                                                                     37, daily_novapr_indices)[3]
+                                                                     37, daily_novapr_indices, time_index)[3]
 
     #pm25:
     pm25_country_weighted_dry_season_df = create_dust_exposure_df_country_weighted(pm25_daily_data, pm25_daily_data_country_weighted,
                                                                         ['benin', 'burkina_faso', 'gambia', 'ghana', 'guinea',
                                                                          'liberia','mali', 'niger', 'nigeria', 'senegal',
                                                                          'sierra_leone', 'togo'],
-                                                                         37, daily_novapr_indices)[3]
+                                                                         37, daily_novapr_indices, time_index)[3]
 
     # unweighted data
 
@@ -271,68 +277,68 @@ def main():
                                             ['benin', 'burkina_faso', 'gambia', 'ghana', 'guinea',
                                                 'liberia','mali', 'niger', 'nigeria', 'senegal',
                                                 'sierra_leone', 'togo'],
-                                                37, daily_novapr_indices)[0]
+                                                37, daily_novapr_indices, time_index)[0]
 
     aod_dry_season_df = create_dust_exposure_df(aod_daily_data, aod_daily_data_weighted,
                                                                         ['benin', 'burkina_faso', 'gambia', 'ghana', 'guinea',
                                                                          'liberia','mali', 'niger', 'nigeria', 'senegal',
                                                                          'sierra_leone', 'togo'],
-                                                                         37, daily_novapr_indices)[2]
+                                                                         37, daily_novapr_indices, time_index)[2]
 
     dust_yearly_df =  create_dust_exposure_df(dust_daily_data, dust_daily_data_weighted,
                                             ['benin', 'burkina_faso', 'gambia', 'ghana', 'guinea',
                                             'liberia','mali', 'niger', 'nigeria', 'senegal',
                                             'sierra_leone', 'togo'],
-                                            37, daily_novapr_indices)[0]   
+                                            37, daily_novapr_indices, time_index)[0]   
 
     dust_dry_season_df =  create_dust_exposure_df(dust_daily_data, dust_daily_data_weighted,
                                                                     ['benin', 'burkina_faso', 'gambia', 'ghana', 'guinea',
                                                                          'liberia','mali', 'niger', 'nigeria', 'senegal',
                                                                          'sierra_leone', 'togo'],
-                                                                        37, daily_novapr_indices)[2]                                                                   
+                                                                        37, daily_novapr_indices, time_index)[2]                                                                   
 
     precipitation_yearly_df = create_dust_exposure_df(precipitation_daily_data, precipitation_daily_data_weighted,
                                                                    ['benin', 'burkina_faso', 'gambia', 'ghana', 'guinea',
                                                                          'liberia','mali', 'niger', 'nigeria', 'senegal',
                                                                          'sierra_leone', 'togo'],
-                                                                    37, daily_novapr_indices)[0]
+                                                                    37, daily_novapr_indices, time_index)[0]
 
     temperature_yearly_df = create_dust_exposure_df(temperature_daily_data, temperature_daily_data_weighted,
                                                                     ['benin', 'burkina_faso', 'gambia', 'ghana', 'guinea',
                                                                          'liberia','mali', 'niger', 'nigeria', 'senegal',
                                                                          'sierra_leone', 'togo'],
-                                                                     37, daily_novapr_indices)[0]
+                                                                     37, daily_novapr_indices, time_index)[0]
     
     precipitation_dry_season_df = create_dust_exposure_df(precipitation_daily_data, precipitation_daily_data_weighted,
                                                                    ['benin', 'burkina_faso', 'gambia', 'ghana', 'guinea',
                                                                          'liberia','mali', 'niger', 'nigeria', 'senegal',
                                                                          'sierra_leone', 'togo'],
-                                                                    37, daily_novapr_indices)[2]
+                                                                    37, daily_novapr_indices, time_index)[2]
 
     temperature_dry_season_df = create_dust_exposure_df(temperature_daily_data, temperature_daily_data_weighted,
                                                                     ['benin', 'burkina_faso', 'gambia', 'ghana', 'guinea',
                                                                          'liberia','mali', 'niger', 'nigeria', 'senegal',
                                                                          'sierra_leone', 'togo'],
-                                                                     37, daily_novapr_indices)[2]
+                                                                     37, daily_novapr_indices, time_index)[2]
 
     #pm25:
     pm25_dry_season_df = create_dust_exposure_df(pm25_daily_data, pm25_daily_data_country_weighted,
                                                                         ['benin', 'burkina_faso', 'gambia', 'ghana', 'guinea',
                                                                          'liberia','mali', 'niger', 'nigeria', 'senegal',
                                                                          'sierra_leone', 'togo'],
-                                                                         37, daily_novapr_indices)[2]
+                                                                         37, daily_novapr_indices, time_index)[2]
 
     pm25_yearly_df = create_dust_exposure_df(pm25_daily_data, pm25_daily_data_country_weighted,
                                                                         ['benin', 'burkina_faso', 'gambia', 'ghana', 'guinea',
                                                                          'liberia','mali', 'niger', 'nigeria', 'senegal',
                                                                          'sierra_leone', 'togo'],
-                                                                         37, daily_novapr_indices)[0]
+                                                                         37, daily_novapr_indices, time_index)[0]
 
 
     # reduced form regression aod
     bodele_dry_season_aod_df = create_dust_exposure_df(aod_daily_data, aod_daily_data_weighted,
                                                                 ['bodele'],
-                                                                    37, daily_novapr_indices)[2]
+                                                                    37, daily_novapr_indices, time_index)[2]
 
     bodele_dry_season_aod_df = bodele_dry_season_aod_df.transpose()
     # bodele_dry_season_df.insert(loc=0, column='year', value=np.array(list(range(1980,2017))))
@@ -341,7 +347,7 @@ def main():
 
     bodele_wet_season_aod_df = create_dust_exposure_df(aod_daily_data, aod_daily_data_weighted,
                                                                     ['bodele'],
-                                                                        37, daily_junsep_indices)[2]
+                                                                        37, daily_junsep_indices, time_index)[2]
 
     bodele_wet_season_aod_df = bodele_wet_season_aod_df.transpose()
     # bodele_wet_season_df.insert(loc=0, column='year', value=np.array(list(range(1980,2017))))
@@ -350,7 +356,7 @@ def main():
 
     bodele_yr_aod_df = create_dust_exposure_df(aod_daily_data, aod_daily_data_weighted,
                                                                     ['bodele'],
-                                                                        37, daily_junsep_indices)[0]
+                                                                        37, daily_junsep_indices, time_index)[0]
 
     bodele_yr_aod_df = bodele_yr_aod_df.transpose()
     # bodele_wet_season_df.insert(loc=0, column='year', value=np.array(list(range(1980,2017))))
@@ -362,7 +368,7 @@ def main():
     # reduced form regression pm
     bodele_dry_season_pm25_df = create_dust_exposure_df(pm25_daily_data, pm25_daily_data_weighted,
                                                                 ['bodele'],
-                                                                    37, daily_novapr_indices)[2]
+                                                                    37, daily_novapr_indices, time_index)[2]
 
     bodele_dry_season_pm25_df = bodele_dry_season_pm25_df.transpose()
     # bodele_dry_season_df.insert(loc=0, column='year', value=np.array(list(range(1980,2017))))
@@ -371,7 +377,7 @@ def main():
 
     bodele_wet_season_pm25_df = create_dust_exposure_df(pm25_daily_data, pm25_daily_data_weighted,
                                                                     ['bodele'],
-                                                                        37, daily_junsep_indices)[2]
+                                                                        37, daily_junsep_indices, time_index)[2]
 
     bodele_wet_season_pm25_df = bodele_wet_season_pm25_df.transpose()
     # bodele_wet_season_df.insert(loc=0, column='year', value=np.array(list(range(1980,2017))))
@@ -380,13 +386,16 @@ def main():
 
     bodele_yr_pm25_df = create_dust_exposure_df(pm25_daily_data, pm25_daily_data,
                                                                     ['bodele'],
-                                                                        37, daily_junsep_indices)[0]
+                                                                        37, daily_junsep_indices, time_index)[0]
 
     bodele_yr_pm25_df = bodele_yr_pm25_df.transpose()
     # bodele_wet_season_df.insert(loc=0, column='year', value=np.array(list(range(1980,2017))))
     bodele_yr_pm25_df.index.name = 'year'
     bodele_yr_pm25_df.rename(columns={'bodele': 'bodele_pm25_yearly'})
 
+    #the daily stores are not read past this point
+    for daily_data in [aod_daily_data, dust_daily_data, precipitation_daily_data, temperature_daily_data, pm25_daily_data, simulated_dustmass_daily_data]:
+        daily_data.file.close()
 
 
     #country weighted:
@@ -589,5 +598,7 @@ def main():
 
 
 if __name__ == "__main__":
+    # wall time, CPU time, I/O and peak memory of every stage of the run
+    start_stage_log('\\processed_data\\run_log_regression.csv')
     main()
 
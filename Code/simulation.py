@@ -1,15 +1,16 @@
 import os
-import pickle
 import numpy as np
 import pandas as pd
 
 os.environ["PROJ_LIB"] = "C:\\Users\\Daniel\\anaconda3\\Library\\share"; #fixr
 
 
-from functions import extract_seasonal_data, hourly_data_to_daily_mean, build_source_array
-from functions import advection_diffusion_fd
+from functions import build_source_array, MerraTimeIndex
+from functions import advection_diffusion_fd, GridMetrics
+from functions import HourlyOutputSink, DailyMeanSink, SeasonalMeanSink
 
 from functions import simulation_comparison_animation
+from functions import instrumented, instrumented_stage, start_stage_log
 
 import warnings
 warnings.filterwarnings("ignore")
@@ -17,6 +18,7 @@ warnings.filterwarnings("ignore")
 
 parent_directory = os.path.abspath(os.path.join(os.path.dirname(os.path.realpath(__file__)), os.pardir))
 
+@instrumented('simulation')
 def main():
 
     "--------------------------------------------------------------------"
@@ -29,21 +31,18 @@ def main():
 
 
     print('loading data ...')
-    with open(parent_directory + '\\processed_data\\hourly_junsep_indices', 'rb') as pickle_file:
-        hourly_junsep_indices = pickle.load(pickle_file)
-    with open(parent_directory + '\\processed_data\\hourly_novapr_indices', 'rb') as pickle_file:
-        hourly_novapr_indices = pickle.load(pickle_file)
 
-    dust_hourly_data = np.load(parent_directory + '\\processed_data\\dust_hourly_data.npy') 
-    wind_eastward_hourly_data = np.load(parent_directory + '\\processed_data\\wind_eastward_hourly_data.npy')
-    wind_northward_hourly_data = np.load(parent_directory + '\\processed_data\\wind_northward_hourly_data.npy')
+    # the dust is only read at the source pixels and the winds block by block, so the hourly arrays stay on disk as numpy memmaps
+    dust_hourly_data = np.load(parent_directory + '\\processed_data\\dust_hourly_data.npy', mmap_mode = 'r')
+    wind_eastward_hourly_data = np.load(parent_directory + '\\processed_data\\wind_eastward_hourly_data.npy', mmap_mode = 'r')
+    wind_northward_hourly_data = np.load(parent_directory + '\\processed_data\\wind_northward_hourly_data.npy', mmap_mode = 'r')
 
     west_africa_longitudes = np.load(parent_directory + '\\processed_data\\west_africa_longitudes.npy')
     west_africa_latitudes = np.load(parent_directory + '\\processed_data\\west_africa_latitudes.npy')   
     print('data loaded successfully')
 
     print('extract t0 array ...')
-    dust_t0_array = build_source_array(dust_hourly_data, 91, 105)
+    dust_t0_array = build_source_array(dust_hourly_data[:1], 91, 105)
     dust_t0_array = dust_t0_array[0]
     print('t0 array extracted successfully')
 
@@ -58,10 +57,25 @@ def main():
     min_time = 0
     max_time = dust_hourly_data.shape[0]
     time_step = (max_time - min_time)
-    simulated_dustmass_hourly_data =  advection_diffusion_fd(time_step, 105, 91, min_time, max_time, west_africa_latitudes, west_africa_longitudes,
-                                                             .4, dust_hourly_data, wind_eastward_hourly_data, wind_northward_hourly_data)
-    simulated_dustmass_hourly_novapr_data, simulated_dustmass_hourly_junsep_data = extract_seasonal_data(simulated_dustmass_hourly_data, hourly_novapr_indices, hourly_junsep_indices)
-    simulated_dustmass_daily_data = hourly_data_to_daily_mean(simulated_dustmass_hourly_data)
+    # the metric factors (pixel distances and wind multipliers) of the west africa grid are computed once for the whole simulation
+    grid_metrics = GridMetrics(west_africa_latitudes, west_africa_longitudes)
+    # the dust field is streamed to the sinks in blocks of 30 days while the simulation runs: the hourly array and the daily means are written to disk
+    # and the seasonal means are summed up, so the hourly dust field is never held in memory
+    # a checkpoint is saved after every 12 blocks (360 simulated days), a run that was killed continues from its last checkpoint and appends to its output files.
+    # the hourly output is a .npy memmap, which stays readable if the run is killed while writing it (unlike a compressed HDF5 store).
+    # the daily means are written to the .npy staging file of the pixel-chunked daily store, which is filled when the simulation is complete
+    checkpoint_file = '\\processed_data\\simulation_checkpoint.npz'
+    resume = os.path.exists(parent_directory + checkpoint_file)
+    time_index = MerraTimeIndex.load('\\processed_data\\time_index.npz')
+    hourly_sink = HourlyOutputSink((time_step, 91, 105), output_file = '\\processed_data\\simulated_dustmass_hourly_data.npy', append = resume)
+    daily_sink = DailyMeanSink(time_step, (91, 105), output_file = '\\processed_data\\simulated_dustmass_daily_data.h5', append = resume, chunk_layout = 'pixel')
+    seasonal_sink = SeasonalMeanSink(time_index, seasons = ['junsep', 'novapr'])
+    # the parallel engine computes the same dust field as the pixel by pixel loop, with the rows of every half step updated on all cores
+    with instrumented_stage('advection_diffusion_fd'):
+        advection_diffusion_fd(time_step, 105, 91, min_time, max_time, west_africa_latitudes, west_africa_longitudes,
+                               .4, dust_hourly_data, wind_eastward_hourly_data, wind_northward_hourly_data,
+                               engine = 'parallel', grid_metrics = grid_metrics, sinks = [hourly_sink, daily_sink, seasonal_sink], block = 720,
+                               checkpoint_file = checkpoint_file, checkpoint_every = 8640, resume_from = checkpoint_file if resume else '')
     print('dust advection diffusion simulation terminated successfully')
 
 
@@ -69,29 +83,17 @@ def main():
     # Saving Advection Diffusion Simulation Data
     ######################################################################
 
-    print('saving simulated dust advection diffusion array to \\processed_data ...')
-    with open(parent_directory + '\\processed_data\\simulated_dustmass_hourly_data.npy', 'wb') as numpy_array:
-        np.save(numpy_array, simulated_dustmass_hourly_data)
-    del simulated_dustmass_hourly_data
-    print('saved simulated dust advection diffusion array to \\processed_data')
-
-    print('saving simulated dust advection diffusion nov-apr array to \\processed_data ...')
-    with open(parent_directory + '\\processed_data\\simulated_dustmass_hourly_novapr_data.npy', 'wb') as numpy_array:
-        np.save(numpy_array, simulated_dustmass_hourly_novapr_data)
-    del simulated_dustmass_hourly_novapr_data
-    print('saved simulated dust advection diffusion nov-apr array to \\processed_data')
-
-    print('saving simulated dust advection diffusion jun-sep array to \\processed_data ...')
-    with open(parent_directory + '\\processed_data\\simulated_dustmass_hourly_junsep_data.npy', 'wb') as numpy_array:
-        np.save(numpy_array, simulated_dustmass_hourly_junsep_data)
-    del simulated_dustmass_hourly_junsep_data
-    print('saved simulated dust advection diffusion jun-sep array to \\processed_data')
-
-    print('saving simulated dust advection diffusion total array to \\processed_data ...')
-    with open(parent_directory + '\\processed_data\\simulated_dustmass_daily_data.npy', 'wb') as numpy_array:
-        np.save(numpy_array, simulated_dustmass_daily_data)
-    del simulated_dustmass_daily_data
-    print('saved simulated dust advection diffusion jun-sep array to \\processed_data')
+    #the hourly .npy file and the daily .h5 store, which regression.py opens lazily, are written during the simulation
+    del hourly_sink, daily_sink
+
+    print('saving simulation seasonal mean arrays to \\processed_data ...')
+    with open(parent_directory + '\\processed_data\\simulated_dustmass_junsep_mean.npy', 'wb') as numpy_array:
+        np.save(numpy_array, seasonal_sink.means['junsep'])
+
+    with open(parent_directory + '\\processed_data\\simulated_dustmass_novapr_mean.npy', 'wb') as numpy_array:
+        np.save(numpy_array, seasonal_sink.means['novapr'])
+    del seasonal_sink
+    print('saved simulation seasonal mean arrays to \\processed_data')
 
     print('saving simulated dust advection diffusion comparison video ...')
     # simulation_comparison_animation(simulated_dustmass_hourly_data, dust_hourly_data, west_africa_latitudes, west_africa_longitudes, extent=[-30,29,-15,29],
@@ -110,28 +112,11 @@ def main():
     #     np.save(numpy_array, simulated_dustmass_total_mean)
     # print('saved simulation total mean array to \\processed_data')
 
-    # print('calculating dust advection diffusion simulation seasonal mean...')
-    # simulated_dustmass_junsep_mean = np.zeros((91, 105), dtype='float32')
-    # for i in hourly_junsep_indices:
-    #     simulated_dustmass_junsep_mean += simulated_dustmass[i]
-    # simulated_dustmass_junsep_mean /= len(hourly_junsep_indices)
-
-    # simulated_dustmass_novapr_mean = np.zeros((91, 105), dtype='float32')
-    # for i in hourly_novapr_indices:
-    #     simulated_dustmass_novapr_mean += simulated_dustmass[i]
-    # simulated_dustmass_novapr_mean /= len(hourly_novapr_indices)
-    # print('calculation terminated succesfully')
-
-    # print('saving simulation seasonal mean arrays to \\processed_data ...')
-    # with open(parent_directory + '\\processed_data\\simulated_dustmass_junsep_mean.npy', 'wb') as numpy_array:
-    #     np.save(numpy_array, simulated_dustmass_junsep_mean)
-
-    # with open(parent_directory + '\\processed_data\\simulated_dustmass_novapr_mean.npy', 'wb') as numpy_array:
-    #     np.save(numpy_array, simulated_dustmass_novapr_mean)
-    # print('saved simulation seasonal mean arrays to \\processed_data')
     
 
 
 if __name__ == "__main__":
+    # wall time, CPU time, I/O and peak memory of every stage of the run
+    start_stage_log('\\processed_data\\run_log_simulation.csv')
     main()
 